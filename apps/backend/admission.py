@@ -0,0 +1,281 @@
+"""
+Admission control for LLM-backed routes: per-user rate limits and a bounded concurrency pool.
+
+Each limited route belongs to a named limit group. A group has:
+
+  - a token bucket per user (`per_minute` sustained, `burst` at once), so one client
+    can't hammer an endpoint;
+  - a fleet-wide cap on requests in progress (`max_concurrent`). Requests over the cap
+    wait in a bounded queue (`max_queue` waiters, up to `queue_timeout` seconds each);
+    when the queue is full or the wait runs out, the request is turned away.
+
+Rejected requests get 429 Too Many Requests with a Retry-After header, before any
+model work starts. Streaming responses keep their concurrency slot until the stream
+is closed.
+
+Both entry points apply the same limiters: Flask views through `limited(group)`, the
+ASGI routes (asgi.py) through `limited_async(group)`, both built on `admit()`.
+
+Limits default to DEFAULT_LIMITS and can be overridden per group with ADMISSION_LIMITS,
+a JSON object such as {"chat": {"per_minute": 10, "max_concurrent": 4}}. Setting
+ADMISSION_CONTROL=false turns the checks off.
+
+Public API:
+  - TokenBucket(per_minute, burst)     — .try_take() → seconds until a token is available (0 = taken)
+  - AdmissionLimiter(name, ...)        — .admit(user_key) → (release | None, retry_after), .stats()
+  - admit(group, user_key)             — (release | None, retry_after) under a group's limits
+  - REJECTED_MESSAGE, retry_after_header(retry_after) — the 429 body and Retry-After value
+  - limited(group)                     — Flask view decorator applying a group's limits
+  - limited_async(group)               — same, for Starlette route handlers
+  - get_admission_stats()              — per-group counters
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, make_response, request
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+
+DEFAULT_LIMITS = {
+    "chat":                {"per_minute": 20, "burst": 5,  "max_concurrent": 8, "max_queue": 16, "queue_timeout": 15},
+    "explain":             {"per_minute": 30, "burst": 10, "max_concurrent": 8, "max_queue": 16, "queue_timeout": 15},
+    "comprehension":       {"per_minute": 6,  "burst": 2,  "max_concurrent": 2, "max_queue": 4,  "queue_timeout": 30},
+    "comprehension_check": {"per_minute": 30, "burst": 10, "max_concurrent": 8, "max_queue": 16, "queue_timeout": 15},
+    "daily_review":        {"per_minute": 6,  "burst": 3,  "max_concurrent": 4, "max_queue": 8,  "queue_timeout": 30},
+}
+
+
+class TokenBucket:
+    """Refills `per_minute` tokens per minute up to `burst`; each admitted request takes one."""
+
+    def __init__(self, per_minute: float, burst: int):
+        self._rate = per_minute / 60.0
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+
+    def try_take(self) -> float:
+        """Take a token and return 0, or return the seconds until one is available."""
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self._rate if self._rate > 0 else 60.0
+
+
+class AdmissionLimiter:
+    """Per-user token buckets plus a global concurrency cap with a bounded wait queue."""
+
+    def __init__(self, name: str, per_minute: float = 20, burst: int = 5, max_concurrent: int = 8,
+                 max_queue: int = 16, queue_timeout: float = 15.0, max_users: int = 10000):
+        self.name = name
+        self._per_minute = per_minute
+        self._burst = burst
+        self._max_concurrent = max_concurrent  # 0 = no cap
+        self._max_queue = max_queue
+        self._queue_timeout = queue_timeout
+        self._max_users = max_users
+        self._cond = threading.Condition()
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self._in_flight = 0
+        self._queued = 0
+        self._admitted = 0
+        self._rate_limited = 0
+        self._overloaded = 0
+
+    def _bucket(self, user_key: str) -> TokenBucket:
+        bucket = self._buckets.get(user_key)
+        if bucket is None:
+            bucket = self._buckets[user_key] = TokenBucket(self._per_minute, self._burst)
+            if len(self._buckets) > self._max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_key)
+        return bucket
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def admit(self, user_key: str):
+        """
+        Admit one request from `user_key`.
+
+        Returns:
+            tuple: (release, 0) when admitted — call release() when the request is done —
+                or (None, retry_after_seconds) when it is rejected.
+        """
+        with self._cond:
+            wait = self._bucket(user_key).try_take()
+            if wait:
+                self._rate_limited += 1
+                return None, wait
+
+            if self._max_concurrent and self._in_flight >= self._max_concurrent:
+                if self._queued >= self._max_queue:
+                    self._overloaded += 1
+                    return None, self._queue_timeout
+                self._queued += 1
+                deadline = time.monotonic() + self._queue_timeout
+                try:
+                    while self._in_flight >= self._max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._overloaded += 1
+                            return None, self._queue_timeout
+                        self._cond.wait(remaining)
+                finally:
+                    self._queued -= 1
+
+            self._in_flight += 1
+            self._admitted += 1
+
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                self._release()
+
+        return release, 0.0
+
+    def stats(self) -> dict:
+        """{"in_flight", "queued", "admitted", "rate_limited", "overloaded"}"""
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "admitted": self._admitted,
+                "rate_limited": self._rate_limited,
+                "overloaded": self._overloaded,
+            }
+
+
+def _load_limits() -> dict:
+    limits = {group: dict(config) for group, config in DEFAULT_LIMITS.items()}
+    raw = os.getenv("ADMISSION_LIMITS")
+    if raw:
+        for group, overrides in json.loads(raw).items():
+            limits.setdefault(group, {}).update(overrides)
+    return limits
+
+
+_limiters = {group: AdmissionLimiter(group, **config) for group, config in _load_limits().items()}
+
+
+REJECTED_MESSAGE = "Too many requests, please try again later."
+
+
+def _admitted_without_limits():
+    pass
+
+
+def admit(group: str, user_key: str):
+    """
+    Admit one request to `group` from `user_key` (blocks while queued for a slot).
+
+    Returns:
+        tuple: (release, 0) when admitted — call release() when the request is done —
+            or (None, retry_after_seconds) when it is rejected. Always admitted when
+            ADMISSION_CONTROL is off.
+    """
+    if not ADMISSION_CONTROL:
+        return _admitted_without_limits, 0.0
+    return _limiters[group].admit(user_key)
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, math.ceil(retry_after)))
+
+
+def get_admission_stats() -> dict:
+    """Counters per limit group: requests in progress and queued, admitted, and rejected by cause."""
+    return {group: limiter.stats() for group, limiter in _limiters.items()}
+
+
+def _user_key() -> str:
+    """The requesting user: user_id from the URL, query or JSON body, else the client address."""
+    user_id = (request.view_args or {}).get("user_id") or request.args.get("user_id")
+    if not user_id:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            user_id = data.get("user_id")
+    return f"user:{user_id}" if user_id else f"addr:{request.remote_addr}"
+
+
+def limited(group: str):
+    """Apply the admission limits of `group` to a Flask view; rejected requests get 429."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not ADMISSION_CONTROL:
+                return view(*args, **kwargs)
+
+            release, retry_after = admit(group, _user_key())
+            if release is None:
+                response = make_response(jsonify({"error": REJECTED_MESSAGE}), 429)
+                response.headers["Retry-After"] = retry_after_header(retry_after)
+                return response
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                release()
+                raise
+            if response.is_streamed:
+                # Hold the slot until the streamed body is finished
+                response.call_on_close(release)
+            else:
+                release()
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+async def _asgi_user_key(request: Request) -> str:
+    """_user_key() for a Starlette request."""
+    user_id = request.path_params.get("user_id") or request.query_params.get("user_id")
+    if not user_id:
+        try:
+            data = await request.json()  # cached on the request, so the handler can read it again
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            user_id = data.get("user_id")
+    return f"user:{user_id}" if user_id else f"addr:{request.client.host if request.client else None}"
+
+
+def limited_async(group: str):
+    """Apply the admission limits of `group` to a Starlette route handler; rejected requests get 429."""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request: Request):
+            if not ADMISSION_CONTROL:
+                return await handler(request)
+
+            # Waiting for a slot blocks, so it happens off the event loop
+            release, retry_after = await run_in_threadpool(admit, group, await _asgi_user_key(request))
+            if release is None:
+                return JSONResponse({"error": REJECTED_MESSAGE}, status_code=429,
+                                    headers={"Retry-After": retry_after_header(retry_after)})
+            try:
+                return await handler(request)
+            finally:
+                release()
+
+        return wrapper
+
+    return decorator
@@ -3,4 +3,7 @@ Agent Service facade — re-exports workflow functions from graphs/.
 
 app.py imports from this module, so the public API is preserved.
 """
+from graphs.review_graph import generate_daily_review as generate_daily_review
 from graphs.review_graph import generate_daily_review_agent as generate_daily_review_agent
+from graphs.review_graph import generate_daily_review_agent_async as generate_daily_review_agent_async
+from graphs.review_graph import generate_daily_review_async as generate_daily_review_async
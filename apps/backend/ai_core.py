@@ -1,11 +1,26 @@
 import json
 import os
 import re
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
 from enum import StrEnum
 
+import httpx
+import openai
 import requests
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+from pydantic import BaseModel
+
+from deadline import DeadlineExceeded, remaining
+from http_pool import build_httpx_client, get_async_client, get_session, loop_local
+from json_repair import repair_json
+from llm_router import LLMEndpoint, LLMRouter
+from llm_scheduler import PriorityScheduler, current_request_class
+from resilience import CircuitBreaker, LatencyTracker
+from singleflight import SingleFlight, request_key
 
 load_dotenv()
 
@@ -13,7 +28,9 @@ load_dotenv()
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "ollama").lower()
 API_KEY = os.getenv("API_KEY", "ollama")
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-oss:120b")
-AI_TIMEOUT = int(os.getenv("AI_TIMEOUT", "120"))
+AI_TIMEOUT = int(os.getenv("AI_TIMEOUT", "120"))  # ceiling; see LLM_ADAPTIVE_TIMEOUT
+# How long Ollama keeps the model (and its prompt cache) loaded after a request; empty = server default
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
 
 # Base URL handling
 # Allows overriding default API base for OpenAI or Ollama
@@ -31,6 +48,115 @@ openai_client = None
 if LLM_PROVIDER == "openai":
     openai_client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
 
+def _async_openai_client(endpoint: LLMEndpoint) -> AsyncOpenAI:
+    """AsyncOpenAI client for an OpenAI-compatible endpoint, one per running event loop."""
+    return loop_local(f"openai:{endpoint.name}", lambda: AsyncOpenAI(
+        api_key=endpoint.api_key,
+        base_url=endpoint.base_url,
+        http_client=get_async_client("openai")
+    ))
+
+# Endpoint router (see llm_router.py). LLM_ENDPOINTS is a JSON list of
+#   {"name", "provider", "base_url", "model", "api_key", "max_concurrency"}
+# where missing fields default to the single-endpoint settings above. Unset, the
+# router holds just that one endpoint, capped at LLM_MAX_CONCURRENCY (0 = no cap).
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))
+# Circuit breakers, adaptive timeouts and retries (see resilience.py)
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "10"))
+LLM_SLOW_CALL_SECONDS = float(os.getenv("LLM_SLOW_CALL_SECONDS", "60"))
+# Adaptive timeouts are tracked per request class (see llm_scheduler.py); calls of these
+# classes are long generations by nature and never count as slow calls
+LLM_LONG_CALL_CLASSES = tuple(
+    c.strip() for c in os.getenv("LLM_LONG_CALL_CLASSES", "generation,batch").split(",") if c.strip()
+)
+LLM_ADAPTIVE_TIMEOUT = os.getenv("LLM_ADAPTIVE_TIMEOUT", "true").lower() == "true"
+LLM_TIMEOUT_FLOOR = float(os.getenv("LLM_TIMEOUT_FLOOR", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+
+def _endpoints_from_env() -> list[LLMEndpoint]:
+    raw = os.getenv("LLM_ENDPOINTS")
+    if not raw:
+        return [LLMEndpoint("default", LLM_PROVIDER, BASE_URL, MODEL_NAME, API_KEY,
+                            max_concurrency=LLM_MAX_CONCURRENCY, client=openai_client)]
+
+    endpoints = []
+    for i, spec in enumerate(json.loads(raw)):
+        provider = spec.get("provider", LLM_PROVIDER).lower()
+        base_url = spec.get("base_url") or (None if provider == "openai" else "http://localhost:11434")
+        if provider != "openai" and base_url.endswith("/v1"):
+            base_url = base_url[:-3]
+        api_key = spec.get("api_key", API_KEY)
+        client = OpenAI(api_key=api_key, base_url=base_url) if provider == "openai" else None
+        endpoints.append(LLMEndpoint(
+            spec.get("name", f"{provider}-{i}"), provider, base_url, spec.get("model", MODEL_NAME), api_key,
+            max_concurrency=int(spec.get("max_concurrency", 0)), client=client,
+        ))
+    return endpoints
+
+def _is_endpoint_failure(e: Exception) -> bool:
+    """Errors that say the endpoint is unhealthy (vs. errors about this particular request)."""
+    if isinstance(e, (requests.ConnectionError, requests.Timeout, httpx.TransportError,
+                      openai.APIConnectionError)):
+        return True
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return isinstance(status, int) and (status >= 500 or status == 429)
+
+_router = LLMRouter(
+    _endpoints_from_env(), _is_endpoint_failure,
+    failure_threshold=LLM_BREAKER_FAILURES, open_seconds=LLM_BREAKER_OPEN_SECONDS,
+    slow_call_seconds=LLM_SLOW_CALL_SECONDS or None,
+    timeout=AI_TIMEOUT, timeout_floor=LLM_TIMEOUT_FLOOR, adaptive_timeout=LLM_ADAPTIVE_TIMEOUT,
+    long_call_kinds=LLM_LONG_CALL_CLASSES, max_retries=LLM_MAX_RETRIES, retry_budget_ratio=LLM_RETRY_BUDGET_RATIO,
+)
+
+def get_llm_router_stats() -> dict:
+    """
+    Router counters: total retries, and per endpoint its load (outstanding / total calls,
+    failures), circuit breaker state and current adaptive timeout per request class.
+    """
+    return _router.stats()
+
+# Priority scheduling by request class (see llm_scheduler.py): at most LLM_SCHEDULER_SLOTS
+# upstream calls run at once (0 = no limit, metrics only); queued calls are dispatched
+# chat first and background generation last, with waiting calls aging up in priority.
+LLM_SCHEDULER_SLOTS = int(os.getenv("LLM_SCHEDULER_SLOTS", "8"))
+LLM_SCHEDULER_AGING_SECONDS = float(os.getenv("LLM_SCHEDULER_AGING_SECONDS", "10"))
+
+_scheduler = PriorityScheduler(LLM_SCHEDULER_SLOTS, aging_seconds=LLM_SCHEDULER_AGING_SECONDS,
+                               queue_timeout=AI_TIMEOUT)
+
+def get_llm_scheduler_stats() -> dict:
+    """
+    Scheduler state: total and free slots, and per request class the queue depth,
+    calls in flight, calls dispatched and recent queue wait times (p50 / p95 / max ms).
+    """
+    return _scheduler.stats()
+
+def _call_timeout(endpoint: LLMEndpoint, deadline: float | None) -> tuple[float, bool]:
+    """
+    Provider timeout for one call: the endpoint's adaptive timeout for the current request
+    class, capped by the time left before the request deadline. Returns (timeout, capped_by_deadline).
+    """
+    timeout = _router.timeout_for(endpoint, current_request_class())  # adaptive, from recent latencies
+    left = remaining(deadline)
+    if left is None or left >= timeout:
+        return timeout, False
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline passed before the LLM call")
+    return left, True
+
+@contextmanager
+def _deadline_timeouts(capped: bool):
+    # A timeout shortened by the request deadline says nothing about the endpoint's health
+    try:
+        yield
+    except (requests.Timeout, httpx.TimeoutException, openai.APITimeoutError) as e:
+        if capped:
+            raise DeadlineExceeded("Request deadline reached while waiting for the LLM") from e
+        raise
+
 # Groq Safeguard Client
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_API_BASE_URL = os.getenv("GROQ_API_BASE_URL")
@@ -42,7 +168,8 @@ if GROQ_API_KEY and GROQ_API_BASE_URL:
     try:
         safeguard_client = OpenAI(
             api_key=GROQ_API_KEY,
-            base_url=GROQ_API_BASE_URL
+            base_url=GROQ_API_BASE_URL,
+            http_client=build_httpx_client()
         )
     except Exception as e:
         print(f"Failed to initialize Safeguard Client: {e}")
@@ -78,70 +205,300 @@ def calculate_score(error_type: ErrorType) -> int:
     }
     return mapping.get(error_type, -3)
 
-def query_llm(messages: list[dict[str, str]], json_mode: bool = False, temperature: float = 0.7) -> str:
+def _ollama_request(
+    endpoint: LLMEndpoint, messages: list[dict[str, str]], json_mode: bool, temperature: float, stream: bool,
+    schema: dict | None = None
+) -> tuple[str, dict, dict]:
+    """Build (url, headers, payload) for an Ollama /api/chat call."""
+    url = f"{endpoint.base_url.rstrip('/')}/api/chat"
+    headers = {
+        "Authorization": f"Bearer {endpoint.api_key}",
+        "Content-Type": "application/json"
+    }
+
+    payload = {
+        "model": endpoint.model,
+        "messages": messages,
+        "stream": stream,
+        "options": {
+            "temperature": temperature
+        }
+    }
+
+    # Without it the model unloads after 5 idle minutes and the next chat turn pays a cold load
+    if OLLAMA_KEEP_ALIVE:
+        payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+
+    # Ollama 'format' param: a JSON schema constrains decoding, "json" only asks for JSON
+    if schema is not None:
+        payload["format"] = schema
+    elif json_mode:
+        payload["format"] = "json"
+
+    return url, headers, payload
+
+def _openai_response_format(json_mode: bool, schema: dict | None) -> dict:
+    if schema is not None:
+        return {"type": "json_schema", "json_schema": {"name": schema.get("title", "reply"), "schema": schema}}
+    return {"type": "json_object"} if json_mode else {"type": "text"}
+
+def _ollama_content(data: dict) -> str:
+    """Extract the reply text from an Ollama response (or stream line)."""
+    content = data.get("message", {}).get("content", "")
+    if not content:
+        content = data.get("response", "")
+    return content
+
+# Identical requests already in flight share one upstream call (see singleflight.py)
+_llm_flight = SingleFlight()
+
+def _llm_request_key(messages: list[dict[str, str]], json_mode: bool, temperature: float, schema: dict | None) -> str:
+    return request_key(LLM_PROVIDER, BASE_URL, MODEL_NAME, messages, json_mode, temperature, schema)
+
+def get_llm_flight_stats() -> dict:
+    """
+    Counters for the single-flight layer in front of query_llm / query_llm_async.
+
+    Returns:
+        dict: "calls" (upstream requests made), "coalesced" (callers that shared
+            an identical in-flight request instead) and "in_flight" (right now).
+    """
+    return _llm_flight.stats()
+
+def query_llm(
+    messages: list[dict[str, str]], json_mode: bool = False, temperature: float = 0.7, schema: dict | None = None,
+    deadline: float | None = None,
+) -> str:
     """
     Unified function to query the configured LLM provider (Ollama or OpenAI).
 
+    Concurrent calls with the same messages, json_mode, temperature, schema and model
+    share one upstream request and receive its result or exception. A caller waiting on
+    a shared request still stops at its own deadline.
+
     Args:
         messages (List[Dict[str, str]]): A list of message dictionaries (role, content).
         json_mode (bool, optional): Whether to request JSON output from the model. Defaults to False.
         temperature (float, optional): The temperature for sampling. Defaults to 0.7.
+        schema (dict, optional): JSON schema for constrained decoding (see query_llm_json). Defaults to None.
+        deadline (float, optional): time.monotonic() by which the request must finish (see deadline.py).
+            Bounds queueing, retries and the provider timeout. Defaults to None (AI_TIMEOUT applies).
 
     Returns:
         str: The content of the response from the LLM.
+
+    Raises:
+        DeadlineExceeded: The deadline passed before or during the call.
     """
-    if LLM_PROVIDER == "openai" and openai_client:
+    key = _llm_request_key(messages, json_mode, temperature, schema)
+    return _llm_flight.do(key, lambda: _query_llm(messages, json_mode, temperature, schema, deadline), deadline)
+
+def _query_llm(
+    messages: list[dict[str, str]], json_mode: bool, temperature: float, schema: dict | None, deadline: float | None
+) -> str:
+    with _scheduler.slot(deadline=deadline):
+        return _router.call(
+            lambda endpoint: _query_endpoint(endpoint, messages, json_mode, temperature, schema, deadline),
+            deadline=deadline, kind=current_request_class(), avoid=_structured_unsupported(schema),
+        )
+
+def _query_endpoint(
+    endpoint: LLMEndpoint, messages: list[dict[str, str]], json_mode: bool, temperature: float, schema: dict | None,
+    deadline: float | None = None,
+) -> str:
+    _check_structured_support(endpoint, schema)
+    timeout, capped = _call_timeout(endpoint, deadline)
+    if endpoint.provider == "openai" and endpoint.client:
         try:
-            response_format = {"type": "json_object"} if json_mode else {"type": "text"}
-
-            completion = openai_client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=messages,
-                response_format=response_format,
-                temperature=temperature,
-                timeout=AI_TIMEOUT
-            )
-            return completion.choices[0].message.content
+            response_format = _openai_response_format(json_mode, schema)
+
+            with _deadline_timeouts(capped):
+                completion = endpoint.client.chat.completions.create(
+                    model=endpoint.model,
+                    messages=messages,
+                    response_format=response_format,
+                    temperature=temperature,
+                    timeout=timeout
+                )
         except Exception as e:
+            _raise_if_schema_rejected(endpoint, schema, e)
             print(f"OpenAI API Error: {e}")
             raise e
+        return _structured_reply(endpoint, schema, completion.choices[0].message.content)
     else:
         # Fallback to Ollama (requests)
-        url = f"{BASE_URL.rstrip('/')}/api/chat"
-        headers = {
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json"
-        }
+        url, headers, payload = _ollama_request(endpoint, messages, json_mode, temperature, stream=False, schema=schema)
 
-        payload = {
-            "model": MODEL_NAME,
-            "messages": messages,
-            "stream": False,
-            "options": {
-                "temperature": temperature
-            }
-        }
+        try:
+            # Shared keep-alive session: reuses pooled connections to the model server
+            with _deadline_timeouts(capped):
+                response = get_session("llm").post(url, json=payload, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            return _structured_reply(endpoint, schema, _ollama_content(response.json()))
+
+        except requests.RequestException as e:
+            _raise_if_schema_rejected(endpoint, schema, e)
+            print(f"Ollama API Error: {e}")
+            raise e
 
-        # Ollama 'format' param for JSON mode
-        if json_mode:
-            payload["format"] = "json"
+def query_llm_stream(
+    messages: list[dict[str, str]], temperature: float = 0.7, deadline: float | None = None
+) -> Iterator[str]:
+    """
+    Streaming variant of query_llm — yields content chunks as the provider produces them.
+
+    Args:
+        messages (List[Dict[str, str]]): A list of message dictionaries (role, content).
+        temperature (float, optional): The temperature for sampling. Defaults to 0.7.
+        deadline (float, optional): time.monotonic() deadline bounding the wait for the first
+            chunk and between chunks. Defaults to None.
 
+    Yields:
+        str: Successive pieces of the response text. Joining them gives the full response.
+    """
+    # The endpoint slot is held until the stream ends (or the consumer stops reading)
+    with _scheduler.slot(deadline=deadline), _router.endpoint(deadline=deadline) as endpoint:
+        yield from _stream_endpoint(endpoint, messages, temperature, deadline)
+
+def _stream_endpoint(
+    endpoint: LLMEndpoint, messages: list[dict[str, str]], temperature: float, deadline: float | None = None
+) -> Iterator[str]:
+    timeout, capped = _call_timeout(endpoint, deadline)
+    if endpoint.provider == "openai" and endpoint.client:
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=AI_TIMEOUT)
-            response.raise_for_status()
+            with _deadline_timeouts(capped):
+                stream = endpoint.client.chat.completions.create(
+                    model=endpoint.model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=timeout,
+                    stream=True
+                )
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+        except Exception as e:
+            print(f"OpenAI API Error: {e}")
+            raise e
+    else:
+        # Ollama streams newline-delimited JSON objects
+        url, headers, payload = _ollama_request(endpoint, messages, False, temperature, stream=True)
 
-            data = response.json()
-            content = data.get("message", {}).get("content", "")
-            if not content:
-                content = data.get("response", "")
-            return content
+        try:
+            with (
+                _deadline_timeouts(capped),
+                get_session("llm").post(url, json=payload, headers=headers, timeout=timeout, stream=True) as response,
+            ):
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    delta = _ollama_content(data)
+                    if delta:
+                        yield delta
+                    if data.get("done"):
+                        break
 
         except requests.RequestException as e:
             print(f"Ollama API Error: {e}")
             raise e
 
-def _parse_json_safe(content: str) -> dict:
-    """Helper to parse JSON from LLM response with cleanup strategies."""
+async def query_llm_async(
+    messages: list[dict[str, str]], json_mode: bool = False, temperature: float = 0.7, schema: dict | None = None,
+    deadline: float | None = None,
+) -> str:
+    """
+    Async variant of query_llm — awaits the provider without holding a thread.
+    Shares in-flight requests with query_llm callers.
+
+    Args:
+        messages (List[Dict[str, str]]): A list of message dictionaries (role, content).
+        json_mode (bool, optional): Whether to request JSON output from the model. Defaults to False.
+        temperature (float, optional): The temperature for sampling. Defaults to 0.7.
+        schema (dict, optional): JSON schema for constrained decoding. Defaults to None.
+        deadline (float, optional): time.monotonic() by which the request must finish. Defaults to None.
+
+    Returns:
+        str: The content of the response from the LLM.
+    """
+    key = _llm_request_key(messages, json_mode, temperature, schema)
+    return await _llm_flight.do_async(
+        key, lambda: _query_llm_async(messages, json_mode, temperature, schema, deadline), deadline
+    )
+
+async def _query_llm_async(
+    messages: list[dict[str, str]], json_mode: bool, temperature: float, schema: dict | None, deadline: float | None
+) -> str:
+    async with _scheduler.slot_async(deadline=deadline):
+        return await _router.call_async(
+            lambda endpoint: _query_endpoint_async(endpoint, messages, json_mode, temperature, schema, deadline),
+            deadline=deadline, kind=current_request_class(), avoid=_structured_unsupported(schema),
+        )
+
+async def _query_endpoint_async(
+    endpoint: LLMEndpoint, messages: list[dict[str, str]], json_mode: bool, temperature: float, schema: dict | None,
+    deadline: float | None = None,
+) -> str:
+    _check_structured_support(endpoint, schema)
+    timeout, capped = _call_timeout(endpoint, deadline)
+    if endpoint.provider == "openai" and endpoint.client:
+        try:
+            response_format = _openai_response_format(json_mode, schema)
+
+            with _deadline_timeouts(capped):
+                completion = await _async_openai_client(endpoint).chat.completions.create(
+                    model=endpoint.model,
+                    messages=messages,
+                    response_format=response_format,
+                    temperature=temperature,
+                    timeout=timeout
+                )
+        except Exception as e:
+            _raise_if_schema_rejected(endpoint, schema, e)
+            print(f"OpenAI API Error: {e}")
+            raise e
+        return _structured_reply(endpoint, schema, completion.choices[0].message.content)
+    else:
+        url, headers, payload = _ollama_request(endpoint, messages, json_mode, temperature, stream=False, schema=schema)
+
+        try:
+            with _deadline_timeouts(capped):
+                response = await get_async_client("llm").post(url, json=payload, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            return _structured_reply(endpoint, schema, _ollama_content(response.json()))
+
+        except httpx.HTTPError as e:
+            _raise_if_schema_rejected(endpoint, schema, e)
+            print(f"Ollama API Error: {e}")
+            raise e
+
+# Outcome counters for query_llm_json(_async): replies parsed as-is, replies that
+# needed json_repair, re-queries sent, and calls that gave up
+_json_stats_lock = threading.Lock()
+_json_stats = {"parsed": 0, "repaired": 0, "retries": 0, "failed": 0, "structured": 0}
+
+def _count_json(outcome: str):
+    with _json_stats_lock:
+        _json_stats[outcome] += 1
+
+def get_json_parse_stats() -> dict:
+    """
+    Counters for JSON replies handled by query_llm_json / query_llm_json_async.
+
+    Returns:
+        dict: "parsed" (valid or cleaned by the regex strategy), "repaired" (needed
+            json_repair), "retries" (prompts re-sent), "failed" (gave up) and
+            "structured" (replies decoded against a schema and validated).
+    """
+    with _json_stats_lock:
+        return dict(_json_stats)
+
+def _parse_json_regex(content: str) -> dict:
+    """Direct parse, then markdown-fence cleanup, then the outermost {...} span."""
     # 1. Direct try
     try:
         return json.loads(content)
@@ -167,14 +524,139 @@ def _parse_json_safe(content: str) -> dict:
 
     raise ValueError(f"Could not parse JSON from content: {content[:100]}...")
 
-def query_llm_json(messages: list[dict[str, str]], retries: int = 3, temperature: float = 0.7) -> dict:
+def _repair_json_object(content: str) -> dict:
+    """Full json_repair pass for replies the regex strategy couldn't recover."""
+    data = repair_json(content)
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}: {content[:100]}...")
+    print("Repaired malformed JSON reply without re-querying")
+    return data
+
+def _parse_json_safe(content: str) -> dict:
+    """Helper to parse JSON from LLM response: cheap cleanup first, then a full repair pass."""
+    try:
+        return _parse_json_regex(content)
+    except ValueError:
+        return _repair_json_object(content)
+
+# Structured output: schema-constrained decoding (OpenAI json_schema / Ollama format=<schema>).
+# LLM_STRUCTURED_OUTPUT=auto learns per endpoint (provider, base URL and model) on first use
+# and falls back to prompt-only JSON where the schema is rejected or answered empty; on/off
+# force it for every endpoint.
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "auto").lower()
+_structured_support: dict[str, bool] = {}
+
+class StructuredOutputUnavailable(RuntimeError):
+    """The endpoint serving a schema-constrained call can't do structured output."""
+
+def _capability_key(endpoint: LLMEndpoint) -> str:
+    return f"{endpoint.provider}|{endpoint.base_url}|{endpoint.model}"
+
+def structured_output_enabled() -> bool:
+    """Whether query_llm_json will currently request schema-constrained decoding."""
+    if LLM_STRUCTURED_OUTPUT == "off":
+        return False
+    if LLM_STRUCTURED_OUTPUT == "on":
+        return True
+    # Optimistic until calls show that no endpoint can do it
+    return any(_structured_support.get(_capability_key(ep), True) for ep in _router.endpoints)
+
+def _record_structured_support(endpoint: LLMEndpoint, supported: bool, reason: str = ""):
+    key = _capability_key(endpoint)
+    if _structured_support.get(key) == supported:
+        return
+    _structured_support[key] = supported
+    if not supported:
+        print(f"Structured output unavailable for {endpoint.model} on {endpoint.name} ({reason}); "
+              "using prompt-only JSON there")
+
+def _structured_unsupported(schema: dict | None) -> list[LLMEndpoint]:
+    """Endpoints a schema-constrained call should avoid: those known not to support it."""
+    if schema is None or LLM_STRUCTURED_OUTPUT != "auto":
+        return []
+    return [ep for ep in _router.endpoints if _structured_support.get(_capability_key(ep)) is False]
+
+def _check_structured_support(endpoint: LLMEndpoint, schema: dict | None):
+    """Refuse a schema-constrained call on an endpoint known not to support it."""
+    if schema is not None and LLM_STRUCTURED_OUTPUT == "auto" and not _structured_support.get(
+        _capability_key(endpoint), True
+    ):
+        raise StructuredOutputUnavailable(f"{endpoint.name} doesn't support structured output")
+
+def _rejects_schema(e: Exception) -> bool:
+    """True for a 400/422 from the provider, i.e. the request (its schema parameter) was refused."""
+    response = getattr(e, "response", None)
+    status = getattr(e, "status_code", None) or getattr(response, "status_code", None)
+    return status in (400, 422)
+
+def _raise_if_schema_rejected(endpoint: LLMEndpoint, schema: dict | None, e: Exception):
+    if schema is not None and LLM_STRUCTURED_OUTPUT == "auto" and _rejects_schema(e):
+        _record_structured_support(endpoint, False, str(e))
+        raise StructuredOutputUnavailable(str(e)) from e
+
+def _structured_reply(endpoint: LLMEndpoint, schema: dict | None, content: str | None) -> str | None:
+    if schema is None:
+        return content
+    if not content or not content.strip():
+        # The failure mode json_mode had on this provider: a successful call with nothing in it
+        _record_structured_support(endpoint, False, "empty response")
+        raise StructuredOutputUnavailable(f"{endpoint.name} answered a schema-constrained call empty")
+    _record_structured_support(endpoint, True)
+    return content
+
+def _query_structured(
+    messages: list[dict[str, str]], temperature: float, schema: type[BaseModel], deadline: float | None = None
+) -> str | None:
+    """Schema-constrained reply, or None if the endpoint can't do it (then use the plain path)."""
+    try:
+        return query_llm(messages, temperature=temperature, schema=schema.model_json_schema(), deadline=deadline)
+    except StructuredOutputUnavailable:
+        return None
+
+async def _query_structured_async(
+    messages: list[dict[str, str]], temperature: float, schema: type[BaseModel], deadline: float | None = None
+) -> str | None:
+    try:
+        return await query_llm_async(
+            messages, temperature=temperature, schema=schema.model_json_schema(), deadline=deadline
+        )
+    except StructuredOutputUnavailable:
+        return None
+
+def _parse_reply(content: str, schema: type[BaseModel] | None, structured: bool) -> dict:
+    # Same strategy as _parse_json_safe, counted: only query_llm_json(_async) feeds the stats
+    try:
+        data = _parse_json_regex(content)
+        _count_json("parsed")
+    except ValueError:
+        data = _repair_json_object(content)
+        _count_json("repaired")
+    if structured:
+        # Validation guards against providers that accept the schema but don't enforce it
+        data = schema.model_validate(data).model_dump(mode="json")
+        _count_json("structured")
+    return data
+
+def query_llm_json(
+    messages: list[dict[str, str]],
+    retries: int = 3,
+    temperature: float = 0.7,
+    schema: type[BaseModel] | None = None,
+    deadline: float | None = None,
+) -> dict:
     """
     Wrapper around query_llm to handle JSON parsing with retries.
+    Malformed replies are repaired locally first; the prompt is only re-sent
+    when nothing usable can be recovered.
 
     Args:
         messages (List[Dict[str, str]]): A list of message dictionaries.
         retries (int, optional): Number of times to retry if JSON parsing fails. Defaults to 3.
         temperature (float, optional): The temperature for sampling. Defaults to 0.7.
+        schema (type[BaseModel], optional): Expected reply shape. When the provider supports
+            schema-constrained decoding the reply is generated against it and validated;
+            otherwise the call falls back to prompt-only JSON. Defaults to None.
+        deadline (float, optional): time.monotonic() deadline for all attempts (see query_llm). Defaults to None.
 
     Returns:
         dict: A dictionary containing:
@@ -187,17 +669,80 @@ def query_llm_json(messages: list[dict[str, str]], retries: int = 3, temperature
 
     while retry_count <= retries:
         try:
-            # Disable json_mode at API level as it causes empty responses on this provider
-            content = query_llm(messages, json_mode=False, temperature=temperature)
-            data = _parse_json_safe(content)
+            content = None
+            if schema is not None and structured_output_enabled():
+                content = _query_structured(messages, temperature, schema, deadline)
+            structured = content is not None
+            if not structured:
+                # Disable json_mode at API level as it causes empty responses on this provider
+                content = query_llm(messages, json_mode=False, temperature=temperature, deadline=deadline)
+            data = _parse_reply(content, schema, structured)
+            return {"data": data, "retry_count": retry_count, "error": None}
+        except (ValueError, json.JSONDecodeError) as e:
+            last_error = str(e)
+            print(f"JSON parsing failed (attempt {retry_count + 1}/{retries + 1}): {e}")
+            retry_count += 1
+            if retry_count <= retries:
+                _count_json("retries")
+
+    _count_json("failed")
+    return {"data": None, "retry_count": retries, "error": last_error}
+
+async def query_llm_json_async(
+    messages: list[dict[str, str]],
+    retries: int = 3,
+    temperature: float = 0.7,
+    schema: type[BaseModel] | None = None,
+    deadline: float | None = None,
+) -> dict:
+    """
+    Async variant of query_llm_json. Same arguments and return shape.
+    """
+    retry_count = 0
+    last_error = None
+
+    while retry_count <= retries:
+        try:
+            content = None
+            if schema is not None and structured_output_enabled():
+                content = await _query_structured_async(messages, temperature, schema, deadline)
+            structured = content is not None
+            if not structured:
+                # Disable json_mode at API level as it causes empty responses on this provider
+                content = await query_llm_async(messages, json_mode=False, temperature=temperature, deadline=deadline)
+            data = _parse_reply(content, schema, structured)
             return {"data": data, "retry_count": retry_count, "error": None}
         except (ValueError, json.JSONDecodeError) as e:
             last_error = str(e)
             print(f"JSON parsing failed (attempt {retry_count + 1}/{retries + 1}): {e}")
             retry_count += 1
+            if retry_count <= retries:
+                _count_json("retries")
 
+    _count_json("failed")
     return {"data": None, "retry_count": retries, "error": last_error}
 
+def probe_structured_output() -> bool:
+    """
+    Send one tiny schema-constrained request to each configured endpoint and record whether it works.
+
+    Returns:
+        bool: True if every endpoint returned schema-valid JSON.
+    """
+    class _Probe(BaseModel):
+        ok: bool
+
+    messages = [{"role": "user", "content": 'Reply with the JSON object {"ok": true}.'}]
+    supported = True
+    for endpoint in _router.endpoints:
+        try:
+            content = _query_endpoint(endpoint, messages, False, 0.0, _Probe.model_json_schema())
+            _Probe.model_validate(_parse_json_safe(content))
+        except Exception as e:
+            _record_structured_support(endpoint, False, str(e))
+            supported = False
+    return supported
+
 def build_learner_context(profile: dict) -> dict:
     """
     Generate a short, human-readable context block from the learner's profile.
@@ -209,6 +754,8 @@ def build_learner_context(profile: dict) -> dict:
         dict: Contains:
             - "summary": A string summary of the profile.
             - "max_corrections": Recommended max corrections based on preference.
+            - "stable_summary": The part of the summary that only changes with level and preference.
+            - "focus_note": The weak points, which change as the learner practices.
     """
     level = profile.get("level_est", "N5")
     # Retrieve weak_points, defaulting to empty list if missing/None
@@ -231,7 +778,9 @@ def build_learner_context(profile: dict) -> dict:
 
     return {
         "summary": f"Learner profile:\n- Estimated level: {level}\n- Common weak points: {focus}\n- Feedback preference: {pref}\n- Max corrections: {max_corrections}",
-        "max_corrections": max_corrections
+        "max_corrections": max_corrections,
+        "stable_summary": f"Learner profile:\n- Estimated level: {level}\n- Feedback preference: {pref}\n- Max corrections: {max_corrections}",
+        "focus_note": f"The learner's current weak points (prioritize these in corrections): {focus}",
     }
 
 SAFETY_POLICY = """# Safety Policy
@@ -258,6 +807,23 @@ Answer (JSON only):
 {"violation": 0 or 1, "category": "category_name", "rationale": "reason"}
 """
 
+# The safeguard provider gets its own breaker and timeout. Checks fail open, so while it is
+# down they are skipped at once instead of holding every chat and eval for a timeout.
+_safeguard_breaker = CircuitBreaker("safeguard", LLM_BREAKER_FAILURES, LLM_BREAKER_OPEN_SECONDS)
+_safeguard_latency = LatencyTracker(floor=LLM_TIMEOUT_FLOOR, ceiling=AI_TIMEOUT)
+
+def _safeguard_timeout() -> float:
+    return _safeguard_latency.timeout() if LLM_ADAPTIVE_TIMEOUT else AI_TIMEOUT
+
+def _record_safeguard_call(elapsed: float | None, error: Exception | None):
+    if error is None:
+        _safeguard_latency.record(elapsed)
+    _safeguard_breaker.record(elapsed, error is not None and _is_endpoint_failure(error))
+
+def get_safeguard_breaker_stats() -> dict:
+    """Circuit breaker state of the safety-check provider (see resilience.CircuitBreaker.stats)."""
+    return _safeguard_breaker.stats()
+
 def check_safety(text: str) -> dict:
     """
     Check if the user input violates safety policy using Groq Safeguard.
@@ -271,6 +837,10 @@ def check_safety(text: str) -> dict:
         print("Safety check skipped: Safeguard client not initialized.")
         return {"violation": 0, "rationale": "Safeguard skipped"}
 
+    if not _safeguard_breaker.allow():
+        return {"violation": 0, "rationale": "Check skipped: safeguard circuit open"}
+
+    start = time.monotonic()
     try:
         completion = safeguard_client.chat.completions.create(
             messages=[
@@ -278,10 +848,51 @@ def check_safety(text: str) -> dict:
                 {"role": "user", "content": text}
             ],
             model=SAFEGUARD_MODEL_NAME,
-            temperature=0.0
+            temperature=0.0,
+            timeout=_safeguard_timeout()
+        )
+        _record_safeguard_call(time.monotonic() - start, None)
+        content = completion.choices[0].message.content
+        return _parse_json_safe(content)
+    except Exception as e:
+        _record_safeguard_call(None, e)
+        print(f"Safety check failed: {e}")
+        return {"violation": 0, "rationale": f"Check failed: {e}"}
+
+async def check_safety_async(text: str) -> dict:
+    """
+    Async variant of check_safety. Same return shape and fail-open behaviour.
+    """
+    if not ENABLE_SAFETY_CHECK:
+        return {"violation": 0, "rationale": "Safety check disabled via environment variable."}
+
+    if not safeguard_client:
+        print("Safety check skipped: Safeguard client not initialized.")
+        return {"violation": 0, "rationale": "Safeguard skipped"}
+
+    if not _safeguard_breaker.allow():
+        return {"violation": 0, "rationale": "Check skipped: safeguard circuit open"}
+
+    start = time.monotonic()
+    try:
+        client = loop_local("safeguard", lambda: AsyncOpenAI(
+            api_key=GROQ_API_KEY,
+            base_url=GROQ_API_BASE_URL,
+            http_client=get_async_client("safeguard")
+        ))
+        completion = await client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": SAFETY_POLICY},
+                {"role": "user", "content": text}
+            ],
+            model=SAFEGUARD_MODEL_NAME,
+            temperature=0.0,
+            timeout=_safeguard_timeout()
         )
+        _record_safeguard_call(time.monotonic() - start, None)
         content = completion.choices[0].message.content
         return _parse_json_safe(content)
     except Exception as e:
+        _record_safeguard_call(None, e)
         print(f"Safety check failed: {e}")
         return {"violation": 0, "rationale": f"Check failed: {e}"}
@@ -4,6 +4,15 @@ workflow functions from graphs/.
 
 app.py imports from this module, so the public API is preserved.
 """
+from ai_core import get_json_parse_stats as get_json_parse_stats
+from ai_core import get_llm_flight_stats as get_llm_flight_stats
+from ai_core import get_llm_router_stats as get_llm_router_stats
+from ai_core import get_llm_scheduler_stats as get_llm_scheduler_stats
+from ai_core import get_safeguard_breaker_stats as get_safeguard_breaker_stats
 from graphs.chat_graph import chat_with_ai as chat_with_ai
+from graphs.chat_graph import chat_with_ai_async as chat_with_ai_async
 from graphs.eval_graph import evaluate_submission as evaluate_submission
+from graphs.eval_graph import evaluate_submission_async as evaluate_submission_async
 from graphs.eval_graph import get_detailed_feedback as get_detailed_feedback
+from graphs.eval_graph import get_detailed_feedback_async as get_detailed_feedback_async
+from graphs.eval_graph import stream_detailed_feedback as stream_detailed_feedback
@@ -1,4 +1,4 @@
-import json
+import math
 import os
 import random
 import sqlite3
@@ -10,6 +10,8 @@ from flask_cors import CORS
 from pwdlib import PasswordHash, exceptions
 from pykakasi import kakasi
 
+from admission import limited
+from deadline import route_deadline
 from translation_service import translate_text
 from tts_service import generate_audio
 
@@ -124,8 +126,20 @@ def get_mistakes(user_id):
 
     return jsonify([dict(mistake) for mistake in mistakes])
 
-from agent_service import generate_daily_review_agent
-from ai_service import chat_with_ai, evaluate_submission, get_detailed_feedback
+from ai_service import chat_with_ai, evaluate_submission, stream_detailed_feedback
+from comprehension_service import (
+    COMPREHENSION_MAX_QUESTIONS,
+    choose_question_set,
+    create_comprehension_tables,
+    explanation_context,
+    explanation_key,
+    get_question_sets,
+    get_saved_explanation,
+    save_explanation,
+    save_question_set,
+    schedule_explanation_pregeneration,
+)
+from feedback_service import create_feedback_tables, get_saved_detailed_feedback, save_detailed_feedback
 from graphs.video_graph import check_comprehension_answer, generate_comprehension_questions
 from learner_service import (
     backfill_learner_profile,
@@ -134,17 +148,46 @@ from learner_service import (
     update_learner_profile,
     update_learner_settings,
 )
-from video_service import create_video_tables, import_video
+from review_service import create_review_tables, get_or_generate_daily_review
+from video_import_jobs import create_import_job_tables, enqueue_video_import, get_import_job, start_import_workers
+from video_service import (
+    count_transcript_segments,
+    create_video_tables,
+    find_segment_at,
+    get_context_lines,
+    get_transcript_text,
+    get_transcript_window,
+    migrate_transcript_blobs,
+)
 
 # Initialize Learner Tables
 try:
     with sqlite3.connect(DATABASE_PATH) as conn:
         create_learner_tables(conn)
         create_video_tables(conn)
+        create_feedback_tables(conn)
+        create_review_tables(conn)
+        create_import_job_tables(conn)
+        create_comprehension_tables(conn)
+        migrate_transcript_blobs(conn)
 except Exception as e:
     print(f"Database init error: {e}")
 
 
+def start_background_workers():
+    """
+    Start the video import workers, which also resume imports left queued or interrupted
+    by a restart. Called by the entry points (`python app.py`, asgi.py), not on import, so
+    tools and tests that import this module don't start claiming jobs.
+    """
+    start_import_workers(DATABASE_PATH)
+
+
+# For WSGI servers that only import this module (e.g. gunicorn app:app)
+if os.getenv("START_IMPORT_WORKERS_ON_IMPORT", "false").lower() == "true":
+    start_background_workers()
+
+
 @app.route('/api/exercise/submit', methods=['POST'])
 def submit_answer():
     """
@@ -223,6 +266,7 @@ def submit_answer():
     })
 
 @app.route('/api/exercise/explain', methods=['POST'])
+@limited('explain')
 def explain_answer():
     """
     Request AI evaluation for a specific submission log.
@@ -255,7 +299,7 @@ def explain_answer():
         correct_answer = row['correct_answer']
 
         print(f"Calling AI for evaluation (Log ID: {log_id})...")
-        ai_result = evaluate_submission(question, user_answer, correct_answer)
+        ai_result = evaluate_submission(question, user_answer, correct_answer, deadline=route_deadline('explain'))
 
         # Update record
         conn.execute('''
@@ -271,10 +315,12 @@ def explain_answer():
         conn.close()
 
 @app.route('/api/exercise/explain-detailed', methods=['POST'])
+@limited('explain')
 def explain_answer_detailed():
     """
     Request detailed grammatical explanation for a submission.
-    Does not update the database, just returns the explanation.
+    Served from storage when this exercise/answer pair was explained before;
+    otherwise generated and persisted for later requests.
 
     Returns:
         JSON: {"detailed_feedback": str}
@@ -288,7 +334,7 @@ def explain_answer_detailed():
     conn = get_db_connection()
     try:
         row = conn.execute('''
-            SELECT al.user_answer, e.question_sentence, e.correct_answer
+            SELECT al.exercise_id, al.user_answer, e.question_sentence, e.correct_answer
             FROM answer_log al
             JOIN exercise e ON al.exercise_id = e.exercise_id
             WHERE al.log_id = ?
@@ -297,18 +343,90 @@ def explain_answer_detailed():
         if not row:
             return jsonify({"error": "Log entry not found"}), 404
 
+        saved = get_saved_detailed_feedback(conn, row['exercise_id'], row['user_answer'])
+        if saved is not None:
+            return jsonify({"detailed_feedback": saved})
+
         question = row['question_sentence']
         user_answer = row['user_answer']
         correct_answer = row['correct_answer']
 
-        detailed_feedback = get_detailed_feedback(question, user_answer, correct_answer)
+        final = {}
+        deadline = route_deadline('explain_detailed')
+        for kind, payload in stream_detailed_feedback(question, user_answer, correct_answer, deadline=deadline):
+            if kind == "final":
+                final = payload
+
+        if final.get("is_complete"):
+            save_detailed_feedback(conn, row['exercise_id'], user_answer, final["result"])
 
-        return jsonify({"detailed_feedback": detailed_feedback})
+        return jsonify({"detailed_feedback": final.get("result", "")})
 
     finally:
         conn.close()
 
+@app.route('/api/exercise/explain-detailed/stream', methods=['POST'])
+@limited('explain')
+def explain_answer_detailed_stream():
+    """
+    Streaming variant of /api/exercise/explain-detailed.
+    Forwards markdown chunks as the model produces them, then persists the
+    completed explanation so later requests are served instantly.
+
+    Returns:
+        Response: text/markdown body, streamed chunk by chunk.
+    """
+    data = request.get_json()
+    log_id = data.get('log_id')
+
+    if not log_id:
+        return jsonify({"error": "log_id is required"}), 400
+
+    conn = get_db_connection()
+    try:
+        row = conn.execute('''
+            SELECT al.exercise_id, al.user_answer, e.question_sentence, e.correct_answer
+            FROM answer_log al
+            JOIN exercise e ON al.exercise_id = e.exercise_id
+            WHERE al.log_id = ?
+        ''', (log_id,)).fetchone()
+
+        if not row:
+            return jsonify({"error": "Log entry not found"}), 404
+
+        saved = get_saved_detailed_feedback(conn, row['exercise_id'], row['user_answer'])
+    finally:
+        conn.close()
+
+    if saved is not None:
+        return Response(saved, mimetype="text/markdown")
+
+    exercise_id = row['exercise_id']
+    user_answer = row['user_answer']
+
+    deadline = route_deadline('explain_detailed')
+
+    def generate():
+        for kind, payload in stream_detailed_feedback(
+            row['question_sentence'], user_answer, row['correct_answer'], deadline=deadline
+        ):
+            if kind == "chunk":
+                yield payload
+            elif payload["is_complete"]:
+                # The request connection is closed by now; persist on a fresh one
+                save_conn = get_db_connection()
+                try:
+                    save_detailed_feedback(save_conn, exercise_id, user_answer, payload["result"])
+                except Exception as e:
+                    print(f"Failed to persist detailed feedback: {e}")
+                finally:
+                    save_conn.close()
+
+    # X-Accel-Buffering stops reverse proxies from holding chunks back
+    return Response(generate(), mimetype="text/markdown", headers={"X-Accel-Buffering": "no"})
+
 @app.route('/api/chat/send', methods=['POST'])
+@limited('chat')
 def chat_send():
     """
     Send a message to the AI chat interface.
@@ -340,7 +458,7 @@ def chat_send():
         except Exception as e:
             print(f"Error fetching profile for chat: {e}")
 
-    result = chat_with_ai(message, history, locale, learner_profile)
+    result = chat_with_ai(message, history, locale, learner_profile, deadline=route_deadline('chat'))
     return jsonify(result)
 
 @app.route('/api/users/register', methods=['POST'])
@@ -640,22 +758,22 @@ def get_video_list():
 
 @app.route('/api/videos/<video_id>', methods=['GET'])
 def get_video_detail(video_id):
-    """Get video metadata and transcript segments."""
-    conn = get_db_connection()
-    video = conn.execute('SELECT * FROM videos WHERE video_id = ?', (video_id,)).fetchone()
-    conn.close()
+    """
+    Get video metadata. The transcript is fetched in windows from /api/videos/<video_id>/transcript.
 
-    if not video:
-        return jsonify({"error": "Video not found"}), 404
+    Returns:
+        JSON: {"info": {...}, "transcript_segments": number of transcript segments}
+    """
+    conn = get_db_connection()
+    try:
+        video = conn.execute('SELECT * FROM videos WHERE video_id = ?', (video_id,)).fetchone()
+        if not video:
+            return jsonify({"error": "Video not found"}), 404
+        segment_count = count_transcript_segments(conn, video_id)
+    finally:
+        conn.close()
 
     data = dict(video)
-    transcript = []
-    if data.get("transcript_json"):
-        try:
-            transcript = json.loads(data["transcript_json"])
-        except (json.JSONDecodeError, TypeError):
-            pass
-
     return jsonify({
         "info": {
             "video_id": data["video_id"],
@@ -667,28 +785,86 @@ def get_video_detail(video_id):
             "duration_seconds": data["duration_seconds"],
             "publish_date": data["publish_date"],
         },
-        "transcript": transcript,
+        "transcript_segments": segment_count,
     })
 
 
+TRANSCRIPT_WINDOW_SECONDS = 300.0
+TRANSCRIPT_MAX_WINDOW_SECONDS = 1800.0
+
+
+@app.route('/api/videos/<video_id>/transcript', methods=['GET'])
+def get_video_transcript(video_id):
+    """
+    Transcript segments in a time window, or the segment at a point in time.
+
+    Query params:
+        from, to (float): Window in seconds (default 0 and from + 300, at most 1800 s wide).
+        at (float): Instead of a window, return the segment playing at this time.
+
+    Returns:
+        JSON: {"from", "to", "segments": [{"seq", "start", "duration", "text"}, ...]}
+              or, with `at`, {"at", "segment": {...} | null}.
+    """
+    def seconds_arg(name, default=None):
+        value = request.args.get(name)
+        if value is None or value == "":
+            return default
+        seconds = float(value)
+        if not math.isfinite(seconds):
+            raise ValueError(name)
+        return seconds
+
+    try:
+        at = seconds_arg('at')
+        start = seconds_arg('from', 0.0)
+        end = seconds_arg('to', start + TRANSCRIPT_WINDOW_SECONDS)
+    except ValueError:
+        return jsonify({"error": "from, to and at must be numbers"}), 400
+    end = min(end, start + TRANSCRIPT_MAX_WINDOW_SECONDS)
+
+    conn = get_db_connection()
+    try:
+        if not conn.execute('SELECT 1 FROM videos WHERE video_id = ?', (video_id,)).fetchone():
+            return jsonify({"error": "Video not found"}), 404
+        if at is not None:
+            return jsonify({"at": at, "segment": find_segment_at(conn, video_id, at)})
+        segments = get_transcript_window(conn, video_id, start, end)
+    finally:
+        conn.close()
+
+    return jsonify({"from": start, "to": end, "segments": segments})
+
+
 @app.route('/api/videos/<video_id>/exercises', methods=['GET'])
 def get_video_exercises(video_id):
-    """Get pre-generated cloze exercises for a video."""
+    """Get pre-generated cloze exercises for a video, each with the transcript lines before it."""
     conn = get_db_connection()
-    exercises = conn.execute('''
-        SELECT exercise_id, full_sentence, question_sentence, correct_answer,
-               part_of_speech, jlpt_level, hint_chinese, context_timestamp
-        FROM video_exercises WHERE video_id = ?
-        ORDER BY context_timestamp
-    ''', (video_id,)).fetchall()
-    conn.close()
+    try:
+        exercises = [dict(e) for e in conn.execute('''
+            SELECT exercise_id, full_sentence, question_sentence, correct_answer,
+                   part_of_speech, jlpt_level, hint_chinese, context_timestamp
+            FROM video_exercises WHERE video_id = ?
+            ORDER BY context_timestamp
+        ''', (video_id,)).fetchall()]
+        for exercise in exercises:
+            timestamp = exercise["context_timestamp"]
+            exercise["context_lines"] = [] if timestamp is None else get_context_lines(conn, video_id, timestamp)
+    finally:
+        conn.close()
 
-    return jsonify([dict(e) for e in exercises])
+    return jsonify(exercises)
 
 
 @app.route('/api/videos/import', methods=['POST'])
 def import_video_route():
-    """Import a video from a YouTube URL."""
+    """
+    Queue the import of a video from a YouTube URL.
+    The import runs in the background; poll /api/videos/import/<job_id> for progress.
+
+    Returns:
+        JSON: The import job (202), e.g. {"job_id", "status", "stage", "progress", ...}.
+    """
     data = request.get_json()
     url = data.get('url', '').strip()
 
@@ -696,8 +872,8 @@ def import_video_route():
         return jsonify({"error": "URL is required"}), 400
 
     try:
-        result = import_video(url, DATABASE_PATH)
-        return jsonify(result)
+        job = enqueue_video_import(url, DATABASE_PATH)
+        return jsonify(job), 202
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
@@ -705,6 +881,21 @@ def import_video_route():
         return jsonify({"error": "Failed to import video. Please check the URL and try again."}), 500
 
 
+@app.route('/api/videos/import/<job_id>', methods=['GET'])
+def get_import_job_route(job_id):
+    """
+    Progress of a video import job.
+
+    Returns:
+        JSON: {"job_id", "status": queued|running|succeeded|failed, "stage", "progress" (0-1),
+               "attempts", "error", "result": {"video_id", "title", "already_exists"} once succeeded}
+    """
+    job = get_import_job(job_id, DATABASE_PATH)
+    if job is None:
+        return jsonify({"error": "Import job not found"}), 404
+    return jsonify(job)
+
+
 @app.route('/api/videos/submit', methods=['POST'])
 def submit_video_answer():
     """Submit an answer for a video cloze exercise."""
@@ -759,40 +950,62 @@ def submit_video_answer():
 
 
 @app.route('/api/videos/<video_id>/comprehension', methods=['POST'])
+@limited('comprehension')
 def generate_video_comprehension(video_id):
-    """Generate AI comprehension questions for a video."""
+    """
+    Comprehension questions for a video, from stored sets when there are any.
+
+    Body: {"num_questions": 5, "previous_set_id": optional}. Passing the set_id of the
+    questions just answered rotates to another set (see comprehension_service.py).
+
+    Returns:
+        JSON: {"questions": [...], "set_id": id of the stored set}
+    """
+    data = request.get_json() or {}
+    num = data.get('num_questions', 5)
+    if isinstance(num, bool) or not isinstance(num, int) or not 1 <= num <= COMPREHENSION_MAX_QUESTIONS:
+        return jsonify({"error": f"num_questions must be an integer from 1 to {COMPREHENSION_MAX_QUESTIONS}"}), 400
+
     conn = get_db_connection()
-    video = conn.execute('SELECT title, transcript_json FROM videos WHERE video_id = ?', (video_id,)).fetchone()
-    conn.close()
+    try:
+        video = conn.execute('SELECT title FROM videos WHERE video_id = ?', (video_id,)).fetchone()
+        stored = choose_question_set(get_question_sets(conn, video_id, num), data.get('previous_set_id')) if video else None
+        transcript_text = get_transcript_text(conn, video_id) if video and stored is None else ""
+    finally:
+        conn.close()
 
     if not video:
         return jsonify({"error": "Video not found"}), 404
 
-    transcript_text = ""
-    if video["transcript_json"]:
-        try:
-            segments = json.loads(video["transcript_json"])
-            transcript_text = " ".join(seg.get("text", "") for seg in segments)
-        except (json.JSONDecodeError, TypeError):
-            pass
+    if stored:
+        return jsonify(stored)
 
     if not transcript_text:
         return jsonify({"error": "No transcript available"}), 400
 
-    data = request.get_json() or {}
-    num = data.get('num_questions', 5)
-
     try:
-        questions = generate_comprehension_questions(transcript_text, video["title"], num)
-        return jsonify({"questions": questions})
+        questions = generate_comprehension_questions(
+            transcript_text, video["title"], num, deadline=route_deadline('comprehension')
+        )
     except Exception as e:
         print(f"Comprehension generation error: {e}")
         return jsonify({"error": "Failed to generate questions"}), 500
 
+    if not questions:
+        return jsonify({"questions": [], "set_id": None})
+    conn = get_db_connection()
+    try:
+        set_id = save_question_set(conn, video_id, num, questions)
+    finally:
+        conn.close()
+    schedule_explanation_pregeneration(DATABASE_PATH, video_id, questions)
+    return jsonify({"questions": questions, "set_id": set_id})
+
 
 @app.route('/api/videos/comprehension/check', methods=['POST'])
+@limited('comprehension_check')
 def check_video_comprehension():
-    """Check a comprehension answer."""
+    """Check a comprehension answer. Wrong-answer explanations are served from storage when saved."""
     data = request.get_json()
     question = data.get('question', '')
     choices = data.get('choices', [])
@@ -802,7 +1015,30 @@ def check_video_comprehension():
     user_id = data.get('user_id')
     video_id = data.get('video_id')
 
-    result = check_comprehension_answer(question, choices, correct_index, user_answer_index, context)
+    key = saved = None
+    if user_answer_index != correct_index:
+        conn = get_db_connection()
+        try:
+            if video_id:
+                context = explanation_context(conn, video_id) or context
+            key = explanation_key(question, choices, correct_index, user_answer_index, context)
+            saved = get_saved_explanation(conn, key)
+        finally:
+            conn.close()
+
+    if saved is not None:
+        result = {"is_correct": False, "feedback": saved, "score": 0}
+    else:
+        result = check_comprehension_answer(
+            question, choices, correct_index, user_answer_index, context,
+            deadline=route_deadline('comprehension_check'),
+        )
+        if result.pop("is_complete") and key:
+            conn = get_db_connection()
+            try:
+                save_explanation(conn, key, result["feedback"])
+            finally:
+                conn.close()
 
     # Log the answer if user_id and video_id provided
     if user_id and video_id:
@@ -868,19 +1104,24 @@ def get_tts():
     return Response(audio_content, mimetype="audio/wav")
 
 @app.route('/api/agent/daily_review/<user_id>', methods=['GET'])
+@limited('daily_review')
 def get_daily_review(user_id):
     """
-    Trigger the Daily Review Agent to generate a personalized review using the Agent Service.
+    Return the user's personalized daily review. A review already generated for today's
+    mistakes (by an earlier request or the nightly pre-generation job) is served from
+    storage; otherwise the Daily Review Agent generates and stores it.
 
     Args:
         user_id (str): The ID of the user.
 
     Returns:
-        JSON: {"review": markdown_string}
+        JSON: {"review": markdown_string, "cached": bool}
     """
     try:
-        review_content = generate_daily_review_agent(user_id, DATABASE_PATH)
-        return jsonify({"review": review_content})
+        review_content, cached = get_or_generate_daily_review(
+            user_id, DATABASE_PATH, deadline=route_deadline('daily_review')
+        )
+        return jsonify({"review": review_content, "cached": cached})
     except Exception as e:
         print(f"Agent Error: {e}")
         return jsonify({"error": "Agent 正在忙碌中，請稍後再試"}), 500
@@ -954,4 +1195,7 @@ def update_profile():
 
 
 if __name__ == '__main__':
+    # With the debug reloader, only the serving child process runs the workers
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_workers()
     app.run(debug=True)
@@ -0,0 +1,352 @@
+"""
+ASGI entry point — serves the LLM-backed routes on an event loop and forwards
+every other route to the Flask app unchanged.
+
+Under gunicorn/WSGI each in-flight chat, evaluation, review or comprehension
+call holds a worker thread for up to AI_TIMEOUT seconds. Here those routes
+await the async graph runners, so one process can keep hundreds of LLM
+conversations in flight on a single thread. SQLite access is short and runs
+in Starlette's threadpool. The video import workers start with the app
+(lifespan startup).
+
+Run:
+  uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import app as flask_module
+from admission import limited_async
+from ai_service import chat_with_ai_async, evaluate_submission_async, get_detailed_feedback_async
+from comprehension_service import (
+    COMPREHENSION_MAX_QUESTIONS,
+    choose_question_set,
+    explanation_context,
+    explanation_key,
+    get_question_sets,
+    get_saved_explanation,
+    save_explanation,
+    save_question_set,
+    schedule_explanation_pregeneration,
+)
+from deadline import route_deadline
+from feedback_service import get_saved_detailed_feedback, save_detailed_feedback
+from graphs.video_graph import check_comprehension_answer_async, generate_comprehension_questions_async
+from learner_service import get_learner_profile
+from review_service import get_or_generate_daily_review_async
+from video_service import get_transcript_text
+
+# ---------------------------------------------------------------------------
+# Blocking helpers (run in the threadpool)
+# ---------------------------------------------------------------------------
+
+def _fetch_submission(log_id: str):
+    conn = flask_module.get_db_connection()
+    try:
+        return conn.execute('''
+            SELECT al.exercise_id, al.user_answer, e.question_sentence, e.correct_answer
+            FROM answer_log al
+            JOIN exercise e ON al.exercise_id = e.exercise_id
+            WHERE al.log_id = ?
+        ''', (log_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def _save_evaluation(log_id: str, ai_result: dict):
+    conn = flask_module.get_db_connection()
+    try:
+        conn.execute('''
+            UPDATE answer_log
+            SET feedback = ?, score = ?, error_type = ?
+            WHERE log_id = ?
+        ''', (ai_result['feedback'], ai_result['score'], ai_result['error_type'], log_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _load_saved_feedback(exercise_id: str, user_answer: str):
+    conn = flask_module.get_db_connection()
+    try:
+        return get_saved_detailed_feedback(conn, exercise_id, user_answer)
+    finally:
+        conn.close()
+
+
+def _store_feedback(exercise_id: str, user_answer: str, content: str):
+    conn = flask_module.get_db_connection()
+    try:
+        save_detailed_feedback(conn, exercise_id, user_answer, content)
+    finally:
+        conn.close()
+
+
+def _load_profile(user_id: str):
+    conn = flask_module.get_db_connection()
+    try:
+        return get_learner_profile(conn, user_id)
+    finally:
+        conn.close()
+
+
+def _load_video(video_id: str, num_questions: int, previous_set_id: str | None):
+    conn = flask_module.get_db_connection()
+    try:
+        video = conn.execute('SELECT title FROM videos WHERE video_id = ?', (video_id,)).fetchone()
+        if not video:
+            return None
+        stored = choose_question_set(get_question_sets(conn, video_id, num_questions), previous_set_id)
+        transcript_text = get_transcript_text(conn, video_id) if stored is None else ""
+        return {"title": video["title"], "question_set": stored, "transcript_text": transcript_text}
+    finally:
+        conn.close()
+
+
+def _store_question_set(video_id: str, num_questions: int, questions: list) -> str:
+    conn = flask_module.get_db_connection()
+    try:
+        set_id = save_question_set(conn, video_id, num_questions, questions)
+    finally:
+        conn.close()
+    schedule_explanation_pregeneration(flask_module.DATABASE_PATH, video_id, questions)
+    return set_id
+
+
+def _load_explanation(video_id, question, choices, correct_index, user_answer_index, context):
+    # Same key as the Flask route: context from the video's transcript when known
+    conn = flask_module.get_db_connection()
+    try:
+        if video_id:
+            context = explanation_context(conn, video_id) or context
+        key = explanation_key(question, choices, correct_index, user_answer_index, context)
+        return key, context, get_saved_explanation(conn, key)
+    finally:
+        conn.close()
+
+
+def _store_explanation(key: str, feedback: str):
+    conn = flask_module.get_db_connection()
+    try:
+        save_explanation(conn, key, feedback)
+    finally:
+        conn.close()
+
+
+def _log_comprehension_answer(user_id, video_id, choices, user_answer_index, result):
+    # Same row shape as the Flask route
+    conn = flask_module.get_db_connection()
+    try:
+        user_answer = choices[user_answer_index] if user_answer_index < len(choices) else ""
+        conn.execute('''
+            INSERT INTO video_answer_log
+            (log_id, user_id, exercise_id, video_id, exercise_type, user_answer,
+             is_correct, score, feedback, answered_timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            str(uuid.uuid4()), user_id, str(uuid.uuid4()), video_id, 'comprehension',
+            user_answer, result["is_correct"], result["score"],
+            result["feedback"], datetime.now().isoformat()
+        ))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Async LLM routes — same paths, response shapes, admission limits and deadlines as app.py
+# ---------------------------------------------------------------------------
+
+@limited_async('chat')
+async def chat_send(request: Request):
+    data = await request.json()
+    message = data.get('message')
+    history = data.get('history', [])
+    locale = data.get('locale', 'en')
+
+    if not message:
+        return JSONResponse({"error": "Message is required"}, status_code=400)
+
+    if not isinstance(history, list):
+        return JSONResponse({"error": "History must be a list"}, status_code=400)
+
+    user_id = data.get('user_id')
+    learner_profile = None
+    if user_id:
+        try:
+            learner_profile = await run_in_threadpool(_load_profile, user_id)
+        except Exception as e:
+            print(f"Error fetching profile for chat: {e}")
+
+    result = await chat_with_ai_async(message, history, locale, learner_profile, deadline=route_deadline('chat'))
+    return JSONResponse(result)
+
+
+@limited_async('explain')
+async def explain_answer(request: Request):
+    data = await request.json()
+    log_id = data.get('log_id')
+
+    if not log_id:
+        return JSONResponse({"error": "log_id is required"}, status_code=400)
+
+    row = await run_in_threadpool(_fetch_submission, log_id)
+    if not row:
+        return JSONResponse({"error": "Log entry not found"}, status_code=404)
+
+    print(f"Calling AI for evaluation (Log ID: {log_id})...")
+    ai_result = await evaluate_submission_async(
+        row['question_sentence'], row['user_answer'], row['correct_answer'], deadline=route_deadline('explain')
+    )
+    await run_in_threadpool(_save_evaluation, log_id, ai_result)
+
+    return JSONResponse(ai_result)
+
+
+@limited_async('explain')
+async def explain_answer_detailed(request: Request):
+    data = await request.json()
+    log_id = data.get('log_id')
+
+    if not log_id:
+        return JSONResponse({"error": "log_id is required"}, status_code=400)
+
+    row = await run_in_threadpool(_fetch_submission, log_id)
+    if not row:
+        return JSONResponse({"error": "Log entry not found"}, status_code=404)
+
+    saved = await run_in_threadpool(_load_saved_feedback, row['exercise_id'], row['user_answer'])
+    if saved is not None:
+        return JSONResponse({"detailed_feedback": saved})
+
+    final = await get_detailed_feedback_async(
+        row['question_sentence'], row['user_answer'], row['correct_answer'],
+        deadline=route_deadline('explain_detailed'),
+    )
+    if final["is_complete"]:
+        await run_in_threadpool(_store_feedback, row['exercise_id'], row['user_answer'], final["result"])
+
+    return JSONResponse({"detailed_feedback": final["result"]})
+
+
+@limited_async('comprehension')
+async def generate_video_comprehension(request: Request):
+    video_id = request.path_params["video_id"]
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    data = data or {}
+    num = data.get('num_questions', 5)
+    if isinstance(num, bool) or not isinstance(num, int) or not 1 <= num <= COMPREHENSION_MAX_QUESTIONS:
+        return JSONResponse(
+            {"error": f"num_questions must be an integer from 1 to {COMPREHENSION_MAX_QUESTIONS}"}, status_code=400
+        )
+
+    video = await run_in_threadpool(_load_video, video_id, num, data.get('previous_set_id'))
+
+    if not video:
+        return JSONResponse({"error": "Video not found"}, status_code=404)
+
+    if video["question_set"]:
+        return JSONResponse(video["question_set"])
+
+    transcript_text = video["transcript_text"]
+    if not transcript_text:
+        return JSONResponse({"error": "No transcript available"}, status_code=400)
+
+    try:
+        questions = await generate_comprehension_questions_async(
+            transcript_text, video["title"], num, deadline=route_deadline('comprehension')
+        )
+    except Exception as e:
+        print(f"Comprehension generation error: {e}")
+        return JSONResponse({"error": "Failed to generate questions"}, status_code=500)
+
+    if not questions:
+        return JSONResponse({"questions": [], "set_id": None})
+    set_id = await run_in_threadpool(_store_question_set, video_id, num, questions)
+    return JSONResponse({"questions": questions, "set_id": set_id})
+
+
+@limited_async('comprehension_check')
+async def check_video_comprehension(request: Request):
+    data = await request.json()
+    question = data.get('question', '')
+    choices = data.get('choices', [])
+    correct_index = data.get('correct_index', 0)
+    user_answer_index = data.get('user_answer_index', 0)
+    context = data.get('transcript_context', '')
+    user_id = data.get('user_id')
+    video_id = data.get('video_id')
+
+    key = saved = None
+    if user_answer_index != correct_index:
+        key, context, saved = await run_in_threadpool(
+            _load_explanation, video_id, question, choices, correct_index, user_answer_index, context
+        )
+
+    if saved is not None:
+        result = {"is_correct": False, "feedback": saved, "score": 0}
+    else:
+        result = await check_comprehension_answer_async(
+            question, choices, correct_index, user_answer_index, context,
+            deadline=route_deadline('comprehension_check'),
+        )
+        if result.pop("is_complete") and key:
+            await run_in_threadpool(_store_explanation, key, result["feedback"])
+
+    if user_id and video_id:
+        try:
+            await run_in_threadpool(_log_comprehension_answer, user_id, video_id, choices, user_answer_index, result)
+        except Exception as e:
+            print(f"Failed to log comprehension answer: {e}")
+
+    return JSONResponse(result)
+
+
+@limited_async('daily_review')
+async def get_daily_review(request: Request):
+    user_id = request.path_params["user_id"]
+    try:
+        review_content, cached = await get_or_generate_daily_review_async(
+            user_id, flask_module.DATABASE_PATH, deadline=route_deadline('daily_review')
+        )
+        return JSONResponse({"review": review_content, "cached": cached})
+    except Exception as e:
+        print(f"Agent Error: {e}")
+        return JSONResponse({"error": "Agent 正在忙碌中，請稍後再試"}, status_code=500)
+
+
+routes = [
+    Route('/api/chat/send', chat_send, methods=['POST']),
+    Route('/api/exercise/explain', explain_answer, methods=['POST']),
+    Route('/api/exercise/explain-detailed', explain_answer_detailed, methods=['POST']),
+    Route('/api/videos/comprehension/check', check_video_comprehension, methods=['POST']),
+    Route('/api/videos/{video_id}/comprehension', generate_video_comprehension, methods=['POST']),
+    Route('/api/agent/daily_review/{user_id}', get_daily_review, methods=['GET']),
+    # Everything else (auth, news, statistics, streaming, TTS, ...) is served by Flask
+    Mount('/', app=WSGIMiddleware(flask_module.app)),
+]
+
+@asynccontextmanager
+async def lifespan(_app: Starlette):
+    flask_module.start_background_workers()
+    yield
+
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
@@ -0,0 +1,133 @@
+"""
+Micro-batching for small, independent LLM calls.
+
+Callers on any thread submit one item and get a Future back. A collector thread
+groups items that arrive within `max_wait_ms` of the first one (up to
+`max_batch_size`), hands the group to `batch_fn` on a worker pool, and fans the
+results back out to the waiting futures. Collection keeps running while a batch
+is in flight, so a slow LLM call never delays the next batch from forming.
+
+The wait only pays off under concurrency: an item submitted while no other item is
+outstanding is dispatched at once. batch_fn runs in a copy of the submitting
+caller's context (contextvars such as the LLM request class), taken from the first
+item of the batch.
+
+Public API:
+  - MicroBatcher(batch_fn, max_batch_size, max_wait_ms, max_workers, name)
+  - MicroBatcher.submit(item) -> Future
+  - MicroBatcher.stats() -> dict
+"""
+import contextvars
+import queue
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class MicroBatcher:
+    """
+    Groups concurrent submissions into batches for `batch_fn`.
+
+    Args:
+        batch_fn (Callable[[list], list]): Receives the batched items and must return one
+            result per item, in order. An Exception instance in the results fails only that
+            item's future; if batch_fn raises, every future in the batch gets the exception.
+        max_batch_size (int): Upper bound on items per batch.
+        max_wait_ms (float): How long the first item of a batch waits for company.
+        max_workers (int): Batches that may be in flight at once.
+        name (str): Used for the collector thread name and log lines.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list], list],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_workers: int = 8,
+        name: str = "batcher",
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._queue: queue.Queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self._collector: threading.Thread | None = None
+        self._batches = 0
+        self._items = 0
+        self._outstanding = 0  # submitted items whose futures haven't resolved yet
+
+    def submit(self, item) -> Future:
+        """Queue one item; the returned future resolves to its result from batch_fn."""
+        self._ensure_collector()
+        future: Future = Future()
+        with self._lock:
+            self._outstanding += 1
+        future.add_done_callback(self._resolved)
+        self._queue.put((item, future, contextvars.copy_context()))
+        return future
+
+    def _resolved(self, _future: Future):
+        with self._lock:
+            self._outstanding -= 1
+
+    def stats(self) -> dict:
+        """Batches dispatched, items processed and the resulting mean batch size."""
+        with self._lock:
+            batches, items = self._batches, self._items
+        return {
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": round(items / batches, 2) if batches else 0.0,
+        }
+
+    def _ensure_collector(self):
+        if self._collector is not None:
+            return
+        with self._lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name=f"{self.name}-collector", daemon=True)
+                self._collector.start()
+
+    def _alone(self, batch: list) -> bool:
+        """No other submission outstanding, so waiting for company would only add latency."""
+        with self._lock:
+            return self._outstanding <= len(batch) and self._queue.empty()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + (0.0 if self._alone(batch) else self.max_wait)
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: list):
+        with self._lock:
+            self._batches += 1
+            self._items += len(batch)
+
+        items = [item for item, _, _ in batch]
+        context = batch[0][2]
+        try:
+            results = context.run(self.batch_fn, items)
+            if len(results) != len(batch):
+                raise ValueError(f"{self.name}: batch_fn returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results, strict=True):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
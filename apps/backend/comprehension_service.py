@@ -0,0 +1,259 @@
+"""
+Comprehension question storage — persists generated question sets per video.
+
+A question set depends only on the video's transcript, the number of questions and
+the prompts that generated it, so it is keyed on (video_id, num_questions,
+prompt version) and served to every learner instead of being generated per request.
+A video keeps up to COMPREHENSION_SETS_PER_VIDEO sets: a learner asking for other
+questions (by passing the set they just answered) rotates through them, and a new
+set is generated only while the rotation is not full yet. Sets from an older
+COMPREHENSION_PROMPT_VERSION are ignored.
+
+Wrong-answer explanations depend only on the question, the chosen and the correct
+choice and the transcript context, not on the learner, so they are stored too, keyed
+on a hash of those (plus COMPREHENSION_EXPLANATION_VERSION). The check routes take
+the context from the start of the video's transcript — the same
+EXPLANATION_CONTEXT_CHARS characters the study page sends — so every learner's
+wrong answer maps to the same key.
+
+Imports pre-generate COMPREHENSION_PREGENERATE_SETS sets of
+COMPREHENSION_PREGENERATE_QUESTIONS in a background thread, so the first learner
+doesn't wait for the LLM either. With COMPREHENSION_PREGENERATE_EXPLANATIONS, every
+new set also gets an explanation for each of its wrong choices, so a wrong answer is
+a lookup.
+
+Public API:
+  - create_comprehension_tables(conn)                                 — ensure tables exist
+  - get_question_sets(conn, video_id, num_questions)                  — stored sets, oldest first
+  - save_question_set(conn, video_id, num_questions, questions)       — store a set, returns its set_id
+  - choose_question_set(sets, previous_set_id=None)                   — set to serve, or None to generate one
+  - pregenerate_question_sets(db_path, video_id)                      — generate missing sets now
+  - schedule_question_pregeneration(db_path, video_id)                — same, in the background
+  - explanation_context(conn, video_id)                               — context explanations are keyed on
+  - explanation_key(question, choices, correct_index, user_answer_index, context)
+  - get_saved_explanation(conn, key) / save_explanation(conn, key, feedback)
+  - pregenerate_explanations(db_path, video_id, questions)            — explain every wrong choice now
+  - schedule_explanation_pregeneration(db_path, video_id, questions)  — same, in the background
+"""
+import json
+import os
+import sqlite3
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+from graphs.video_graph import (
+    COMPREHENSION_EXPLANATION_VERSION,
+    COMPREHENSION_PROMPT_VERSION,
+    check_comprehension_answer,
+    generate_comprehension_questions,
+)
+from llm_scheduler import request_class
+from singleflight import request_key
+from video_service import get_transcript_prefix, get_transcript_text
+
+# Largest num_questions a client may ask for: each size is stored separately
+COMPREHENSION_MAX_QUESTIONS = 10
+COMPREHENSION_SETS_PER_VIDEO = int(os.getenv("COMPREHENSION_SETS_PER_VIDEO", "3"))
+COMPREHENSION_PREGENERATE_SETS = int(os.getenv("COMPREHENSION_PREGENERATE_SETS", "1"))  # 0 disables
+COMPREHENSION_PREGENERATE_QUESTIONS = int(os.getenv("COMPREHENSION_PREGENERATE_QUESTIONS", "5"))
+COMPREHENSION_PREGENERATE_EXPLANATIONS = os.getenv("COMPREHENSION_PREGENERATE_EXPLANATIONS", "true").lower() == "true"
+# Transcript context given to the explanation prompt (it uses the first 500 characters)
+EXPLANATION_CONTEXT_CHARS = 500
+
+# One background generation at a time: imports shouldn't crowd out interactive LLM calls
+_pregeneration_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="comprehension-pregen")
+
+
+def create_comprehension_tables(conn: sqlite3.Connection):
+    """Create comprehension question tables if they don't exist."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS comprehension_question_sets (
+            set_id TEXT PRIMARY KEY,
+            video_id TEXT NOT NULL REFERENCES videos(video_id),
+            num_questions INTEGER NOT NULL,
+            prompt_version TEXT NOT NULL,
+            questions_json TEXT NOT NULL,
+            created_timestamp TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_comprehension_question_sets_key
+        ON comprehension_question_sets (video_id, num_questions, prompt_version, created_timestamp)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS comprehension_explanations (
+            explanation_key TEXT PRIMARY KEY,
+            feedback TEXT NOT NULL,
+            created_timestamp TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def get_question_sets(
+    conn: sqlite3.Connection, video_id: str, num_questions: int, prompt_version: str = COMPREHENSION_PROMPT_VERSION
+) -> list[dict]:
+    """Stored sets for this video and size, oldest first: [{"set_id", "questions"}, ...]."""
+    rows = conn.execute('''
+        SELECT set_id, questions_json FROM comprehension_question_sets
+        WHERE video_id = ? AND num_questions = ? AND prompt_version = ?
+        ORDER BY created_timestamp, set_id
+    ''', (video_id, num_questions, prompt_version)).fetchall()
+    return [{"set_id": row[0], "questions": json.loads(row[1])} for row in rows]
+
+
+def save_question_set(
+    conn: sqlite3.Connection, video_id: str, num_questions: int, questions: list,
+    prompt_version: str = COMPREHENSION_PROMPT_VERSION,
+) -> str:
+    """Persist a generated set so later requests are served from storage. Returns its set_id."""
+    set_id = str(uuid.uuid4())
+    conn.execute('''
+        INSERT INTO comprehension_question_sets
+        (set_id, video_id, num_questions, prompt_version, questions_json, created_timestamp)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (set_id, video_id, num_questions, prompt_version, json.dumps(questions, ensure_ascii=False),
+          datetime.now().isoformat()))
+    conn.commit()
+    return set_id
+
+
+def choose_question_set(sets: list[dict], previous_set_id: str | None = None) -> dict | None:
+    """The stored set to serve, or None when a new one should be generated.
+
+    Without `previous_set_id` this is the oldest set. With it, the set after that one;
+    after the newest, a new set while there are fewer than COMPREHENSION_SETS_PER_VIDEO,
+    otherwise the rotation starts over.
+    """
+    if not sets:
+        return None
+    if previous_set_id is None:
+        return sets[0]
+
+    ids = [s["set_id"] for s in sets]
+    position = ids.index(previous_set_id) if previous_set_id in ids else len(ids) - 1
+    if position + 1 < len(sets):
+        return sets[position + 1]
+    if len(sets) < COMPREHENSION_SETS_PER_VIDEO:
+        return None
+    return sets[0]
+
+
+def pregenerate_question_sets(
+    db_path: str, video_id: str,
+    num_questions: int = COMPREHENSION_PREGENERATE_QUESTIONS, sets: int = COMPREHENSION_PREGENERATE_SETS,
+) -> int:
+    """Generate stored sets for a video until it has `sets` of them. Returns how many were generated."""
+    conn = sqlite3.connect(db_path)
+    try:
+        create_comprehension_tables(conn)
+        video = conn.execute('SELECT title FROM videos WHERE video_id = ?', (video_id,)).fetchone()
+        if not video:
+            return 0
+        transcript_text = get_transcript_text(conn, video_id)
+        missing = sets - len(get_question_sets(conn, video_id, num_questions))
+        if not transcript_text or missing <= 0:
+            return 0
+
+        generated = 0
+        with request_class("batch"):
+            for _ in range(missing):
+                questions = generate_comprehension_questions(transcript_text, video[0], num_questions)
+                if not questions:
+                    break
+                save_question_set(conn, video_id, num_questions, questions)
+                generated += 1
+                if COMPREHENSION_PREGENERATE_EXPLANATIONS:
+                    pregenerate_explanations(db_path, video_id, questions)
+        return generated
+    finally:
+        conn.close()
+
+
+def _pregenerate_logged(db_path: str, video_id: str):
+    try:
+        generated = pregenerate_question_sets(db_path, video_id)
+        if generated:
+            print(f"Pre-generated {generated} comprehension question set(s) for video {video_id}")
+    except Exception as e:
+        print(f"Comprehension pre-generation failed for video {video_id}: {e}")
+
+
+def schedule_question_pregeneration(db_path: str, video_id: str) -> Future | None:
+    """Run pregenerate_question_sets() in the background; None when pre-generation is disabled."""
+    if COMPREHENSION_PREGENERATE_SETS <= 0:
+        return None
+    return _pregeneration_pool.submit(_pregenerate_logged, db_path, video_id)
+
+
+# ---------------------------------------------------------------------------
+# Wrong-answer explanations
+# ---------------------------------------------------------------------------
+
+def explanation_context(conn: sqlite3.Connection, video_id: str) -> str:
+    """The transcript context wrong-answer explanations for this video are generated and keyed with."""
+    return get_transcript_prefix(conn, video_id, EXPLANATION_CONTEXT_CHARS)
+
+
+def explanation_key(question: str, choices: list, correct_index: int, user_answer_index: int, context: str) -> str:
+    """Storage key of the explanation for choosing choices[user_answer_index] instead of the correct one."""
+    def choice(index):
+        return choices[index] if 0 <= index < len(choices) else ""
+    return request_key("comprehension_explanation", COMPREHENSION_EXPLANATION_VERSION, question,
+                       choice(user_answer_index), choice(correct_index), context[:EXPLANATION_CONTEXT_CHARS])
+
+
+def get_saved_explanation(conn: sqlite3.Connection, key: str) -> str | None:
+    """Return the stored explanation for this key, or None if not generated yet."""
+    row = conn.execute(
+        'SELECT feedback FROM comprehension_explanations WHERE explanation_key = ?', (key,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def save_explanation(conn: sqlite3.Connection, key: str, feedback: str):
+    """Persist a completed explanation so later wrong answers are served from storage."""
+    conn.execute('''
+        INSERT OR REPLACE INTO comprehension_explanations (explanation_key, feedback, created_timestamp)
+        VALUES (?, ?, ?)
+    ''', (key, feedback, datetime.now().isoformat()))
+    conn.commit()
+
+
+def pregenerate_explanations(db_path: str, video_id: str, questions: list) -> int:
+    """Explain every wrong choice of `questions` that has no stored explanation. Returns how many were generated."""
+    conn = sqlite3.connect(db_path)
+    try:
+        create_comprehension_tables(conn)
+        context = explanation_context(conn, video_id)
+        generated = 0
+        with request_class("batch"):
+            for q in questions:
+                choices = q.get("choices", [])
+                correct_index = q.get("correct_index", 0)
+                for index in range(len(choices)):
+                    key = explanation_key(q.get("question", ""), choices, correct_index, index, context)
+                    if index == correct_index or get_saved_explanation(conn, key) is not None:
+                        continue
+                    result = check_comprehension_answer(q.get("question", ""), choices, correct_index, index, context)
+                    if result["is_complete"]:
+                        save_explanation(conn, key, result["feedback"])
+                        generated += 1
+        return generated
+    finally:
+        conn.close()
+
+
+def _pregenerate_explanations_logged(db_path: str, video_id: str, questions: list):
+    try:
+        pregenerate_explanations(db_path, video_id, questions)
+    except Exception as e:
+        print(f"Explanation pre-generation failed for video {video_id}: {e}")
+
+
+def schedule_explanation_pregeneration(db_path: str, video_id: str, questions: list) -> Future | None:
+    """Run pregenerate_explanations() in the background; None when explanation pre-generation is off."""
+    if not COMPREHENSION_PREGENERATE_EXPLANATIONS:
+        return None
+    return _pregeneration_pool.submit(_pregenerate_explanations_logged, db_path, video_id, questions)
@@ -0,0 +1,62 @@
+"""
+Request deadlines for LLM workflows.
+
+The HTTP layer turns a per-route SLO into a deadline: an absolute time.monotonic()
+value that the graph runners put in state["deadline"]. Every LLM call made for that
+request passes the deadline down to ai_core, which uses the time left, not the global
+AI_TIMEOUT, as the provider timeout. Queueing for a scheduler or endpoint slot and
+retries also stop at the deadline. Once it has passed, calls fail with DeadlineExceeded
+before reaching the provider, and the nodes' usual fallbacks produce the best partial
+result.
+
+Optional steps (e.g. the review polish pass) are skipped when less than
+OPTIONAL_STEP_MIN_SECONDS remain.
+
+Route SLOs default to ROUTE_SLOS and can be overridden with ROUTE_SLOS_JSON, e.g.
+{"chat": 20}. A deadline of None means "no deadline" throughout (batch jobs, scripts).
+
+Public API:
+  - DeadlineExceeded                    — the request's deadline passed before the call
+  - route_deadline(route)               — deadline for a request to `route`, starting now
+  - deadline_after(seconds)             — deadline `seconds` from now (None → None)
+  - remaining(deadline)                 — seconds left, or None without a deadline
+  - has_time_for_optional_step(deadline)
+"""
+import json
+import os
+import time
+
+ROUTE_SLOS = {
+    "chat": 30.0,
+    "explain": 20.0,
+    "explain_detailed": 60.0,
+    "comprehension": 90.0,
+    "comprehension_check": 20.0,
+    "daily_review": 60.0,
+}
+ROUTE_SLOS.update(json.loads(os.getenv("ROUTE_SLOS_JSON") or "{}"))
+
+OPTIONAL_STEP_MIN_SECONDS = float(os.getenv("OPTIONAL_STEP_MIN_SECONDS", "15"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before the LLM call could be made."""
+
+
+def deadline_after(seconds: float | None) -> float | None:
+    return None if seconds is None else time.monotonic() + seconds
+
+
+def route_deadline(route: str) -> float | None:
+    """Deadline for a request to `route`, from its SLO; None for routes without one."""
+    return deadline_after(ROUTE_SLOS.get(route))
+
+
+def remaining(deadline: float | None) -> float | None:
+    """Seconds until the deadline (≤ 0 once passed), or None when there is no deadline."""
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def has_time_for_optional_step(deadline: float | None) -> bool:
+    left = remaining(deadline)
+    return left is None or left >= OPTIONAL_STEP_MIN_SECONDS
@@ -0,0 +1,218 @@
+"""
+Local rule-based error classifier — decides the easy evaluations without the LLM.
+
+Fill-in-the-blank answers are short, and many wrong ones are mechanical: a
+kana slip, one particle swapped for another, or the right word in the wrong
+form. Those can be recognised from readings (kakasi), kana edit distance, a
+particle-confusion table and janome base_form comparison. Anything that looks
+like a real word choice or meaning problem is left to the LLM with low confidence.
+
+Public API:
+  - classify_submission(user_answer, correct_answer) -> dict
+        {"error_type": ErrorType, "reasoning": str, "confidence": float}
+"""
+import threading
+import unicodedata
+
+from janome.tokenizer import Tokenizer
+from pykakasi import kakasi
+
+from ai_core import ErrorType
+
+_kakasi = kakasi()
+_tokenizer = Tokenizer()
+_tokenizer_lock = threading.Lock()
+
+PARTICLES = {
+    "は", "が", "を", "に", "で", "へ", "と", "も", "の", "や", "か", "から", "まで", "より",
+    "ね", "よ", "しか", "だけ", "など", "ので", "のに", "けど", "でも",
+}
+
+# Commonly confused pairs and the distinction worth pointing out
+PARTICLE_CONFUSIONS = {
+    frozenset({"は", "が"}): "「は」標示主題，「が」標示主語或新資訊",
+    frozenset({"に", "で"}): "「に」表示存在的地點或動作的目的地，「で」表示動作進行的場所或手段",
+    frozenset({"に", "へ"}): "「へ」強調移動的方向，「に」強調到達點",
+    frozenset({"を", "が"}): "「を」標示動作的對象，「が」用於能力、好惡、需求等的對象",
+    frozenset({"に", "を"}): "「を」標示直接受詞，「に」標示對象、時間點或目的地",
+    frozenset({"で", "を"}): "「で」表示場所或手段，「を」表示動作的對象或經過的場所",
+    frozenset({"と", "や"}): "「と」列舉全部項目，「や」只列舉部分代表項目",
+    frozenset({"から", "まで"}): "「から」表示起點，「まで」表示終點",
+    frozenset({"は", "も"}): "「も」表示「也」，「は」表示主題或對比",
+    frozenset({"の", "が"}): "「の」連接名詞表示所屬，「が」標示主語",
+}
+
+CONFIDENCE_EXACT = 1.0
+CONFIDENCE_KANA_ONLY = 0.9
+CONFIDENCE_PARTICLE_KNOWN = 0.95
+CONFIDENCE_PARTICLE_OTHER = 0.85
+CONFIDENCE_CONJUGATION = 0.85
+CONFIDENCE_HOMOPHONE = 0.6  # below the local threshold: 箸/橋 is a wrong word, not a slip
+CONFIDENCE_TYPO = 0.8
+CONFIDENCE_UNSURE = 0.0
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    return "".join(text.split()).rstrip("。.!！?？")
+
+
+def _reading(text: str) -> str:
+    return "".join(item["hira"] for item in _kakasi.convert(text))
+
+
+def _is_kana(text: str) -> bool:
+    return all("぀" <= ch <= "ヿ" for ch in text)
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance over characters."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def _tokens(text: str) -> list:
+    with _tokenizer_lock:
+        return list(_tokenizer.tokenize(text))
+
+
+def _pos(token) -> tuple[str, str]:
+    parts = token.part_of_speech.split(",")
+    return parts[0], parts[1]
+
+
+def _content_lemmas(tokens: list) -> list[str]:
+    """Base forms of independent nouns, verbs, adjectives and adverbs."""
+    return [
+        t.base_form for t in tokens
+        if _pos(t)[0] in ("名詞", "動詞", "形容詞", "副詞") and _pos(t)[1] != "非自立"
+    ]
+
+
+def _inflected_head(tokens: list):
+    """First independent verb or adjective token, or None."""
+    for t in tokens:
+        pos, sub = _pos(t)
+        if pos in ("動詞", "形容詞") and sub == "自立":
+            return t
+    return None
+
+
+def _result(error_type: ErrorType, reasoning: str, confidence: float) -> dict:
+    return {"error_type": error_type, "reasoning": reasoning, "confidence": confidence}
+
+
+def _particle_result(user: str, correct: str) -> dict:
+    hint = PARTICLE_CONFUSIONS.get(frozenset({user, correct}))
+    if hint:
+        return _result(
+            ErrorType.PARTICLE,
+            f"{hint}。此處應使用「{correct}」，而不是「{user}」。",
+            CONFIDENCE_PARTICLE_KNOWN,
+        )
+    return _result(
+        ErrorType.PARTICLE,
+        f"助詞使用錯誤：此處應使用「{correct}」，而不是「{user}」。",
+        CONFIDENCE_PARTICLE_OTHER,
+    )
+
+
+def _swapped_particle(user_tokens: list, correct_tokens: list) -> tuple[str, str] | None:
+    """(user, correct) particle if the answers differ in exactly one particle token."""
+    if len(user_tokens) != len(correct_tokens):
+        return None
+    diffs = [(u, c) for u, c in zip(user_tokens, correct_tokens, strict=True) if u.surface != c.surface]
+    if len(diffs) != 1:
+        return None
+    u, c = diffs[0]
+    if _pos(u)[0] == "助詞" and _pos(c)[0] == "助詞":
+        return u.surface, c.surface
+    return None
+
+
+def _classify(user: str, correct: str) -> dict:
+    if not user:
+        return _result(ErrorType.OTHER, "", CONFIDENCE_UNSURE)
+
+    if user == correct:
+        return _result(ErrorType.NONE, "答案完全正確！", CONFIDENCE_EXACT)
+
+    # 1. A lone particle swapped for another
+    if user in PARTICLES and correct in PARTICLES:
+        return _particle_result(user, correct)
+
+    user_reading, correct_reading = _reading(user), _reading(correct)
+
+    # 2. Same reading: kana for kanji is fine. A different kanji may be a slip or a
+    #    different word altogether (会う/合う), which only the LLM can tell apart
+    if user_reading == correct_reading:
+        if _is_kana(user):
+            return _result(ErrorType.NONE, f"答案正確，也可以寫成「{correct}」。", CONFIDENCE_KANA_ONLY)
+        return _result(
+            ErrorType.TYPO,
+            f"讀音相同但漢字寫錯了，正確寫法是「{correct}」。",
+            CONFIDENCE_HOMOPHONE,
+        )
+
+    user_tokens, correct_tokens = _tokens(user), _tokens(correct)
+
+    # 3. Same phrase with one particle swapped
+    swapped = _swapped_particle(user_tokens, correct_tokens)
+    if swapped:
+        return _particle_result(*swapped)
+
+    # 4. Right word, wrong form
+    user_head, correct_head = _inflected_head(user_tokens), _inflected_head(correct_tokens)
+    if user_head is not None and correct_head is not None and user_head.base_form == correct_head.base_form:
+        user_nouns = [t.base_form for t in user_tokens if _pos(t)[0] == "名詞"]
+        correct_nouns = [t.base_form for t in correct_tokens if _pos(t)[0] == "名詞"]
+        if user_nouns == correct_nouns:
+            kind = "動詞" if _pos(correct_head)[0] == "動詞" else "形容詞"
+            return _result(
+                ErrorType.CONJUGATION,
+                f"{kind}「{correct_head.base_form}」的變化形錯誤，應為「{correct}」，而不是「{user}」。",
+                CONFIDENCE_CONJUGATION,
+            )
+
+    # 5. A one- or two-kana slip — unless the answer is a different real word (a vocab error)
+    distance = _edit_distance(user_reading, correct_reading)
+    allowed = 1 if len(correct_reading) < 8 else 2
+    if 0 < distance <= allowed and len(correct_reading) >= 2:
+        user_lemmas, correct_lemmas = _content_lemmas(user_tokens), _content_lemmas(correct_tokens)
+        different_word = (
+            len(user_lemmas) == len(correct_lemmas)
+            and user_lemmas != correct_lemmas
+            and all(t.reading != "*" for t in user_tokens)
+        )
+        if not different_word:
+            return _result(
+                ErrorType.TYPO,
+                f"假名拼寫有小錯誤，正確應為「{correct}」（{correct_reading}）。",
+                CONFIDENCE_TYPO,
+            )
+
+    return _result(ErrorType.OTHER, "", CONFIDENCE_UNSURE)
+
+
+def classify_submission(user_answer: str, correct_answer: str) -> dict:
+    """
+    Classify a fill-in-the-blank answer locally.
+
+    Args:
+        user_answer (str): The learner's answer.
+        correct_answer (str): The expected answer.
+
+    Returns:
+        dict: Contains:
+            - "error_type": ErrorType
+            - "reasoning": str (Traditional Chinese explanation, empty when unsure)
+            - "confidence": float in [0, 1]; 0 means "ask the LLM"
+    """
+    return _classify(_normalize(user_answer), _normalize(correct_answer))
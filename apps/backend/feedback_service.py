@@ -0,0 +1,45 @@
+"""
+Detailed feedback storage — persists completed grammar explanations.
+
+An explanation depends only on the exercise and the submitted answer, so it is keyed
+on (exercise_id, user_answer) and shared by every learner who makes the same mistake.
+
+Public API:
+  - create_feedback_tables(conn)                                   — ensure tables exist
+  - get_saved_detailed_feedback(conn, exercise_id, user_answer)    — stored text or None
+  - save_detailed_feedback(conn, exercise_id, user_answer, content) — upsert a completed text
+"""
+import sqlite3
+from datetime import datetime
+
+
+def create_feedback_tables(conn: sqlite3.Connection):
+    """Create feedback-related tables if they don't exist."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS detailed_feedback (
+            exercise_id TEXT NOT NULL,
+            user_answer TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_timestamp TEXT NOT NULL,
+            PRIMARY KEY (exercise_id, user_answer)
+        )
+    ''')
+    conn.commit()
+
+
+def get_saved_detailed_feedback(conn: sqlite3.Connection, exercise_id: str, user_answer: str) -> str | None:
+    """Return the stored explanation for this exercise/answer pair, or None if not generated yet."""
+    row = conn.execute(
+        'SELECT content FROM detailed_feedback WHERE exercise_id = ? AND user_answer = ?',
+        (exercise_id, user_answer)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def save_detailed_feedback(conn: sqlite3.Connection, exercise_id: str, user_answer: str, content: str):
+    """Persist a completed explanation so later requests are served from storage."""
+    conn.execute('''
+        INSERT OR REPLACE INTO detailed_feedback (exercise_id, user_answer, content, created_timestamp)
+        VALUES (?, ?, ?, ?)
+    ''', (exercise_id, user_answer, content, datetime.now().isoformat()))
+    conn.commit()
@@ -1,7 +1,16 @@
 """LangGraph workflow graphs for the AI layer."""
 from graphs.chat_graph import chat_with_ai as chat_with_ai
+from graphs.chat_graph import chat_with_ai_async as chat_with_ai_async
 from graphs.eval_graph import evaluate_submission as evaluate_submission
+from graphs.eval_graph import evaluate_submission_async as evaluate_submission_async
 from graphs.eval_graph import get_detailed_feedback as get_detailed_feedback
+from graphs.eval_graph import get_detailed_feedback_async as get_detailed_feedback_async
+from graphs.eval_graph import stream_detailed_feedback as stream_detailed_feedback
+from graphs.review_graph import generate_daily_review as generate_daily_review
 from graphs.review_graph import generate_daily_review_agent as generate_daily_review_agent
+from graphs.review_graph import generate_daily_review_agent_async as generate_daily_review_agent_async
+from graphs.review_graph import generate_daily_review_async as generate_daily_review_async
 from graphs.video_graph import check_comprehension_answer as check_comprehension_answer
+from graphs.video_graph import check_comprehension_answer_async as check_comprehension_answer_async
 from graphs.video_graph import generate_comprehension_questions as generate_comprehension_questions
+from graphs.video_graph import generate_comprehension_questions_async as generate_comprehension_questions_async
@@ -3,16 +3,48 @@ Chat workflow as a LangGraph StateGraph.
 
 Graph: safety_check → build_context → call_llm → END
        (violation shortcircuits to END)
+
+build_context sends recent turns verbatim up to CHAT_HISTORY_TOKEN_BUDGET estimated
+tokens. Older turns are folded into a rolling summary, cached by the exact turns it
+covers. Summaries are refreshed in the background every CHAT_SUMMARY_EVERY_TURNS
+turns, so the chat request itself never waits for one.
+
+Session mode (CHAT_SESSION_MODE, on by default) keeps consecutive turns of a chat
+prefix-identical so the model server's prompt/KV cache is reused: the system prompt
+depends only on (locale, level, feedback preference), the weak points travel in a
+note next to the new message, and the verbatim window only moves when the summary
+boundary does.
+
+The same graph is compiled twice: with blocking nodes for invoke() and with
+async LLM nodes for ainvoke() (chat_with_ai_async).
 """
-from typing import TypedDict
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Literal, TypedDict
 
 from langgraph.graph import END, StateGraph
+from pydantic import BaseModel
 
 from ai_core import (
     build_learner_context,
     check_safety,
+    check_safety_async,
+    query_llm,
     query_llm_json,
+    query_llm_json_async,
 )
+from llm_scheduler import default_request_class, request_class
+from singleflight import request_key
+from token_budget import estimate_message_tokens
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", "20"))
+CHAT_SUMMARY_EVERY_TURNS = max(1, int(os.getenv("CHAT_SUMMARY_EVERY_TURNS", "6")))
+CHAT_SUMMARY_CACHE_SIZE = int(os.getenv("CHAT_SUMMARY_CACHE_SIZE", "1024"))
+CHAT_SESSION_MODE = os.getenv("CHAT_SESSION_MODE", "true").lower() == "true"
 
 # ---------------------------------------------------------------------------
 # State
@@ -24,22 +56,168 @@ class ChatState(TypedDict, total=False):
     history: list
     locale: str
     learner_profile: dict
+    deadline: float | None  # time.monotonic() by which the request should finish (see deadline.py)
     # Intermediate
     safety_result: dict
     is_violation: bool
     learner_context: str
     max_corrections: int
+    history_summary: str
     messages: list
     # Output
     result: dict
 
 
+# ---------------------------------------------------------------------------
+# Reply schema (schema-constrained decoding where the provider supports it)
+# ---------------------------------------------------------------------------
+
+class ChatCorrection(BaseModel):
+    type: Literal["particle", "conjugation", "word_choice", "politeness", "word_order", "other"]
+    original: str
+    corrected: str
+    explanation: str
+
+
+class ChatFeedback(BaseModel):
+    overall: str
+    corrections: list[ChatCorrection]
+
+
+class ChatReply(BaseModel):
+    response: str
+    feedback: ChatFeedback
+
+
+# ---------------------------------------------------------------------------
+# History budget and rolling summary
+# ---------------------------------------------------------------------------
+
+SUMMARY_PROMPT = """You maintain a running summary of a Japanese tutoring chat between a Learner and a Tutor.
+Update the previous summary with the new turns. Keep: topics discussed, facts the learner shared
+about themselves, mistakes the tutor corrected, and anything the tutor promised to follow up on.
+Write at most 8 short bullet points, in the language the feedback is given in. Output only the bullets."""
+
+_summary_cache: OrderedDict[str, str] = OrderedDict()
+_summary_pending: set[str] = set()
+_summary_lock = threading.Lock()
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+
+def _normalize_turns(history: list) -> list:
+    return [
+        {"role": "assistant" if msg.get("role") == "assistant" else "user", "content": msg.get("content", "")}
+        for msg in history
+    ]
+
+
+def _recent_start(turns: list) -> int:
+    """Index of the oldest turn that still fits the token budget (the newest turn always does)."""
+    start = len(turns)
+    used = 0
+    while start > 0 and len(turns) - start < CHAT_HISTORY_MAX_TURNS:
+        cost = estimate_message_tokens([turns[start - 1]])
+        if used + cost > CHAT_HISTORY_TOKEN_BUDGET and start < len(turns):
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+def _summary_key(turns: list) -> str:
+    return request_key("chat-summary", turns)
+
+
+def _cached_summary(key: str) -> str | None:
+    with _summary_lock:
+        summary = _summary_cache.get(key)
+        if summary is not None:
+            _summary_cache.move_to_end(key)
+        return summary
+
+
+def _store_summary(key: str, summary: str):
+    with _summary_lock:
+        _summary_cache[key] = summary
+        _summary_cache.move_to_end(key)
+        while len(_summary_cache) > CHAT_SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+
+
+def _summarize(previous: str | None, turns: list) -> str:
+    transcript = "\n".join(
+        f"{'Tutor' if m['role'] == 'assistant' else 'Learner'}: {m['content']}" for m in turns
+    )
+    messages = [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Previous summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}"},
+    ]
+    return query_llm(messages, temperature=0.3).strip()
+
+
+def _refresh_summary(key: str, previous: str | None, turns: list):
+    try:
+        # Background work: queued behind live chat and evaluation calls
+        with request_class("batch"):
+            _store_summary(key, _summarize(previous, turns))
+    except Exception as e:
+        print(f"Chat summary refresh failed: {e}")
+    finally:
+        with _summary_lock:
+            _summary_pending.discard(key)
+
+
+def _schedule_summary(key: str, previous: str | None, turns: list) -> Future | None:
+    with _summary_lock:
+        if key in _summary_pending:
+            return None
+        _summary_pending.add(key)
+    return _summary_executor.submit(_refresh_summary, key, previous, turns)
+
+
+def fold_history(history: list) -> tuple[str | None, list]:
+    """
+    Split chat history into a summary of older turns and the turns sent verbatim.
+
+    Summaries cover history prefixes on a CHAT_SUMMARY_EVERY_TURNS grid, and each one
+    extends the previous one with the turns since. When the summary for the current
+    boundary isn't cached yet, it is scheduled in the background and this request uses
+    the newest cached one, plus whatever recent turns fit the budget.
+
+    In session mode the verbatim turns always start at the boundary, so the window
+    stays put between boundary moves instead of sliding (and breaking the prompt
+    prefix) every turn. It may exceed the budget by fewer than CHAT_SUMMARY_EVERY_TURNS turns.
+
+    Returns:
+        (summary or None, verbatim turns)
+    """
+    turns = _normalize_turns(history)
+    start = _recent_start(turns)
+    boundary = start // CHAT_SUMMARY_EVERY_TURNS * CHAT_SUMMARY_EVERY_TURNS
+    verbatim_start = boundary if CHAT_SESSION_MODE else start
+    if boundary == 0:
+        return None, turns[verbatim_start:]
+
+    base, base_summary = 0, None
+    for end in range(boundary, 0, -CHAT_SUMMARY_EVERY_TURNS):
+        base_summary = _cached_summary(_summary_key(turns[:end]))
+        if base_summary is not None:
+            base = end
+            break
+
+    if base == boundary:
+        # Summary is current: send everything after it (over budget by < CHAT_SUMMARY_EVERY_TURNS turns)
+        return base_summary, turns[boundary:]
+
+    _schedule_summary(_summary_key(turns[:boundary]), base_summary, turns[base:boundary])
+    return base_summary, turns[verbatim_start:]
+
+
 # ---------------------------------------------------------------------------
 # Nodes
 # ---------------------------------------------------------------------------
 
-def safety_check(state: ChatState) -> dict:
-    safety_result = check_safety(state["message"])
+def _safety_update(safety_result: dict) -> dict:
     is_violation = safety_result.get("violation", 0) == 1
 
     update: dict = {
@@ -61,14 +239,17 @@ def safety_check(state: ChatState) -> dict:
     return update
 
 
-def build_context(state: ChatState) -> dict:
-    history = state.get("history", [])
-    locale = state.get("locale", "en")
-    learner_profile = state.get("learner_profile")
+def safety_check(state: ChatState) -> dict:
+    return _safety_update(check_safety(state["message"]))
+
 
-    # Sliding window — keep last 20 turns
-    trimmed_history = history[-20:] if len(history) > 20 else history
+async def safety_check_async(state: ChatState) -> dict:
+    return _safety_update(await check_safety_async(state["message"]))
 
+
+@lru_cache(maxsize=256)
+def _system_prompt(locale: str, learner_context: str, max_corrections: int) -> str:
+    """The chat system prompt; built once per distinct input, so repeated turns send identical bytes."""
     # Determine feedback language
     if locale == "en":
         feedback_intro = "Reply in Japanese (Natural). Feedback/Explanations MUST be in English."
@@ -77,16 +258,7 @@ def build_context(state: ChatState) -> dict:
         feedback_intro = "Reply in Japanese (Natural). Feedback/Explanations MUST be in Traditional Chinese (繁體中文)."
         feedback_lang = "Traditional Chinese"
 
-    # Build learner context
-    if learner_profile:
-        context_data = build_learner_context(learner_profile)
-        learner_context = context_data["summary"]
-        max_corrections = context_data["max_corrections"]
-    else:
-        learner_context = "Learner profile: User is a beginner. Treat as N5 level."
-        max_corrections = 2
-
-    system_prompt = f"""
+    return f"""
     You are a friendly and helpful Japanese language tutor.
 
     Your goal is to have a natural conversation with the user in Japanese,
@@ -149,12 +321,44 @@ def build_context(state: ChatState) -> dict:
     If the user's Japanese is correct or natural enough, return an empty list for "corrections".
     """
 
+
+def build_context(state: ChatState) -> dict:
+    history = state.get("history", [])
+    locale = state.get("locale", "en")
+    learner_profile = state.get("learner_profile")
+
+    # Recent turns within the token budget; older ones as a rolling summary
+    history_summary, recent_turns = fold_history(history)
+
+    # Build learner context
+    focus_note = None
+    if learner_profile:
+        context_data = build_learner_context(learner_profile)
+        max_corrections = context_data["max_corrections"]
+        if CHAT_SESSION_MODE:
+            learner_context = context_data["stable_summary"]
+            focus_note = context_data["focus_note"]
+        else:
+            learner_context = context_data["summary"]
+    else:
+        learner_context = "Learner profile: User is a beginner. Treat as N5 level."
+        max_corrections = 2
+
+    system_prompt = _system_prompt(locale, learner_context, max_corrections)
+
     messages = [{"role": "system", "content": system_prompt}]
 
+    # Separate message, so the system prompt above stays the same as the summary changes
+    if history_summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{history_summary}"})
+
     # Append history
-    for msg in trimmed_history:
-        role = "assistant" if msg.get("role") == "assistant" else "user"
-        messages.append({"role": role, "content": msg.get("content", "")})
+    messages.extend(recent_turns)
+
+    # Session mode: weak points change as the learner practices, so they go after the
+    # history — a change then only invalidates the cache for this turn's tail
+    if focus_note:
+        messages.append({"role": "system", "content": focus_note})
 
     # Append current message
     messages.append({"role": "user", "content": state["message"]})
@@ -162,55 +366,73 @@ def build_context(state: ChatState) -> dict:
     return {
         "learner_context": learner_context,
         "max_corrections": max_corrections,
+        "history_summary": history_summary or "",
         "messages": messages,
     }
 
 
-def call_llm(state: ChatState) -> dict:
-    try:
-        result = query_llm_json(state["messages"], temperature=0.7)
-        retry_count = result["retry_count"]
-
-        if result["error"]:
-            return {
-                "result": {
-                    "response": "すみません、エラーが発生しました。",
-                    "feedback": {
-                        "overall": f"AI 服務暫時無法回應 (格式錯誤, retried {retry_count} times)",
-                        "corrections": [],
-                    },
-                    "retry_count": retry_count,
-                }
-            }
-
-        result_json = result["data"]
-
-        # Validate keys
-        if "response" not in result_json:
-            result_json["response"] = "申し訳ありません、もう一度お願いします。"
+def _chat_result(result: dict) -> dict:
+    retry_count = result["retry_count"]
 
-        if "feedback" not in result_json:
-            result_json["feedback"] = {
-                "overall": "無法取得回饋",
-                "corrections": [],
-            }
-
-        result_json["retry_count"] = retry_count
-        return {"result": result_json}
-
-    except Exception as e:
-        print(f"Chat error: {e}")
+    if result["error"]:
         return {
             "result": {
                 "response": "すみません、エラーが発生しました。",
                 "feedback": {
-                    "overall": f"AI 服務暫時無法回應 ({str(e)})",
+                    "overall": f"AI 服務暫時無法回應 (格式錯誤, retried {retry_count} times)",
                     "corrections": [],
                 },
-                "retry_count": 0,
+                "retry_count": retry_count,
             }
         }
 
+    result_json = result["data"]
+
+    # Validate keys
+    if "response" not in result_json:
+        result_json["response"] = "申し訳ありません、もう一度お願いします。"
+
+    if "feedback" not in result_json:
+        result_json["feedback"] = {
+            "overall": "無法取得回饋",
+            "corrections": [],
+        }
+
+    result_json["retry_count"] = retry_count
+    return {"result": result_json}
+
+
+def _chat_error(e: Exception) -> dict:
+    print(f"Chat error: {e}")
+    return {
+        "result": {
+            "response": "すみません、エラーが発生しました。",
+            "feedback": {
+                "overall": f"AI 服務暫時無法回應 ({str(e)})",
+                "corrections": [],
+            },
+            "retry_count": 0,
+        }
+    }
+
+
+def call_llm(state: ChatState) -> dict:
+    try:
+        return _chat_result(query_llm_json(
+            state["messages"], temperature=0.7, schema=ChatReply, deadline=state.get("deadline")
+        ))
+    except Exception as e:
+        return _chat_error(e)
+
+
+async def call_llm_async(state: ChatState) -> dict:
+    try:
+        return _chat_result(await query_llm_json_async(
+            state["messages"], temperature=0.7, schema=ChatReply, deadline=state.get("deadline")
+        ))
+    except Exception as e:
+        return _chat_error(e)
+
 
 # ---------------------------------------------------------------------------
 # Conditional routing
@@ -226,11 +448,11 @@ def route_after_safety(state: ChatState) -> str:
 # Graph construction
 # ---------------------------------------------------------------------------
 
-def _build_chat_graph():
+def _build_chat_graph(asynchronous: bool = False):
     graph = StateGraph(ChatState)
-    graph.add_node("safety_check", safety_check)
+    graph.add_node("safety_check", safety_check_async if asynchronous else safety_check)
     graph.add_node("build_context", build_context)
-    graph.add_node("call_llm", call_llm)
+    graph.add_node("call_llm", call_llm_async if asynchronous else call_llm)
 
     graph.set_entry_point("safety_check")
     graph.add_conditional_edges(
@@ -246,13 +468,16 @@ def _build_chat_graph():
 
 # Compile once at module load
 _chat_graph = _build_chat_graph()
+_chat_graph_async = _build_chat_graph(asynchronous=True)
 
 
 # ---------------------------------------------------------------------------
-# Public runner function (drop-in replacement)
+# Public runner functions (drop-in replacements)
 # ---------------------------------------------------------------------------
 
-def chat_with_ai(message: str, history: list, locale: str = 'en', learner_profile: dict = None) -> dict:
+def chat_with_ai(
+    message: str, history: list, locale: str = 'en', learner_profile: dict = None, deadline: float | None = None
+) -> dict:
     """
     Chat with the AI in Japanese.
 
@@ -261,6 +486,7 @@ def chat_with_ai(message: str, history: list, locale: str = 'en', learner_profil
         history: List of dictionary {'role': 'user'|'assistant', 'content': '...'}
         locale: User's locale (e.g. 'en', 'ja', 'zh-tw').
         learner_profile: Dict containing learner stats and preferences.
+        deadline: time.monotonic() by which the reply is needed (see deadline.py).
 
     Returns:
         Dict with keys:
@@ -273,6 +499,26 @@ def chat_with_ai(message: str, history: list, locale: str = 'en', learner_profil
         "history": history,
         "locale": locale,
         "learner_profile": learner_profile,
+        "deadline": deadline,
+    }
+    with default_request_class("chat"):
+        final_state = _chat_graph.invoke(initial_state)
+    return final_state["result"]
+
+
+async def chat_with_ai_async(
+    message: str, history: list, locale: str = 'en', learner_profile: dict = None, deadline: float | None = None
+) -> dict:
+    """
+    Async variant of chat_with_ai(); awaits the LLM instead of blocking a worker thread.
+    """
+    initial_state = {
+        "message": message,
+        "history": history,
+        "locale": locale,
+        "learner_profile": learner_profile,
+        "deadline": deadline,
     }
-    final_state = _chat_graph.invoke(initial_state)
+    with default_request_class("chat"):
+        final_state = await _chat_graph_async.ainvoke(initial_state)
     return final_state["result"]
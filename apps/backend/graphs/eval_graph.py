@@ -3,19 +3,49 @@ Exercise evaluation workflows as LangGraph StateGraphs.
 
 Two graphs:
   - eval_graph: evaluate_submission() — classify errors and score
+    (error_classifier.py decides the mechanical cases before any LLM call)
   - detailed_feedback_graph: get_detailed_feedback() — grammatical explanation
+    (stream_detailed_feedback() runs the same graph and yields markdown chunks)
+
+Each graph is also compiled with async LLM nodes for the *_async runners.
+Synchronous evaluations are micro-batched: see EVAL_BATCH_* below.
 """
+import contextvars
+import os
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from typing import TypedDict
 
+from langgraph.config import get_stream_writer
 from langgraph.graph import END, StateGraph
+from pydantic import BaseModel
 
 from ai_core import (
     ErrorType,
     calculate_score,
     check_safety,
-    query_llm,
+    check_safety_async,
+    query_llm_async,
     query_llm_json,
+    query_llm_json_async,
+    query_llm_stream,
 )
+from batching import MicroBatcher
+from error_classifier import classify_submission
+from llm_scheduler import default_request_class
+
+# Concurrent evaluations arriving within EVAL_BATCH_MAX_WAIT_MS of each other are
+# classified in one LLM call of up to EVAL_BATCH_MAX_SIZE submissions. A lone
+# evaluation doesn't wait (see batching.py).
+EVAL_BATCH_ENABLED = os.getenv("EVAL_BATCH_ENABLED", "true").lower() == "true"
+EVAL_BATCH_MAX_SIZE = int(os.getenv("EVAL_BATCH_MAX_SIZE", "8"))
+EVAL_BATCH_MAX_WAIT_MS = float(os.getenv("EVAL_BATCH_MAX_WAIT_MS", "15"))
+
+# Answers the local classifier decides with at least this confidence skip the LLM
+# (and the safety check: a near-miss of the correct answer can't carry an injection).
+EVAL_LOCAL_CLASSIFIER = os.getenv("EVAL_LOCAL_CLASSIFIER", "true").lower() == "true"
+EVAL_LOCAL_MIN_CONFIDENCE = float(os.getenv("EVAL_LOCAL_MIN_CONFIDENCE", "0.8"))
 
 # ---------------------------------------------------------------------------
 # State definitions
@@ -26,7 +56,9 @@ class EvalState(TypedDict, total=False):
     question: str
     user_answer: str
     correct_answer: str
+    deadline: float | None  # time.monotonic() by which the request should finish (see deadline.py)
     # Intermediate
+    local_result: dict
     safety_result: dict
     is_violation: bool
     messages: list
@@ -39,20 +71,40 @@ class DetailedFeedbackState(TypedDict, total=False):
     question: str
     user_answer: str
     correct_answer: str
+    deadline: float | None  # time.monotonic() by which the request should finish (see deadline.py)
     # Intermediate
     safety_result: dict
     is_violation: bool
     messages: list
     # Output
     result: str
+    is_complete: bool  # True only when result is a full LLM explanation worth persisting
+
+
+# ---------------------------------------------------------------------------
+# Reply schemas (schema-constrained decoding where the provider supports it)
+# ---------------------------------------------------------------------------
+
+class EvalReply(BaseModel):
+    error_type: ErrorType
+    reasoning: str
+
+
+class EvalBatchItem(BaseModel):
+    id: int
+    error_type: ErrorType
+    reasoning: str
+
+
+class EvalBatchReply(BaseModel):
+    results: list[EvalBatchItem]
 
 
 # ---------------------------------------------------------------------------
 # Eval graph nodes
 # ---------------------------------------------------------------------------
 
-def eval_safety_check(state: EvalState) -> dict:
-    safety_result = check_safety(state["user_answer"])
+def _eval_safety_update(safety_result: dict) -> dict:
     is_violation = safety_result.get("violation", 0) == 1
 
     update: dict = {
@@ -74,8 +126,15 @@ def eval_safety_check(state: EvalState) -> dict:
     return update
 
 
-def build_eval_prompt(state: EvalState) -> dict:
-    system_prompt = """
+def eval_safety_check(state: EvalState) -> dict:
+    return _eval_safety_update(check_safety(state["user_answer"]))
+
+
+async def eval_safety_check_async(state: EvalState) -> dict:
+    return _eval_safety_update(await check_safety_async(state["user_answer"]))
+
+
+EVAL_RULES = """
     You are a strict Japanese language teacher.
     Analyze the user's answer based on the correct answer and the question context.
 
@@ -88,7 +147,9 @@ def build_eval_prompt(state: EvalState) -> dict:
     - UNNATURAL: Grammatically correct but contextually weird, or complete nonsense.
 
     Provide a concise explanation in Traditional Chinese (繁體中文), around 30-50 characters.
+"""
 
+EVAL_SYSTEM_PROMPT = EVAL_RULES + """
     Respond STRICTLY in JSON format with two keys. Do NOT output any "thinking" or conversational text.
 
     Example Output:
@@ -98,6 +159,8 @@ def build_eval_prompt(state: EvalState) -> dict:
     }
     """
 
+
+def build_eval_prompt(state: EvalState) -> dict:
     user_prompt = f"""
     Question: {state["question"]}
     Correct Answer: {state["correct_answer"]}
@@ -105,74 +168,240 @@ def build_eval_prompt(state: EvalState) -> dict:
     """
 
     messages = [
-        {"role": "system", "content": system_prompt},
+        {"role": "system", "content": EVAL_SYSTEM_PROMPT},
         {"role": "user", "content": user_prompt},
     ]
 
     return {"messages": messages}
 
 
-def call_llm_and_score(state: EvalState) -> dict:
-    try:
-        result = query_llm_json(state["messages"], temperature=0.1)
-        retry_count = result["retry_count"]
-
-        if result["error"]:
-            print(f"Failed to evaluate submission after retries. Error: {result['error']}")
-            return {
-                "result": {
-                    "is_correct": False,
-                    "score": 0,
-                    "error_type": "unknown",
-                    "feedback": f"AI 回應格式錯誤 (Retried {retry_count} times)",
-                    "deduction": 0,
-                    "retry_count": retry_count,
-                }
-            }
-
-        result_json = result["data"]
-        error_type_str = result_json.get("error_type", "other").lower()
-        reasoning = result_json.get("reasoning", "No feedback provided")
-
-        try:
-            error_type_enum = ErrorType(error_type_str)
-        except ValueError:
-            error_type_enum = ErrorType.OTHER
-
-        deduction = calculate_score(error_type_enum)
-        final_score = max(0, 100 + deduction)
+def _score_result(result: dict) -> dict:
+    retry_count = result["retry_count"]
 
-        return {
-            "result": {
-                "is_correct": error_type_enum == ErrorType.NONE,
-                "score": final_score,
-                "error_type": error_type_enum.value,
-                "feedback": reasoning,
-                "deduction": deduction,
-                "retry_count": retry_count,
-            }
-        }
-
-    except Exception as e:
-        print(f"Unexpected error in evaluate_submission: {e}")
+    if result["error"]:
+        print(f"Failed to evaluate submission after retries. Error: {result['error']}")
         return {
             "result": {
                 "is_correct": False,
                 "score": 0,
                 "error_type": "unknown",
-                "feedback": "AI 服務發生未預期錯誤",
+                "feedback": f"AI 回應格式錯誤 (Retried {retry_count} times)",
                 "deduction": 0,
-                "retry_count": 0,
+                "retry_count": retry_count,
             }
         }
 
+    result_json = result["data"]
+    error_type_str = result_json.get("error_type", "other").lower()
+    reasoning = result_json.get("reasoning", "No feedback provided")
+
+    try:
+        error_type_enum = ErrorType(error_type_str)
+    except ValueError:
+        error_type_enum = ErrorType.OTHER
+
+    deduction = calculate_score(error_type_enum)
+    final_score = max(0, 100 + deduction)
+
+    return {
+        "result": {
+            "is_correct": error_type_enum == ErrorType.NONE,
+            "score": final_score,
+            "error_type": error_type_enum.value,
+            "feedback": reasoning,
+            "deduction": deduction,
+            "retry_count": retry_count,
+        }
+    }
+
+
+def _score_error(e: Exception) -> dict:
+    print(f"Unexpected error in evaluate_submission: {e}")
+    return {
+        "result": {
+            "is_correct": False,
+            "score": 0,
+            "error_type": "unknown",
+            "feedback": "AI 服務發生未預期錯誤",
+            "deduction": 0,
+            "retry_count": 0,
+        }
+    }
+
+
+# ---------------------------------------------------------------------------
+# Local classification — mechanical mistakes never reach the LLM
+# ---------------------------------------------------------------------------
+
+_local_stats_lock = threading.Lock()
+_local_stats = {"local": 0, "llm": 0}
+
+
+def get_local_eval_stats() -> dict:
+    """How many evaluations the local classifier decided vs. sent on to the LLM."""
+    with _local_stats_lock:
+        local, llm = _local_stats["local"], _local_stats["llm"]
+    total = local + llm
+    return {"local": local, "llm": llm, "handled_fraction": round(local / total, 3) if total else 0.0}
+
+
+def local_classify(state: EvalState) -> dict:
+    local = classify_submission(state["user_answer"], state["correct_answer"])
+    handled = local["confidence"] >= EVAL_LOCAL_MIN_CONFIDENCE
+
+    with _local_stats_lock:
+        _local_stats["local" if handled else "llm"] += 1
+
+    update: dict = {"local_result": local}
+    if handled:
+        scored = _score_result({
+            "data": {"error_type": local["error_type"].value, "reasoning": local["reasoning"]},
+            "retry_count": 0,
+            "error": None,
+        })
+        update["result"] = scored["result"]
+    return update
+
+
+# ---------------------------------------------------------------------------
+# Micro-batching — concurrent evaluations share one classification prompt
+# ---------------------------------------------------------------------------
+
+EVAL_BATCH_SYSTEM_PROMPT = EVAL_RULES + """
+    You will receive several numbered submissions. Evaluate each one independently.
+
+    Respond STRICTLY in JSON format with a single key "results": an array with exactly one
+    object per submission, in the same order, each with the keys "id", "error_type" and "reasoning".
+    Do NOT output any "thinking" or conversational text.
+
+    Example Output:
+    {
+        "results": [
+            {"id": 1, "error_type": "none", "reasoning": "答案與正確答案一致。"},
+            {"id": 2, "error_type": "particle", "reasoning": "表示目的地應使用助詞「に」，而不是「を」。"}
+        ]
+    }
+    """
+
+
+def _batch_messages(states: list[EvalState]) -> list:
+    items = "\n".join(
+        f"""
+    [{i}]
+    Question: {state["question"]}
+    Correct Answer: {state["correct_answer"]}
+    User Answer: {state["user_answer"]}"""
+        for i, state in enumerate(states, start=1)
+    )
+    return [
+        {"role": "system", "content": EVAL_BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": items},
+    ]
+
+
+def _split_batch_result(data, expected: int) -> list[dict] | None:
+    """Per-item {error_type, reasoning} dicts in submission order, or None if the reply doesn't line up."""
+    items = data.get("results") if isinstance(data, dict) else None
+    if not isinstance(items, list) or len(items) != expected:
+        return None
+    if not all(isinstance(item, dict) and "error_type" in item for item in items):
+        return None
+    # Reorder by id when the ids are exactly 1..n, otherwise trust the array order
+    try:
+        ids = sorted(int(item["id"]) for item in items)
+    except (KeyError, TypeError, ValueError):
+        return items
+    if ids == list(range(1, expected + 1)):
+        items = sorted(items, key=lambda item: int(item["id"]))
+    return items
+
+
+def _evaluate_single(state: EvalState) -> dict:
+    return query_llm_json(state["messages"], temperature=0.1, schema=EvalReply, deadline=state.get("deadline"))
+
+
+def _evaluate_each(states: list[EvalState]) -> list:
+    """One call per item, each under its own deadline; a failed call fails only its own item."""
+    # Pool threads don't inherit contextvars: each call gets its own copy of the batch's
+    context = contextvars.copy_context()
+
+    def evaluate(state: EvalState):
+        try:
+            return context.copy().run(_evaluate_single, state)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(states)) as pool:
+        return list(pool.map(evaluate, states))
+
+
+def _evaluate_batch(states: list[EvalState]) -> list:
+    """
+    MicroBatcher callback: one LLM call for the whole batch, fanned back out as
+    query_llm_json-shaped results. Falls back to one call per item if the shared
+    call fails or its reply can't be matched to its submissions.
+    """
+    if len(states) == 1:
+        return [_evaluate_single(states[0])]
+
+    # No retries here: an unusable batch reply is cheaper to recover with single calls.
+    # The shared call has to finish within the tightest deadline in the batch; if it
+    # can't, the others still get their own call under their own deadline.
+    deadlines = [state["deadline"] for state in states if state.get("deadline") is not None]
+    try:
+        batch = query_llm_json(_batch_messages(states), retries=0, temperature=0.1, schema=EvalBatchReply,
+                               deadline=min(deadlines, default=None))
+    except Exception as e:
+        print(f"Batch evaluation of {len(states)} submissions failed ({e}); falling back to single calls")
+        return _evaluate_each(states)
+    items = None if batch["error"] else _split_batch_result(batch["data"], len(states))
+    if items is None:
+        print(f"Batch evaluation of {len(states)} submissions unusable; falling back to single calls")
+        return _evaluate_each(states)
+
+    return [
+        {
+            "data": {"error_type": item["error_type"], "reasoning": item.get("reasoning", "No feedback provided")},
+            "retry_count": 0,
+            "error": None,
+        }
+        for item in items
+    ]
+
+
+_eval_batcher = MicroBatcher(
+    _evaluate_batch,
+    max_batch_size=EVAL_BATCH_MAX_SIZE,
+    max_wait_ms=EVAL_BATCH_MAX_WAIT_MS,
+    name="eval-batcher",
+)
+
+
+def call_llm_and_score(state: EvalState) -> dict:
+    try:
+        if EVAL_BATCH_ENABLED:
+            return _score_result(_eval_batcher.submit(state).result())
+        return _score_result(_evaluate_single(state))
+    except Exception as e:
+        return _score_error(e)
+
+
+async def call_llm_and_score_async(state: EvalState) -> dict:
+    # Not batched: on the event loop concurrent calls are already cheap, and the batcher's
+    # worker threads would reintroduce the per-request thread cost the async path avoids
+    try:
+        return _score_result(await query_llm_json_async(
+            state["messages"], temperature=0.1, schema=EvalReply, deadline=state.get("deadline")
+        ))
+    except Exception as e:
+        return _score_error(e)
+
 
 # ---------------------------------------------------------------------------
 # Detailed feedback graph nodes
 # ---------------------------------------------------------------------------
 
-def feedback_safety_check(state: DetailedFeedbackState) -> dict:
-    safety_result = check_safety(state["user_answer"])
+def _feedback_safety_update(safety_result: dict) -> dict:
     is_violation = safety_result.get("violation", 0) == 1
 
     update: dict = {
@@ -186,6 +415,14 @@ def feedback_safety_check(state: DetailedFeedbackState) -> dict:
     return update
 
 
+def feedback_safety_check(state: DetailedFeedbackState) -> dict:
+    return _feedback_safety_update(check_safety(state["user_answer"]))
+
+
+async def feedback_safety_check_async(state: DetailedFeedbackState) -> dict:
+    return _feedback_safety_update(await check_safety_async(state["user_answer"]))
+
+
 def build_feedback_prompt(state: DetailedFeedbackState) -> dict:
     system_prompt = """
     You are a helpful Japanese language teacher.
@@ -214,18 +451,42 @@ def build_feedback_prompt(state: DetailedFeedbackState) -> dict:
 
 
 def call_llm_feedback(state: DetailedFeedbackState) -> dict:
+    # Chunks go to the custom stream as they arrive; a plain invoke() ignores them.
+    writer = get_stream_writer()
+    chunks = []
+    try:
+        for chunk in query_llm_stream(state["messages"], temperature=0.7, deadline=state.get("deadline")):
+            chunks.append(chunk)
+            writer(chunk)
+        return {"result": "".join(chunks), "is_complete": True}
+    except Exception as e:
+        print(f"Failed to get detailed feedback. Error: {e}")
+        fallback = "抱歉，目前無法取得詳細解說。"
+        writer(f"\n\n{fallback}" if chunks else fallback)
+        return {"result": fallback, "is_complete": False}
+
+
+async def call_llm_feedback_async(state: DetailedFeedbackState) -> dict:
     try:
-        content = query_llm(state["messages"], json_mode=False, temperature=0.7)
-        return {"result": content}
+        content = await query_llm_async(
+            state["messages"], json_mode=False, temperature=0.7, deadline=state.get("deadline")
+        )
+        return {"result": content, "is_complete": True}
     except Exception as e:
         print(f"Failed to get detailed feedback. Error: {e}")
-        return {"result": "抱歉，目前無法取得詳細解說。"}
+        return {"result": "抱歉，目前無法取得詳細解說。", "is_complete": False}
 
 
 # ---------------------------------------------------------------------------
 # Conditional routing
 # ---------------------------------------------------------------------------
 
+def route_after_local(state: EvalState) -> str:
+    if "result" in state:
+        return END
+    return "safety_check"
+
+
 def route_after_safety(state: dict) -> str:
     if state.get("is_violation"):
         return END
@@ -236,13 +497,22 @@ def route_after_safety(state: dict) -> str:
 # Graph construction
 # ---------------------------------------------------------------------------
 
-def _build_eval_graph():
+def _build_eval_graph(asynchronous: bool = False):
     graph = StateGraph(EvalState)
-    graph.add_node("safety_check", eval_safety_check)
+    graph.add_node("safety_check", eval_safety_check_async if asynchronous else eval_safety_check)
     graph.add_node("build_prompt", build_eval_prompt)
-    graph.add_node("call_llm_and_score", call_llm_and_score)
-
-    graph.set_entry_point("safety_check")
+    graph.add_node("call_llm_and_score", call_llm_and_score_async if asynchronous else call_llm_and_score)
+
+    if EVAL_LOCAL_CLASSIFIER:
+        graph.add_node("local_classify", local_classify)
+        graph.set_entry_point("local_classify")
+        graph.add_conditional_edges(
+            "local_classify",
+            route_after_local,
+            {END: END, "safety_check": "safety_check"},
+        )
+    else:
+        graph.set_entry_point("safety_check")
     graph.add_conditional_edges(
         "safety_check",
         route_after_safety,
@@ -254,11 +524,11 @@ def _build_eval_graph():
     return graph.compile()
 
 
-def _build_detailed_feedback_graph():
+def _build_detailed_feedback_graph(asynchronous: bool = False):
     graph = StateGraph(DetailedFeedbackState)
-    graph.add_node("safety_check", feedback_safety_check)
+    graph.add_node("safety_check", feedback_safety_check_async if asynchronous else feedback_safety_check)
     graph.add_node("build_prompt", build_feedback_prompt)
-    graph.add_node("call_llm", call_llm_feedback)
+    graph.add_node("call_llm", call_llm_feedback_async if asynchronous else call_llm_feedback)
 
     graph.set_entry_point("safety_check")
     graph.add_conditional_edges(
@@ -275,13 +545,17 @@ def _build_detailed_feedback_graph():
 # Compile once at module load
 _eval_graph = _build_eval_graph()
 _detailed_feedback_graph = _build_detailed_feedback_graph()
+_eval_graph_async = _build_eval_graph(asynchronous=True)
+_detailed_feedback_graph_async = _build_detailed_feedback_graph(asynchronous=True)
 
 
 # ---------------------------------------------------------------------------
 # Public runner functions (drop-in replacements)
 # ---------------------------------------------------------------------------
 
-def evaluate_submission(question: str, user_answer: str, correct_answer: str) -> dict:
+def evaluate_submission(
+    question: str, user_answer: str, correct_answer: str, deadline: float | None = None
+) -> dict:
     """
     Call Server LLM to evaluate the learner's submission against the correct answer.
 
@@ -289,6 +563,7 @@ def evaluate_submission(question: str, user_answer: str, correct_answer: str) ->
         question (str): The question being asked.
         user_answer (str): The answer provided by the user.
         correct_answer (str): The correct answer for the question.
+        deadline (float, optional): time.monotonic() by which the result is needed (see deadline.py).
 
     Returns:
         dict: Evaluation results containing:
@@ -303,12 +578,16 @@ def evaluate_submission(question: str, user_answer: str, correct_answer: str) ->
         "question": question,
         "user_answer": user_answer,
         "correct_answer": correct_answer,
+        "deadline": deadline,
     }
-    final_state = _eval_graph.invoke(initial_state)
+    with default_request_class("interactive"):
+        final_state = _eval_graph.invoke(initial_state)
     return final_state["result"]
 
 
-def get_detailed_feedback(question: str, user_answer: str, correct_answer: str) -> str:
+def get_detailed_feedback(
+    question: str, user_answer: str, correct_answer: str, deadline: float | None = None
+) -> str:
     """
     Ask AI for a detailed grammatical explanation of the user's error.
 
@@ -316,6 +595,7 @@ def get_detailed_feedback(question: str, user_answer: str, correct_answer: str)
         question (str): The question context.
         user_answer (str): The user's incorrect answer.
         correct_answer (str): The correct answer.
+        deadline (float, optional): time.monotonic() by which the result is needed (see deadline.py).
 
     Returns:
         str: A detailed explanation in Traditional Chinese with Markdown formatting.
@@ -324,6 +604,87 @@ def get_detailed_feedback(question: str, user_answer: str, correct_answer: str)
         "question": question,
         "user_answer": user_answer,
         "correct_answer": correct_answer,
+        "deadline": deadline,
     }
-    final_state = _detailed_feedback_graph.invoke(initial_state)
+    with default_request_class("interactive"):
+        final_state = _detailed_feedback_graph.invoke(initial_state)
     return final_state["result"]
+
+
+def stream_detailed_feedback(
+    question: str, user_answer: str, correct_answer: str, deadline: float | None = None
+) -> Iterator[tuple[str, object]]:
+    """
+    Streaming counterpart of get_detailed_feedback().
+
+    Args:
+        question (str): The question context.
+        user_answer (str): The user's incorrect answer.
+        correct_answer (str): The correct answer.
+        deadline (float, optional): time.monotonic() by which the result is needed (see deadline.py).
+
+    Yields:
+        tuple: ("chunk", str) for each markdown fragment as the model produces it, then a single
+            ("final", dict) carrying "result" (full text) and "is_complete" (safe to persist).
+    """
+    initial_state = {
+        "question": question,
+        "user_answer": user_answer,
+        "correct_answer": correct_answer,
+        "deadline": deadline,
+    }
+    final_state: dict = {}
+    for mode, payload in _detailed_feedback_graph.stream(initial_state, stream_mode=["custom", "values"]):
+        if mode == "custom":
+            yield "chunk", payload
+        else:
+            final_state = payload
+
+    # Safety violations short-circuit before the LLM node, so nothing was streamed yet
+    if final_state.get("is_violation"):
+        yield "chunk", final_state["result"]
+
+    yield "final", {
+        "result": final_state.get("result", ""),
+        "is_complete": bool(final_state.get("is_complete")),
+    }
+
+
+async def evaluate_submission_async(
+    question: str, user_answer: str, correct_answer: str, deadline: float | None = None
+) -> dict:
+    """
+    Async variant of evaluate_submission(). Same arguments and return shape.
+    """
+    initial_state = {
+        "question": question,
+        "user_answer": user_answer,
+        "correct_answer": correct_answer,
+        "deadline": deadline,
+    }
+    with default_request_class("interactive"):
+        final_state = await _eval_graph_async.ainvoke(initial_state)
+    return final_state["result"]
+
+
+async def get_detailed_feedback_async(
+    question: str, user_answer: str, correct_answer: str, deadline: float | None = None
+) -> dict:
+    """
+    Async variant of get_detailed_feedback().
+
+    Returns:
+        dict: "result" (explanation markdown) and "is_complete" (safe to persist).
+    """
+    initial_state = {
+        "question": question,
+        "user_answer": user_answer,
+        "correct_answer": correct_answer,
+        "deadline": deadline,
+    }
+    with default_request_class("interactive"):
+        final_state = await _detailed_feedback_graph_async.ainvoke(initial_state)
+    return {
+        "result": final_state["result"],
+        "is_complete": bool(final_state.get("is_complete")),
+    }
@@ -1,19 +1,41 @@
 """
-Daily review workflow as a LangGraph StateGraph.
+Daily review workflow as LangGraph StateGraphs.
 
-Graph: fetch_mistakes →[no mistakes?]→ END
-                      →[has mistakes]→ analyze → draft → polish → END
+Two strategies (REVIEW_STRATEGY, or the `strategy` argument of the runners):
+
+  agent:  fetch_mistakes →[no mistakes?]→ END
+                         →[has mistakes]→ analyze → draft → polish → END
+
+  single: fetch_mistakes →[no mistakes?]→ END
+                         →[has mistakes]→ compose →[polish?]→ polish_review → END
+
+"single" writes the finished markdown in one structured call. Its optional polish
+pass (REVIEW_POLISH) re-sends the same byte-stable system prompt and mistake list
+as a prefix, so providers with prompt/KV caching only process the new tail.
 
 Each LLM step has graceful degradation: if a later step fails,
-the best partial output from an earlier step is returned.
+the best partial output from an earlier step is returned. With a request deadline
+in state, every step uses the time left as its timeout, and the polish passes are
+skipped (returning the draft) when less than OPTIONAL_STEP_MIN_SECONDS remain.
+Only a review that went through every step is marked `is_complete`; callers that
+store reviews (review_service.py) keep degraded results out of storage.
+
+The graphs are also compiled with async LLM nodes for generate_daily_review_agent_async().
 """
+import os
 import sqlite3
 from datetime import datetime
 from typing import TypedDict
 
 from langgraph.graph import END, StateGraph
+from pydantic import BaseModel
+
+from ai_core import query_llm, query_llm_async, query_llm_json, query_llm_json_async
+from deadline import has_time_for_optional_step
+from llm_scheduler import default_request_class
 
-from ai_core import query_llm
+REVIEW_STRATEGY = os.getenv("REVIEW_STRATEGY", "agent").lower()  # agent | single
+REVIEW_POLISH = os.getenv("REVIEW_POLISH", "false").lower() == "true"  # single strategy only
 
 # ---------------------------------------------------------------------------
 # State
@@ -23,13 +45,26 @@ class ReviewState(TypedDict, total=False):
     # Inputs
     user_id: str
     db_path: str
+    deadline: float | None  # time.monotonic() by which the request should finish (see deadline.py)
     # Intermediate
     mistakes_text: str
     has_mistakes: bool
     analysis_result: str
     draft_result: str
+    polish: bool  # single strategy: run the polish pass after compose
+    weak_points: list
     # Output
     result: str
+    is_complete: bool  # True only when result is the full review, worth storing
+
+
+# ---------------------------------------------------------------------------
+# Reply schema (single strategy)
+# ---------------------------------------------------------------------------
+
+class ReviewReply(BaseModel):
+    weak_points: list[str]
+    review_markdown: str
 
 
 # ---------------------------------------------------------------------------
@@ -74,10 +109,8 @@ def fetch_mistakes(state: ReviewState) -> dict:
     }
 
 
-def analyze(state: ReviewState) -> dict:
-    print("Agent Step 1: Analyzing patterns...")
-
-    prompt = f"""
+def _analysis_prompt(state: ReviewState) -> str:
+    return f"""
     你是日文教學專家。請分析以下學生的今日錯題，找出 2-3 個主要的弱點模式（例如：特定助詞搞混、動詞變化不熟、還是單純粗心？）。
 
     錯題列表：
@@ -86,8 +119,68 @@ def analyze(state: ReviewState) -> dict:
     請簡短列出分析結果。
     """
 
+
+def _draft_prompt(state: ReviewState) -> str:
+    return f"""
+    基於上述的分析結果，請用「溫暖、鼓勵但專業」的語氣，寫一份「今日學習總結」。
+
+    分析結果：
+    {state["analysis_result"]}
+
+    要求：
+    1. 指出今天做得好的地方（即使是錯題，也要肯定嘗試）。
+    2. 重點講解 1-2 個今天最需要改進的觀念。
+    3. 給出一個具體的建議練習方向。
+    4. 使用繁體中文。
+    """
+
+
+POLISH_PROMPT = """
+    請作為編輯，檢查上述草稿。
+    優化排版，使用 Markdown 格式（Bold, List, Quote）。
+    確保語氣像是一個貼心的 AI 助教 (Agent)。
+    開頭加上「📅 今日錯題回顧」。
+    """
+
+
+def _analyze_messages(state: ReviewState) -> list:
+    return [{"role": "user", "content": _analysis_prompt(state)}]
+
+
+def _draft_messages(state: ReviewState) -> list:
+    return [
+        {"role": "user", "content": _analysis_prompt(state)},
+        {"role": "assistant", "content": state["analysis_result"]},
+        {"role": "user", "content": _draft_prompt(state)},
+    ]
+
+
+def _polish_messages(state: ReviewState) -> list:
+    return [
+        {"role": "user", "content": _analysis_prompt(state)},
+        {"role": "assistant", "content": state["analysis_result"]},
+        {"role": "user", "content": _draft_prompt(state)},
+        {"role": "assistant", "content": state["draft_result"]},
+        {"role": "user", "content": POLISH_PROMPT},
+    ]
+
+
+def analyze(state: ReviewState) -> dict:
+    print("Agent Step 1: Analyzing patterns...")
+
     try:
-        analysis = query_llm([{"role": "user", "content": prompt}])
+        analysis = query_llm(_analyze_messages(state), deadline=state.get("deadline"))
+        return {"analysis_result": analysis}
+    except Exception as e:
+        print(f"Agent Step 1 Failed: {e}")
+        return {"analysis_result": "", "result": "無法進行分析。"}
+
+
+async def analyze_async(state: ReviewState) -> dict:
+    print("Agent Step 1: Analyzing patterns...")
+
+    try:
+        analysis = await query_llm_async(_analyze_messages(state), deadline=state.get("deadline"))
         return {"analysis_result": analysis}
     except Exception as e:
         print(f"Agent Step 1 Failed: {e}")
@@ -101,36 +194,22 @@ def draft(state: ReviewState) -> dict:
 
     print("Agent Step 2: Drafting review...")
 
-    prompt_analysis = f"""
-    你是日文教學專家。請分析以下學生的今日錯題，找出 2-3 個主要的弱點模式（例如：特定助詞搞混、動詞變化不熟、還是單純粗心？）。
-
-    錯題列表：
-    {state["mistakes_text"]}
-
-    請簡短列出分析結果。
-    """
-
-    prompt_draft = f"""
-    基於上述的分析結果，請用「溫暖、鼓勵但專業」的語氣，寫一份「今日學習總結」。
+    try:
+        draft_text = query_llm(_draft_messages(state), deadline=state.get("deadline"))
+        return {"draft_result": draft_text}
+    except Exception as e:
+        print(f"Agent Step 2 Failed: {e}")
+        return {"result": state.get("analysis_result") or "無法產生回顧。"}
 
-    分析結果：
-    {state["analysis_result"]}
 
-    要求：
-    1. 指出今天做得好的地方（即使是錯題，也要肯定嘗試）。
-    2. 重點講解 1-2 個今天最需要改進的觀念。
-    3. 給出一個具體的建議練習方向。
-    4. 使用繁體中文。
-    """
+async def draft_async(state: ReviewState) -> dict:
+    if state.get("result") and not state.get("analysis_result"):
+        return {}
 
-    messages = [
-        {"role": "user", "content": prompt_analysis},
-        {"role": "assistant", "content": state["analysis_result"]},
-        {"role": "user", "content": prompt_draft},
-    ]
+    print("Agent Step 2: Drafting review...")
 
     try:
-        draft_text = query_llm(messages)
+        draft_text = await query_llm_async(_draft_messages(state), deadline=state.get("deadline"))
         return {"draft_result": draft_text}
     except Exception as e:
         print(f"Agent Step 2 Failed: {e}")
@@ -142,51 +221,131 @@ def polish(state: ReviewState) -> dict:
     if state.get("result") and not state.get("draft_result"):
         return {}
 
+    if not has_time_for_optional_step(state.get("deadline")):
+        print("Agent Step 3: Skipped, request deadline too close")
+        return {"result": state["draft_result"], "is_complete": False}
+
     print("Agent Step 3: Polishing...")
 
-    prompt_analysis = f"""
-    你是日文教學專家。請分析以下學生的今日錯題，找出 2-3 個主要的弱點模式（例如：特定助詞搞混、動詞變化不熟、還是單純粗心？）。
+    try:
+        final = query_llm(_polish_messages(state), deadline=state.get("deadline"))
+        return {"result": final, "is_complete": True}
+    except Exception as e:
+        print(f"Agent Step 3 Failed: {e}")
+        return {"result": state.get("draft_result") or "無法優化草稿。"}
 
-    錯題列表：
-    {state["mistakes_text"]}
 
-    請簡短列出分析結果。
-    """
+async def polish_async(state: ReviewState) -> dict:
+    if state.get("result") and not state.get("draft_result"):
+        return {}
 
-    prompt_draft = f"""
-    基於上述的分析結果，請用「溫暖、鼓勵但專業」的語氣，寫一份「今日學習總結」。
+    if not has_time_for_optional_step(state.get("deadline")):
+        print("Agent Step 3: Skipped, request deadline too close")
+        return {"result": state["draft_result"], "is_complete": False}
 
-    分析結果：
-    {state["analysis_result"]}
+    print("Agent Step 3: Polishing...")
 
-    要求：
-    1. 指出今天做得好的地方（即使是錯題，也要肯定嘗試）。
-    2. 重點講解 1-2 個今天最需要改進的觀念。
-    3. 給出一個具體的建議練習方向。
-    4. 使用繁體中文。
-    """
+    try:
+        final = await query_llm_async(_polish_messages(state), deadline=state.get("deadline"))
+        return {"result": final, "is_complete": True}
+    except Exception as e:
+        print(f"Agent Step 3 Failed: {e}")
+        return {"result": state.get("draft_result") or "無法優化草稿。"}
 
-    prompt_polish = """
-    請作為編輯，檢查上述草稿。
-    優化排版，使用 Markdown 格式（Bold, List, Quote）。
-    確保語氣像是一個貼心的 AI 助教 (Agent)。
-    開頭加上「📅 今日錯題回顧」。
-    """
 
-    messages = [
-        {"role": "user", "content": prompt_analysis},
-        {"role": "assistant", "content": state["analysis_result"]},
-        {"role": "user", "content": prompt_draft},
+# ---------------------------------------------------------------------------
+# Single-pass strategy nodes
+# ---------------------------------------------------------------------------
+
+# Static, so every review request — and the polish pass — starts with the same bytes
+REVIEW_SYSTEM_PROMPT = """你是貼心又專業的日文 AI 助教 (Agent)。你會收到學生今天的錯題列表，請在一次回覆中完成分析與回顧。
+
+1. 先找出 2-3 個主要的弱點模式（例如：特定助詞搞混、動詞變化不熟、還是單純粗心？），簡短列在 "weak_points"。
+2. 再根據這些弱點，用「溫暖、鼓勵但專業」的語氣寫一份「今日學習總結」，放在 "review_markdown"：
+   - 指出今天做得好的地方（即使是錯題，也要肯定嘗試）。
+   - 重點講解 1-2 個今天最需要改進的觀念。
+   - 給出一個具體的建議練習方向。
+   - 使用繁體中文，並以 Markdown 排版（Bold, List, Quote）。
+   - 開頭加上「📅 今日錯題回顧」。
+
+只輸出 JSON：{"weak_points": ["..."], "review_markdown": "..."}"""
+
+
+def _compose_messages(state: ReviewState) -> list:
+    return [
+        {"role": "system", "content": REVIEW_SYSTEM_PROMPT},
+        {"role": "user", "content": f"錯題列表：\n{state['mistakes_text']}"},
+    ]
+
+
+def _polish_review_messages(state: ReviewState) -> list:
+    # Same prefix as compose; only the draft and the polish instruction are new
+    return _compose_messages(state) + [
         {"role": "assistant", "content": state["draft_result"]},
-        {"role": "user", "content": prompt_polish},
+        {"role": "user", "content": POLISH_PROMPT},
     ]
 
+
+def _compose_result(state: ReviewState, result: dict) -> dict:
+    if result["error"] or not result["data"].get("review_markdown"):
+        print(f"Single-pass review failed: {result['error']}")
+        return {"result": "無法產生回顧。"}
+    data = result["data"]
+    # The composed review is served as is if the polish pass fails or is skipped,
+    # but it is only complete once a requested polish pass went through
+    return {
+        "weak_points": data.get("weak_points", []),
+        "draft_result": data["review_markdown"],
+        "result": data["review_markdown"],
+        "is_complete": not state.get("polish"),
+    }
+
+
+def compose(state: ReviewState) -> dict:
+    print("Agent: Composing review in one pass...")
+
     try:
-        final = query_llm(messages)
-        return {"result": final}
+        return _compose_result(state, query_llm_json(
+            _compose_messages(state), temperature=0.7, schema=ReviewReply, deadline=state.get("deadline")
+        ))
     except Exception as e:
-        print(f"Agent Step 3 Failed: {e}")
-        return {"result": state.get("draft_result") or "無法優化草稿。"}
+        print(f"Single-pass review failed: {e}")
+        return {"result": "無法產生回顧。"}
+
+
+async def compose_async(state: ReviewState) -> dict:
+    print("Agent: Composing review in one pass...")
+
+    try:
+        result = await query_llm_json_async(
+            _compose_messages(state), temperature=0.7, schema=ReviewReply, deadline=state.get("deadline")
+        )
+        return _compose_result(state, result)
+    except Exception as e:
+        print(f"Single-pass review failed: {e}")
+        return {"result": "無法產生回顧。"}
+
+
+def polish_review(state: ReviewState) -> dict:
+    print("Agent: Polishing...")
+
+    try:
+        final = query_llm(_polish_review_messages(state), deadline=state.get("deadline"))
+        return {"result": final, "is_complete": True}
+    except Exception as e:
+        print(f"Polish pass failed: {e}")
+        return {"result": state["draft_result"]}
+
+
+async def polish_review_async(state: ReviewState) -> dict:
+    print("Agent: Polishing...")
+
+    try:
+        final = await query_llm_async(_polish_review_messages(state), deadline=state.get("deadline"))
+        return {"result": final, "is_complete": True}
+    except Exception as e:
+        print(f"Polish pass failed: {e}")
+        return {"result": state["draft_result"]}
 
 
 # ---------------------------------------------------------------------------
@@ -196,25 +355,31 @@ def polish(state: ReviewState) -> dict:
 def route_after_fetch(state: ReviewState) -> str:
     if not state.get("has_mistakes"):
         return END
-    return "analyze"
+    return "review"
+
+
+def route_after_compose(state: ReviewState) -> str:
+    if state.get("polish") and state.get("draft_result") and has_time_for_optional_step(state.get("deadline")):
+        return "polish_review"
+    return END
 
 
 # ---------------------------------------------------------------------------
 # Graph construction
 # ---------------------------------------------------------------------------
 
-def _build_review_graph():
+def _build_review_graph(asynchronous: bool = False):
     graph = StateGraph(ReviewState)
     graph.add_node("fetch_mistakes", fetch_mistakes)
-    graph.add_node("analyze", analyze)
-    graph.add_node("draft", draft)
-    graph.add_node("polish", polish)
+    graph.add_node("analyze", analyze_async if asynchronous else analyze)
+    graph.add_node("draft", draft_async if asynchronous else draft)
+    graph.add_node("polish", polish_async if asynchronous else polish)
 
     graph.set_entry_point("fetch_mistakes")
     graph.add_conditional_edges(
         "fetch_mistakes",
         route_after_fetch,
-        {END: END, "analyze": "analyze"},
+        {END: END, "review": "analyze"},
     )
     graph.add_edge("analyze", "draft")
     graph.add_edge("draft", "polish")
@@ -223,33 +388,122 @@ def _build_review_graph():
     return graph.compile()
 
 
+def _build_single_pass_review_graph(asynchronous: bool = False):
+    graph = StateGraph(ReviewState)
+    graph.add_node("fetch_mistakes", fetch_mistakes)
+    graph.add_node("compose", compose_async if asynchronous else compose)
+    graph.add_node("polish_review", polish_review_async if asynchronous else polish_review)
+
+    graph.set_entry_point("fetch_mistakes")
+    graph.add_conditional_edges(
+        "fetch_mistakes",
+        route_after_fetch,
+        {END: END, "review": "compose"},
+    )
+    graph.add_conditional_edges(
+        "compose",
+        route_after_compose,
+        {END: END, "polish_review": "polish_review"},
+    )
+    graph.add_edge("polish_review", END)
+
+    return graph.compile()
+
+
 # Compile once at module load
 _review_graph = _build_review_graph()
+_review_graph_async = _build_review_graph(asynchronous=True)
+_single_pass_review_graph = _build_single_pass_review_graph()
+_single_pass_review_graph_async = _build_single_pass_review_graph(asynchronous=True)
+
+
+def _select_review_graph(strategy: str | None, asynchronous: bool):
+    strategy = (strategy or REVIEW_STRATEGY).lower()
+    if strategy == "single":
+        return _single_pass_review_graph_async if asynchronous else _single_pass_review_graph
+    if strategy != "agent":
+        print(f"Unknown review strategy '{strategy}', using 'agent'")
+    return _review_graph_async if asynchronous else _review_graph
 
 
 # ---------------------------------------------------------------------------
-# Public runner function (drop-in replacement)
+# Public runner functions (drop-in replacements)
 # ---------------------------------------------------------------------------
 
-def generate_daily_review_agent(user_id: str, db_path: str) -> str:
+def _initial_state(user_id: str, db_path: str, polish: bool | None, deadline: float | None) -> ReviewState:
+    return {
+        "user_id": user_id,
+        "db_path": db_path,
+        "polish": REVIEW_POLISH if polish is None else polish,
+        "deadline": deadline,
+    }
+
+
+def generate_daily_review(
+    user_id: str, db_path: str, strategy: str | None = None, polish: bool | None = None,
+    deadline: float | None = None,
+) -> dict:
+    """
+    generate_daily_review_agent(), also reporting whether the review is complete.
+
+    Returns:
+        dict: "result" (review markdown) and "is_complete" (every step succeeded, so
+            the review is safe to store; False for fallbacks and skipped polish passes).
+    """
+    with default_request_class("review"):
+        final_state = _select_review_graph(strategy, asynchronous=False).invoke(
+            _initial_state(user_id, db_path, polish, deadline)
+        )
+    return {"result": final_state["result"], "is_complete": bool(final_state.get("is_complete"))}
+
+
+async def generate_daily_review_async(
+    user_id: str, db_path: str, strategy: str | None = None, polish: bool | None = None,
+    deadline: float | None = None,
+) -> dict:
+    """Async variant of generate_daily_review()."""
+    with default_request_class("review"):
+        final_state = await _select_review_graph(strategy, asynchronous=True).ainvoke(
+            _initial_state(user_id, db_path, polish, deadline)
+        )
+    return {"result": final_state["result"], "is_complete": bool(final_state.get("is_complete"))}
+
+
+def generate_daily_review_agent(
+    user_id: str, db_path: str, strategy: str | None = None, polish: bool | None = None,
+    deadline: float | None = None,
+) -> str:
     """
     Generates a daily review for the user based on their mistakes from the current day.
 
-    This function performs a 3-step agentic workflow via LangGraph:
+    With the "agent" strategy this performs a 3-step agentic workflow via LangGraph:
     1. Analysis: Analyzes the user's mistakes to identify weakness patterns.
     2. Drafting: Drafts a supportive and educational review based on the analysis.
     3. Polishing: Polishes the review to ensure a professional and encouraging tone.
 
+    The "single" strategy does analysis and writing in one structured call, optionally
+    followed by a polish pass that reuses the same prompt prefix.
+
     Args:
         user_id (str): The value of the user's ID.
         db_path (str): The path to the SQLite database.
+        strategy (str, optional): "agent" or "single". Defaults to REVIEW_STRATEGY.
+        polish (bool, optional): Run the polish pass of the "single" strategy. Defaults to REVIEW_POLISH.
+        deadline (float, optional): time.monotonic() by which the review is needed (see deadline.py).
+            Defaults to None (no deadline).
 
     Returns:
         str: The final polished daily review text in Markdown format.
     """
-    initial_state = {
-        "user_id": user_id,
-        "db_path": db_path,
-    }
-    final_state = _review_graph.invoke(initial_state)
-    return final_state["result"]
+    return generate_daily_review(user_id, db_path, strategy, polish, deadline)["result"]
+
+
+async def generate_daily_review_agent_async(
+    user_id: str, db_path: str, strategy: str | None = None, polish: bool | None = None,
+    deadline: float | None = None,
+) -> str:
+    """
+    Async variant of generate_daily_review_agent(). The SQLite fetch runs in
+    LangGraph's executor; the LLM steps are awaited.
+    """
+    return (await generate_daily_review_async(user_id, db_path, strategy, polish, deadline))["result"]
@@ -4,21 +4,72 @@ Video comprehension workflows as LangGraph StateGraphs.
 Two graphs:
   - comprehension_gen_graph: generate MCQ comprehension questions from transcript
   - comprehension_check_graph: evaluate a user's comprehension answer
+
+Question generation (COMPREHENSION_STRATEGY):
+
+  chunked: split_transcript →[fits one window]→ generate_questions → END
+                            →[longer]→ generate_candidates → select_questions → END
+
+  single:  split_transcript → generate_questions → END  (first 3000 characters only)
+
+"chunked" splits a long transcript into windows of about COMPREHENSION_WINDOW_TOKENS
+and asks for a few candidate questions per window, all windows in parallel (at most
+COMPREHENSION_MAX_WINDOWS, spread over the video). select_questions drops
+near-duplicate candidates and picks `num_questions` spread evenly across the windows,
+in video order. Each window call is smaller than the single call, so the whole
+generation takes about as long as one call.
+
+Both are also compiled with async LLM nodes for the *_async runners.
+
+With a request deadline in state, LLM calls use the time left as their timeout. The
+wrong-answer explanation falls back to naming the correct answer when the deadline is
+too close for it; check results carry is_complete=False then, so callers store only
+real explanations (see comprehension_service.py).
 """
+import asyncio
+import contextvars
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
 from typing import TypedDict
 
 from langgraph.graph import END, StateGraph
-
-from ai_core import query_llm, query_llm_json
+from pydantic import BaseModel, Field
+
+from ai_core import query_llm, query_llm_async, query_llm_json, query_llm_json_async
+from deadline import has_time_for_optional_step
+from llm_scheduler import default_request_class
+from token_budget import estimate_tokens
+
+COMPREHENSION_STRATEGY = os.getenv("COMPREHENSION_STRATEGY", "chunked").lower()  # chunked | single
+COMPREHENSION_WINDOW_TOKENS = int(os.getenv("COMPREHENSION_WINDOW_TOKENS", "3000"))
+COMPREHENSION_MAX_WINDOWS = int(os.getenv("COMPREHENSION_MAX_WINDOWS", "8"))
+# Candidates whose question texts are at least this similar count as duplicates
+COMPREHENSION_DUPLICATE_RATIO = 0.8
+# Stored question sets are keyed on this (see comprehension_service.py): bump the number
+# whenever the question prompts or the selection change, so old sets stop being served
+COMPREHENSION_PROMPT_VERSION = f"3-{COMPREHENSION_STRATEGY}"
+# Same for stored wrong-answer explanations and the explanation prompt
+COMPREHENSION_EXPLANATION_VERSION = "1"
 
 # ---------------------------------------------------------------------------
 # State definitions
 # ---------------------------------------------------------------------------
 
 class ComprehensionGenState(TypedDict, total=False):
+    # Inputs
     transcript: str
     video_title: str
     num_questions: int
+    deadline: float | None  # time.monotonic() by which the request should finish (see deadline.py)
+
+    # Chunked strategy
+    windows: list  # transcript windows, in video order
+    candidates: list  # [(window_index, question dict), ...]
+
+    # Output
     result: list  # [{question, choices, correct_index, explanation}, ...]
 
 
@@ -28,23 +79,43 @@ class ComprehensionCheckState(TypedDict, total=False):
     correct_index: int
     user_answer_index: int
     transcript_context: str
+    deadline: float | None  # time.monotonic() by which the request should finish (see deadline.py)
     result: dict  # {is_correct, feedback, score}
+    is_complete: bool  # True only when feedback is an LLM explanation worth persisting
+
+
+# ---------------------------------------------------------------------------
+# Reply schema (schema-constrained decoding where the provider supports it)
+# ---------------------------------------------------------------------------
+
+class ComprehensionQuestion(BaseModel):
+    question: str
+    choices: list[str] = Field(min_length=4, max_length=4)
+    correct_index: int = Field(ge=0, le=3)
+    explanation: str
+
+
+class ComprehensionQuestions(BaseModel):
+    questions: list[ComprehensionQuestion]
 
 
 # ---------------------------------------------------------------------------
 # Comprehension generation nodes
 # ---------------------------------------------------------------------------
 
-def generate_questions_node(state: ComprehensionGenState) -> dict:
-    num = state.get("num_questions", 5)
-    title = state.get("video_title", "")
+def _questions_prompt(state: ComprehensionGenState) -> str:
     transcript = state["transcript"]
 
-    # Truncate transcript if too long (keep ~3000 chars for context window)
-    if len(transcript) > 3000:
+    # Single strategy: truncate transcript if too long (keep ~3000 chars for context window).
+    # In chunked mode only transcripts that fit one window get here, and they are sent whole.
+    if COMPREHENSION_STRATEGY != "chunked" and len(transcript) > 3000:
         transcript = transcript[:3000] + "..."
 
-    prompt = f"""你是日語教學專家。根據以下影片字幕內容，出 {num} 題理解測驗（選擇題）。
+    return _questions_prompt_for(transcript, state.get("video_title", ""), state.get("num_questions", 5))
+
+
+def _questions_prompt_for(transcript: str, title: str, num: int, part: str = "") -> str:
+    prompt = f"""你是日語教學專家。根據以下影片字幕內容{part}，出 {num} 題理解測驗（選擇題）。
 
 影片標題：{title}
 
@@ -68,39 +139,211 @@ def generate_questions_node(state: ComprehensionGenState) -> dict:
   ]
 }}
 """
+    return prompt
+
+
+def _questions_result(result: dict) -> dict:
+    if result["data"] and "questions" in result["data"]:
+        return {"result": result["data"]["questions"]}
+    return {"result": []}
+
 
+def generate_questions_node(state: ComprehensionGenState) -> dict:
     try:
         result = query_llm_json(
-            [{"role": "user", "content": prompt}],
+            [{"role": "user", "content": _questions_prompt(state)}],
             temperature=0.5,
+            schema=ComprehensionQuestions,
+            deadline=state.get("deadline"),
         )
-        if result["data"] and "questions" in result["data"]:
-            return {"result": result["data"]["questions"]}
+        return _questions_result(result)
+    except Exception as e:
+        print(f"Comprehension generation failed: {e}")
         return {"result": []}
+
+
+async def generate_questions_node_async(state: ComprehensionGenState) -> dict:
+    try:
+        result = await query_llm_json_async(
+            [{"role": "user", "content": _questions_prompt(state)}],
+            temperature=0.5,
+            schema=ComprehensionQuestions,
+            deadline=state.get("deadline"),
+        )
+        return _questions_result(result)
     except Exception as e:
         print(f"Comprehension generation failed: {e}")
         return {"result": []}
 
 
+# ---------------------------------------------------------------------------
+# Chunked generation nodes (map: generate_candidates, reduce: select_questions)
+# ---------------------------------------------------------------------------
+
+# Split after sentence enders and the spaces between caption segments
+_WINDOW_BREAK = re.compile(r"(?<=[。？！?!\s])")
+
+
+def _split_windows(transcript: str, budget: int) -> list[str]:
+    """Split `transcript` into windows of at most ~`budget` tokens, breaking between sentences or segments."""
+    windows = []
+    current = []
+    current_tokens = 0
+    for piece in _WINDOW_BREAK.split(transcript):
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > budget:
+            windows.append("".join(current).strip())
+            current, current_tokens = [], 0
+        # A single run-on piece longer than a window is cut by characters
+        while tokens > budget:
+            cut = max(1, len(piece) * budget // tokens)
+            windows.append(piece[:cut].strip())
+            piece = piece[cut:]
+            tokens = estimate_tokens(piece)
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        windows.append("".join(current).strip())
+    return [w for w in windows if w]
+
+
+def _spread(items: list, count: int) -> list:
+    """`count` items evenly spaced over `items` (all of them if there are no more than `count`)."""
+    if len(items) <= count:
+        return items
+    return [items[int((i + 0.5) * len(items) / count)] for i in range(count)]
+
+
+def split_transcript_node(state: ComprehensionGenState) -> dict:
+    if COMPREHENSION_STRATEGY != "chunked":
+        return {"windows": [state["transcript"]]}
+    windows = _split_windows(state["transcript"], COMPREHENSION_WINDOW_TOKENS)
+    # Bound cost and fan-out for very long videos: windows spread over the whole video
+    return {"windows": _spread(windows, COMPREHENSION_MAX_WINDOWS)}
+
+
+def _window_requests(state: ComprehensionGenState) -> list[tuple[int, str]]:
+    """(window index, prompt) per window. Asks each window for a few more than its share."""
+    windows = state["windows"]
+    per_window = math.ceil(state.get("num_questions", 5) / len(windows)) + 1
+    title = state.get("video_title", "")
+    return [
+        (i, _questions_prompt_for(window, title, per_window, part=f"（第 {i + 1}/{len(windows)} 段）"))
+        for i, window in enumerate(windows)
+    ]
+
+
+def _is_valid_question(q) -> bool:
+    return (
+        isinstance(q, dict) and isinstance(q.get("question"), str) and q["question"].strip()
+        and isinstance(q.get("choices"), list) and len(q["choices"]) == 4
+        and isinstance(q.get("correct_index"), int) and 0 <= q["correct_index"] < 4
+    )
+
+
+def _window_candidates(index: int, result: dict) -> list:
+    questions = (result.get("data") or {}).get("questions") or []
+    return [(index, q) for q in questions if _is_valid_question(q)]
+
+
+def _generate_window(index: int, prompt: str, deadline: float | None) -> list:
+    try:
+        result = query_llm_json([{"role": "user", "content": prompt}], temperature=0.5,
+                                schema=ComprehensionQuestions, deadline=deadline)
+        return _window_candidates(index, result)
+    except Exception as e:
+        print(f"Comprehension generation failed for window {index}: {e}")
+        return []
+
+
+async def _generate_window_async(index: int, prompt: str, deadline: float | None) -> list:
+    try:
+        result = await query_llm_json_async([{"role": "user", "content": prompt}], temperature=0.5,
+                                            schema=ComprehensionQuestions, deadline=deadline)
+        return _window_candidates(index, result)
+    except Exception as e:
+        print(f"Comprehension generation failed for window {index}: {e}")
+        return []
+
+
+def generate_candidates_node(state: ComprehensionGenState) -> dict:
+    requests = _window_requests(state)
+    with ThreadPoolExecutor(max_workers=len(requests), thread_name_prefix="comprehension") as pool:
+        # Each call runs in a copy of this context, so the request class applies to it
+        futures = [
+            pool.submit(contextvars.copy_context().run, _generate_window, index, prompt, state.get("deadline"))
+            for index, prompt in requests
+        ]
+        return {"candidates": [c for future in futures for c in future.result()]}
+
+
+async def generate_candidates_node_async(state: ComprehensionGenState) -> dict:
+    results = await asyncio.gather(*(
+        _generate_window_async(index, prompt, state.get("deadline")) for index, prompt in _window_requests(state)
+    ))
+    return {"candidates": [c for window in results for c in window]}
+
+
+def _normalize_question(text: str) -> str:
+    return re.sub(r"[\s、。？！?!「」]", "", text)
+
+
+def _is_duplicate(question: str, kept: list[str]) -> bool:
+    return any(
+        question == other or SequenceMatcher(None, question, other).ratio() >= COMPREHENSION_DUPLICATE_RATIO
+        for other in kept
+    )
+
+
+def select_questions_node(state: ComprehensionGenState) -> dict:
+    num = state.get("num_questions", 5)
+
+    # Dedupe, keeping the first occurrence (candidates are in video order)
+    by_window: dict[int, list] = {}
+    kept: list[str] = []
+    for index, q in state.get("candidates") or []:
+        normalized = _normalize_question(q["question"])
+        if _is_duplicate(normalized, kept):
+            continue
+        kept.append(normalized)
+        by_window.setdefault(index, []).append(q)
+
+    # Spread over the video: slot i draws from the window at the same relative
+    # position, or the nearest window that still has candidates
+    window_count = len(state.get("windows") or [None])
+    picked = []
+    for i in range(min(num, len(kept))):
+        target = int((i + 0.5) * window_count / num)
+        index = min((w for w in by_window if by_window[w]), key=lambda w: (abs(w - target), w))
+        picked.append((index, by_window[index].pop(0)))
+
+    picked.sort(key=lambda item: item[0])
+    return {"result": [q for _, q in picked]}
+
+
+def route_after_split(state: ComprehensionGenState) -> str:
+    return "generate_candidates" if len(state["windows"]) > 1 else "generate_questions"
+
+
 # ---------------------------------------------------------------------------
 # Comprehension check nodes
 # ---------------------------------------------------------------------------
 
-def check_answer_node(state: ComprehensionCheckState) -> dict:
-    correct_idx = state["correct_index"]
-    user_idx = state["user_answer_index"]
-    is_correct = correct_idx == user_idx
+def _correct_result() -> dict:
+    return {
+        "result": {
+            "is_correct": True,
+            "feedback": "正確！",
+            "score": 100,
+        },
+        "is_complete": False,
+    }
 
-    if is_correct:
-        return {
-            "result": {
-                "is_correct": True,
-                "feedback": "正確！",
-                "score": 100,
-            }
-        }
 
-    # Wrong answer — generate brief explanation
+def _wrong_answer_prompt(state: ComprehensionCheckState) -> tuple[str, str]:
+    """Return (prompt, correct_answer) for explaining a wrong answer."""
+    correct_idx = state["correct_index"]
+    user_idx = state["user_answer_index"]
     question = state["question"]
     choices = state["choices"]
     correct_answer = choices[correct_idx] if correct_idx < len(choices) else ""
@@ -114,39 +357,87 @@ def check_answer_node(state: ComprehensionCheckState) -> dict:
 正確答案：{correct_answer}
 相關字幕段落：{context[:500]}
 """
+    return prompt, correct_answer
 
-    try:
-        feedback = query_llm(
-            [{"role": "user", "content": prompt}],
-            temperature=0.3,
-        )
-    except Exception:
-        feedback = f"正確答案是：{correct_answer}"
 
+def _wrong_result(feedback: str, is_complete: bool = False) -> dict:
     return {
         "result": {
             "is_correct": False,
             "feedback": feedback,
             "score": 0,
-        }
+        },
+        "is_complete": is_complete,
     }
 
 
+def check_answer_node(state: ComprehensionCheckState) -> dict:
+    if state["correct_index"] == state["user_answer_index"]:
+        return _correct_result()
+
+    # Wrong answer — generate brief explanation
+    prompt, correct_answer = _wrong_answer_prompt(state)
+    if not has_time_for_optional_step(state.get("deadline")):
+        return _wrong_result(f"正確答案是：{correct_answer}")
+
+    try:
+        feedback = query_llm(
+            [{"role": "user", "content": prompt}],
+            temperature=0.3,
+            deadline=state.get("deadline"),
+        )
+    except Exception:
+        return _wrong_result(f"正確答案是：{correct_answer}")
+
+    return _wrong_result(feedback, is_complete=True)
+
+
+async def check_answer_node_async(state: ComprehensionCheckState) -> dict:
+    if state["correct_index"] == state["user_answer_index"]:
+        return _correct_result()
+
+    prompt, correct_answer = _wrong_answer_prompt(state)
+    if not has_time_for_optional_step(state.get("deadline")):
+        return _wrong_result(f"正確答案是：{correct_answer}")
+
+    try:
+        feedback = await query_llm_async(
+            [{"role": "user", "content": prompt}],
+            temperature=0.3,
+            deadline=state.get("deadline"),
+        )
+    except Exception:
+        return _wrong_result(f"正確答案是：{correct_answer}")
+
+    return _wrong_result(feedback, is_complete=True)
+
+
 # ---------------------------------------------------------------------------
 # Graph construction
 # ---------------------------------------------------------------------------
 
-def _build_comprehension_gen_graph():
+def _build_comprehension_gen_graph(asynchronous: bool = False):
     graph = StateGraph(ComprehensionGenState)
-    graph.add_node("generate_questions", generate_questions_node)
-    graph.set_entry_point("generate_questions")
+    graph.add_node("split_transcript", split_transcript_node)
+    graph.add_node("generate_questions", generate_questions_node_async if asynchronous else generate_questions_node)
+    graph.add_node("generate_candidates",
+                   generate_candidates_node_async if asynchronous else generate_candidates_node)
+    graph.add_node("select_questions", select_questions_node)
+    graph.set_entry_point("split_transcript")
+    graph.add_conditional_edges(
+        "split_transcript",
+        route_after_split,
+        {"generate_questions": "generate_questions", "generate_candidates": "generate_candidates"},
+    )
     graph.add_edge("generate_questions", END)
+    graph.add_edge("generate_candidates", "select_questions")
+    graph.add_edge("select_questions", END)
     return graph.compile()
 
 
-def _build_comprehension_check_graph():
+def _build_comprehension_check_graph(asynchronous: bool = False):
     graph = StateGraph(ComprehensionCheckState)
-    graph.add_node("check_answer", check_answer_node)
+    graph.add_node("check_answer", check_answer_node_async if asynchronous else check_answer_node)
     graph.set_entry_point("check_answer")
     graph.add_edge("check_answer", END)
     return graph.compile()
@@ -155,23 +446,31 @@ def _build_comprehension_check_graph():
 # Compile once at module load
 _comprehension_gen_graph = _build_comprehension_gen_graph()
 _comprehension_check_graph = _build_comprehension_check_graph()
+_comprehension_gen_graph_async = _build_comprehension_gen_graph(asynchronous=True)
+_comprehension_check_graph_async = _build_comprehension_check_graph(asynchronous=True)
 
 
 # ---------------------------------------------------------------------------
 # Public runner functions
 # ---------------------------------------------------------------------------
 
-def generate_comprehension_questions(transcript: str, title: str = "", num_questions: int = 5) -> list:
+def generate_comprehension_questions(
+    transcript: str, title: str = "", num_questions: int = 5, deadline: float | None = None
+) -> list:
     """Generate MCQ comprehension questions from a video transcript.
 
+    `deadline` is the time.monotonic() by which the questions are needed (see deadline.py).
+
     Returns list of dicts: [{question, choices, correct_index, explanation}, ...]
     """
     state = {
         "transcript": transcript,
         "video_title": title,
         "num_questions": num_questions,
+        "deadline": deadline,
     }
-    final = _comprehension_gen_graph.invoke(state)
+    with default_request_class("generation"):
+        final = _comprehension_gen_graph.invoke(state)
     return final["result"]
 
 
@@ -181,10 +480,12 @@ def check_comprehension_answer(
     correct_index: int,
     user_answer_index: int,
     transcript_context: str = "",
+    deadline: float | None = None,
 ) -> dict:
     """Check a comprehension answer and generate feedback if wrong.
 
-    Returns dict: {is_correct, feedback, score}
+    Returns dict: {is_correct, feedback, score, is_complete}. is_complete is True only
+    when feedback is an LLM explanation (not the fallback), i.e. safe to persist.
     """
     state = {
         "question": question,
@@ -192,6 +493,45 @@ def check_comprehension_answer(
         "correct_index": correct_index,
         "user_answer_index": user_answer_index,
         "transcript_context": transcript_context,
+        "deadline": deadline,
+    }
+    with default_request_class("interactive"):
+        final = _comprehension_check_graph.invoke(state)
+    return {**final["result"], "is_complete": bool(final.get("is_complete"))}
+
+
+async def generate_comprehension_questions_async(
+    transcript: str, title: str = "", num_questions: int = 5, deadline: float | None = None
+) -> list:
+    """Async variant of generate_comprehension_questions()."""
+    state = {
+        "transcript": transcript,
+        "video_title": title,
+        "num_questions": num_questions,
+        "deadline": deadline,
     }
-    final = _comprehension_check_graph.invoke(state)
+    with default_request_class("generation"):
+        final = await _comprehension_gen_graph_async.ainvoke(state)
     return final["result"]
+
+
+async def check_comprehension_answer_async(
+    question: str,
+    choices: list,
+    correct_index: int,
+    user_answer_index: int,
+    transcript_context: str = "",
+    deadline: float | None = None,
+) -> dict:
+    """Async variant of check_comprehension_answer()."""
+    state = {
+        "question": question,
+        "choices": choices,
+        "correct_index": correct_index,
+        "user_answer_index": user_answer_index,
+        "transcript_context": transcript_context,
+        "deadline": deadline,
+    }
+    with default_request_class("interactive"):
+        final = await _comprehension_check_graph_async.ainvoke(state)
+    return {**final["result"], "is_complete": bool(final.get("is_complete"))}
@@ -0,0 +1,190 @@
+"""
+Shared HTTP connection pools for outbound service clients.
+
+Every call to a module-level `requests.post` opens a fresh TCP (and TLS) connection.
+This module hands out long-lived, keep-alive sessions instead, one per named client,
+all tuned from the same environment variables:
+
+  HTTP_POOL_CONNECTIONS  — number of distinct hosts whose pools are kept (default 10)
+  HTTP_POOL_MAXSIZE      — max connections kept open per host (default 32)
+  HTTP_POOL_BLOCK        — "true" to wait for a free connection instead of opening
+                           an extra, non-pooled one once a host hits the limit (default false)
+  HTTP_KEEPALIVE_EXPIRY  — seconds an idle connection is kept / TCP keep-alive idle time (default 60)
+  HTTP_MAX_RETRIES       — connect-level retries with backoff; a request is never re-sent
+                           once it reached the server, not even on a 5xx (default 2)
+
+Public API:
+  - get_session(name)        — shared requests.Session for a named client (thread-safe)
+  - mount_pool(session)      — install the pooled/retrying adapter on an existing session
+  - build_httpx_client()     — httpx.Client with the same limits, for OpenAI SDK clients
+  - get_async_client(name)   — shared httpx.AsyncClient for the running event loop
+  - loop_local(name, factory) — any object cached per running event loop
+"""
+import asyncio
+import os
+import socket
+import threading
+import weakref
+from collections.abc import Callable
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+load_dotenv()
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "false").lower() == "true"
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+
+
+def _keepalive_socket_options() -> list:
+    """TCP keep-alive probes so idle pooled connections survive NAT/load-balancer timeouts."""
+    options = list(HTTPConnection.default_socket_options)  # keeps urllib3's TCP_NODELAY
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    idle = max(1, int(HTTP_KEEPALIVE_EXPIRY))
+    # Linux/macOS expose different knob names; set whichever exists
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    elif hasattr(socket, "TCP_KEEPALIVE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10))
+    return options
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter that enables TCP keep-alive on every pooled connection."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault("socket_options", _keepalive_socket_options())
+        super().init_poolmanager(*args, **kwargs)
+
+
+def mount_pool(
+    session: requests.Session,
+    pool_connections: int | None = None,
+    pool_maxsize: int | None = None,
+    pool_block: bool | None = None,
+    max_retries: int | None = None,
+) -> requests.Session:
+    """
+    Install the pooled, keep-alive adapter on both schemes of an existing session.
+
+    Args:
+        session (requests.Session): Session to configure (e.g. google-auth's AuthorizedSession).
+        pool_connections (int, optional): Host pools to cache. Defaults to HTTP_POOL_CONNECTIONS.
+        pool_maxsize (int, optional): Connections kept per host. Defaults to HTTP_POOL_MAXSIZE.
+        pool_block (bool, optional): Block when a host's pool is exhausted. Defaults to HTTP_POOL_BLOCK.
+        max_retries (int, optional): Connect retries. Defaults to HTTP_MAX_RETRIES.
+
+    Returns:
+        requests.Session: The same session, for chaining.
+    """
+    retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+    # Only failed connects are retried here: nothing reached the server yet. A 5xx or a
+    # read error after the body was sent is left to the caller (the LLM router retries
+    # those within its retry budget), so retries don't multiply across layers.
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,  # never repeat a generation the server may already be running
+        status=0,
+        backoff_factor=0.2,
+        raise_on_status=False,
+    )
+    adapter = KeepAliveAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS if pool_connections is None else pool_connections,
+        pool_maxsize=HTTP_POOL_MAXSIZE if pool_maxsize is None else pool_maxsize,
+        pool_block=HTTP_POOL_BLOCK if pool_block is None else pool_block,
+        max_retries=retry,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(name: str = "default") -> requests.Session:
+    """
+    Return the shared session for a named client, creating it on first use.
+
+    requests.Session is safe to share across threads for issuing requests: the
+    underlying urllib3 pools hand each thread its own connection. Only creation
+    needs the lock.
+    """
+    session = _sessions.get(name)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = mount_pool(requests.Session())
+            _sessions[name] = session
+    return session
+
+
+def build_httpx_client(
+    max_connections: int | None = None,
+    max_keepalive_connections: int | None = None,
+    keepalive_expiry: float | None = None,
+) -> httpx.Client:
+    """
+    Build an httpx.Client with the shared pool limits, for OpenAI SDK clients
+    (pass as `http_client=`).
+
+    Returns:
+        httpx.Client: Client with pooled keep-alive connections.
+    """
+    maxsize = HTTP_POOL_MAXSIZE if max_connections is None else max_connections
+    limits = httpx.Limits(
+        max_connections=maxsize,
+        max_keepalive_connections=maxsize if max_keepalive_connections is None else max_keepalive_connections,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY if keepalive_expiry is None else keepalive_expiry,
+    )
+    # HTTPTransport retries only cover failed connects, never a delivered request
+    transport = httpx.HTTPTransport(limits=limits, retries=HTTP_MAX_RETRIES)
+    return httpx.Client(transport=transport, follow_redirects=True)
+
+
+def build_async_httpx_client() -> httpx.AsyncClient:
+    """Async counterpart of build_httpx_client(), with the same pool limits."""
+    limits = httpx.Limits(
+        max_connections=HTTP_POOL_MAXSIZE,
+        max_keepalive_connections=HTTP_POOL_MAXSIZE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    transport = httpx.AsyncHTTPTransport(limits=limits, retries=HTTP_MAX_RETRIES)
+    return httpx.AsyncClient(transport=transport, follow_redirects=True)
+
+
+# Async connections belong to the event loop that opened them, so async clients are
+# cached per loop rather than per process. Entries vanish when their loop is collected.
+_loop_locals: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def loop_local(name: str, factory: Callable[[], object]):
+    """
+    Return the object cached under `name` for the running event loop, creating it with `factory`.
+
+    Must be called from inside a coroutine. No lock is needed: a loop runs on one thread.
+    """
+    loop = asyncio.get_running_loop()
+    objects = _loop_locals.setdefault(loop, {})
+    if name not in objects:
+        objects[name] = factory()
+    return objects[name]
+
+
+def get_async_client(name: str = "default") -> httpx.AsyncClient:
+    """Return the shared httpx.AsyncClient for a named client on the running event loop."""
+    return loop_local(f"httpx:{name}", build_async_httpx_client)
@@ -0,0 +1,157 @@
+"""
+Tolerant JSON repair for LLM output.
+
+Models asked for "JSON only" still wrap it in chatter, leave trailing commas,
+use Python-style quotes and literals, or get cut off mid-string. Re-asking costs
+a full generation; most of these replies are one mechanical fix away from valid.
+
+repair_json() makes a single left-to-right pass over the reply, copying the first
+JSON object (or array) while fixing what it meets:
+
+  - leading / trailing chatter and ``` fences   -> ignored
+  - 'single quoted' strings                     -> "double quoted"
+  - raw newlines / control chars inside strings -> escaped
+  - trailing commas before } or ]               -> dropped
+  - unquoted keys, True / False / None          -> "quoted", true / false / null
+  - mismatched closers                          -> the expected one
+  - truncated output                            -> open string closed, incomplete
+                                                   trailing member dropped, open
+                                                   containers closed
+
+Public API:
+  - repair_json(text) -> dict | list   (raises ValueError when nothing usable is found)
+"""
+import json
+
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_BARE_CHARS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.+-")
+_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def _strip_trailing_comma(out: list[str]):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _closed(out: list[str], stack: list[str]) -> str:
+    tail = list(out)
+    _strip_trailing_comma(tail)
+    if tail and tail[-1] == ":":
+        tail.pop()
+    return "".join(tail) + "".join(reversed(stack))
+
+
+def _next_significant(text: str, i: int) -> str:
+    while i < len(text) and text[i].isspace():
+        i += 1
+    return text[i] if i < len(text) else ""
+
+
+def repair_json(text: str):
+    """
+    Extract and repair the first JSON object (or array, if there is no object) in `text`.
+
+    Args:
+        text (str): Raw LLM reply.
+
+    Returns:
+        dict | list: The parsed value.
+
+    Raises:
+        ValueError: If no JSON container is present or the repaired text still doesn't parse.
+    """
+    start = text.find("{")
+    if start < 0:
+        start = text.find("[")
+    if start < 0:
+        raise ValueError("No JSON object found")
+
+    out: list[str] = []
+    stack: list[str] = []
+    # (len(out), open containers) at each point where the text so far is a complete prefix;
+    # used to drop a cut-off trailing member when the output was truncated
+    cut_points: list[tuple[int, list[str]]] = []
+    quote = ""
+    i, n = start, len(text)
+
+    while i < n:
+        ch = text[i]
+
+        if quote:
+            if ch == "\\":
+                if i + 1 < n:
+                    nxt = text[i + 1]
+                    # \' is valid in Python-style strings but not in JSON
+                    out.append("'" if nxt == "'" else ch + nxt)
+                i += 2
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = ""
+            elif ch == '"':
+                out.append('\\"')
+            elif ch in _ESCAPES:
+                out.append(_ESCAPES[ch])
+            elif ch < " ":
+                out.append(f"\\u{ord(ch):04x}")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            cut_points.append((len(out), list(stack)))
+        elif ch in "}]":
+            if ch in stack:
+                _strip_trailing_comma(out)
+                # Close anything left open inside, e.g. the ] in {"a": [1, 2}
+                while stack:
+                    closer = stack.pop()
+                    out.append(closer)
+                    if closer == ch:
+                        break
+                if not stack:
+                    break  # anything after the top-level value is chatter
+        elif ch == ",":
+            cut_points.append((len(out), list(stack)))
+            out.append(ch)
+        elif ch in _BARE_CHARS:
+            j = i
+            while j < n and text[j] in _BARE_CHARS:
+                j += 1
+            word = text[i:j]
+            if _next_significant(text, j) == ":":
+                out.append(json.dumps(word))  # unquoted key
+            elif word in _PY_LITERALS:
+                out.append(_PY_LITERALS[word])
+            else:
+                out.append(word)
+            i = j
+            continue
+        elif ch.isspace() or ch == ":":
+            out.append(ch)
+        # Anything else outside a string (stray prose, backticks) is dropped
+        i += 1
+
+    if not stack:
+        return json.loads("".join(out))
+
+    # Truncated: close the open string and containers, keeping as much as still parses
+    if quote:
+        out.append('"')
+    candidates = [_closed(out, stack)]
+    candidates += [_closed(out[:length], open_stack) for length, open_stack in reversed(cut_points)]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+
+    raise ValueError("Could not repair JSON")
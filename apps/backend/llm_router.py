@@ -0,0 +1,298 @@
+"""
+LLM endpoint router — spreads model calls over several backends and routes around failures.
+
+Each request goes to the eligible endpoint with the fewest requests in flight
+(least-outstanding-requests); ties go to the one that has served fewer calls.
+An endpoint is eligible when it is below its concurrency cap and its circuit breaker
+(see resilience.py) is not open. When every endpoint is at its cap, callers wait for
+a slot.
+
+Health is tracked passively from real traffic: consecutive endpoint failures
+(connection errors, timeouts, 5xx / 429, as decided by the caller's `is_failure`)
+or slow calls open the endpoint's breaker, taking it out of rotation. After the open
+period it is re-admitted half-open: one trial request at a time, and the first success
+fully restores it. If every endpoint's breaker is open, calls fail fast with
+CircuitOpenError instead of queueing behind a dead backend.
+
+Endpoint failures are retried with jittered exponential backoff, preferring an
+endpoint not tried yet, as long as the shared retry budget allows.
+
+Each endpoint also tracks its recent latencies per call kind (the caller's request
+class, e.g. short interactive checks vs. long background generations), and
+timeout_for(endpoint, kind) derives the request timeout from that kind's window (see
+LatencyTracker), so a run of short calls doesn't shrink the timeout of long ones.
+Kinds in `long_call_kinds` are legitimately slow: their durations never count as
+slow calls against the breaker.
+
+All calls accept an optional `deadline` (a time.monotonic() value): waiting for a slot
+and retrying stop there.
+
+Public API:
+  - LLMEndpoint(name, provider, base_url, model, ...)  — one backend, its breaker and counters
+  - LLMRouter.call(fn, deadline, kind, avoid) / call_async(...) — run fn(endpoint) with balancing and retries
+  - LLMRouter.endpoint(deadline)                       — context manager holding a slot (for streaming)
+  - LLMRouter.timeout_for(endpoint, kind)              — adaptive request timeout in seconds
+  - LLMRouter.stats()                                  — per-endpoint counters and health
+"""
+import asyncio
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import contextmanager
+from typing import Any
+
+from resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, RetryBudget, backoff_delay
+
+
+class NoEndpointAvailable(RuntimeError):
+    """Raised when no endpoint slot frees up within the acquire timeout."""
+
+
+class LLMEndpoint:
+    """One model backend. Counters are maintained by the router under its lock."""
+
+    def __init__(self, name: str, provider: str, base_url: str | None, model: str,
+                 api_key: str = "", max_concurrency: int = 0, client: Any = None):
+        self.name = name
+        self.provider = provider
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency  # 0 = unlimited
+        self.client = client  # provider SDK client, if the provider uses one
+
+        self.outstanding = 0
+        self.calls = 0
+        self.failures = 0
+        self.breaker: CircuitBreaker | None = None  # set by the router
+        self.latency: dict[str, LatencyTracker] = {}  # per call kind, filled by the router
+
+
+class LLMRouter:
+    """Least-outstanding-requests balancer with per-endpoint caps, breakers and adaptive timeouts."""
+
+    def __init__(self, endpoints: list[LLMEndpoint], is_failure: Callable[[Exception], bool],
+                 failure_threshold: int = 5, open_seconds: float = 10.0, max_open_seconds: float = 300.0,
+                 slow_call_seconds: float | None = None, timeout: float = 120.0, timeout_floor: float = 10.0,
+                 adaptive_timeout: bool = True, long_call_kinds: tuple[str, ...] = (), max_retries: int = 2,
+                 retry_budget_ratio: float = 0.2, backoff_base: float = 0.25, backoff_cap: float = 4.0):
+        if not endpoints:
+            raise ValueError("LLMRouter needs at least one endpoint")
+        self._endpoints = endpoints
+        self._is_failure = is_failure
+        self._timeout = timeout
+        self._timeout_floor = timeout_floor
+        self._adaptive_timeout = adaptive_timeout
+        self._long_call_kinds = frozenset(long_call_kinds)
+        self._max_retries = max_retries
+        self._retry_budget = RetryBudget(ratio=retry_budget_ratio)
+        self._backoff_base = backoff_base
+        self._backoff_cap = backoff_cap
+        self._retries = 0
+        self._cond = threading.Condition()
+        for ep in endpoints:
+            ep.breaker = CircuitBreaker(f"llm:{ep.name}", failure_threshold, open_seconds, max_open_seconds,
+                                        slow_call_seconds)
+
+    @property
+    def endpoints(self) -> list[LLMEndpoint]:
+        return list(self._endpoints)
+
+    def _latency(self, ep: LLMEndpoint, kind: str) -> LatencyTracker:
+        with self._cond:
+            tracker = ep.latency.get(kind)
+            if tracker is None:
+                tracker = ep.latency[kind] = LatencyTracker(floor=self._timeout_floor, ceiling=self._timeout)
+            return tracker
+
+    def timeout_for(self, ep: LLMEndpoint, kind: str = "default") -> float:
+        """Request timeout for this kind of call: adaptive from its recent latencies, or the fixed ceiling."""
+        return self._latency(ep, kind).timeout() if self._adaptive_timeout else self._timeout
+
+    # -- slot management (callers hold self._cond) ---------------------------
+
+    def _candidates(self, pool: list[LLMEndpoint]) -> list[LLMEndpoint]:
+        candidates = []
+        for ep in pool:
+            state = ep.breaker.state
+            if state == CircuitBreaker.OPEN:
+                continue
+            # Half-open: one trial request at a time
+            capacity = 1 if state == CircuitBreaker.HALF_OPEN else ep.max_concurrency or 1 << 30
+            if ep.outstanding < capacity:
+                candidates.append(ep)
+        return candidates
+
+    def _try_acquire(self, exclude: list[LLMEndpoint]) -> LLMEndpoint | None:
+        untried = [ep for ep in self._endpoints if ep not in exclude]
+        candidates = self._candidates(untried) or self._candidates(self._endpoints)
+        if not candidates:
+            if all(ep.breaker.state == CircuitBreaker.OPEN for ep in self._endpoints):
+                raise CircuitOpenError("LLM service temporarily unavailable (all endpoints' circuits open)")
+            return None
+        ep = min(candidates, key=lambda ep: (ep.outstanding, ep.calls))
+        ep.outstanding += 1
+        ep.calls += 1
+        return ep
+
+    def _release(self, ep: LLMEndpoint, error: Exception | None, elapsed: float | None = None,
+                 kind: str = "default"):
+        failed = error is not None and self._is_failure(error)
+        if error is None and elapsed is not None:
+            self._latency(ep, kind).record(elapsed)
+        # A request error (e.g. a 400) still shows the endpoint is up. The caller's own
+        # deadline running out (TimeoutError) says nothing either way, and neither does
+        # a long generation taking long.
+        if not isinstance(error, TimeoutError):
+            slow_call_elapsed = elapsed if error is None and kind not in self._long_call_kinds else None
+            ep.breaker.record(slow_call_elapsed, failed)
+        with self._cond:
+            ep.outstanding -= 1
+            if failed:
+                ep.failures += 1
+            self._cond.notify_all()
+
+    def _acquire_deadline(self, deadline: float | None) -> float:
+        limit = time.monotonic() + self._timeout
+        return limit if deadline is None else min(limit, deadline)
+
+    def acquire(self, exclude: list[LLMEndpoint] | None = None, deadline: float | None = None) -> LLMEndpoint:
+        """Reserve a slot on the best endpoint, waiting while all are at their caps."""
+        deadline = self._acquire_deadline(deadline)
+        with self._cond:
+            while True:
+                ep = self._try_acquire(exclude or [])
+                if ep is not None:
+                    return ep
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise NoEndpointAvailable("No LLM endpoint slot before the deadline")
+                # Short waits so breakers turning half-open are noticed without a release
+                self._cond.wait(timeout=min(remaining, 0.1))
+
+    async def acquire_async(self, exclude: list[LLMEndpoint] | None = None,
+                            deadline: float | None = None) -> LLMEndpoint:
+        """Async acquire(): polls instead of blocking the event loop on the condition."""
+        deadline = self._acquire_deadline(deadline)
+        delay = 0.002
+        while True:
+            with self._cond:
+                ep = self._try_acquire(exclude or [])
+            if ep is not None:
+                return ep
+            if time.monotonic() >= deadline:
+                raise NoEndpointAvailable("No LLM endpoint slot before the deadline")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    # -- calling ---------------------------------------------------------------
+
+    def _retry_delay(self, ep: LLMEndpoint, error: Exception, attempt: int, deadline: float | None) -> float | None:
+        """Backoff before the next attempt, or None if this error shouldn't be retried."""
+        if not self._is_failure(error) or attempt > self._max_retries:
+            return None
+        delay = backoff_delay(attempt, self._backoff_base, self._backoff_cap)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        if not self._retry_budget.try_spend():
+            return None
+        with self._cond:
+            self._retries += 1
+        print(f"LLM endpoint {ep.name} failed ({error}); retry {attempt} in {delay:.2f}s")
+        return delay
+
+    def call(self, fn: Callable[[LLMEndpoint], Any], deadline: float | None = None, kind: str = "default",
+             avoid: list[LLMEndpoint] | None = None) -> Any:
+        """
+        Run fn(endpoint) on the best endpoint, retrying endpoint failures within the retry budget.
+        `kind` selects the latency window the call's duration is recorded in; endpoints in
+        `avoid` are only used when no other one is available.
+        """
+        self._retry_budget.deposit()
+        tried: list[LLMEndpoint] = list(avoid or [])
+        attempts = 0
+        while True:
+            ep = self.acquire(exclude=tried, deadline=deadline)
+            start = time.monotonic()
+            try:
+                result = fn(ep)
+            except Exception as e:
+                self._release(ep, e)
+                tried.append(ep)
+                attempts += 1
+                delay = self._retry_delay(ep, e, attempts, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled or interrupted: not the endpoint's fault, but its slot must be freed
+                self._release(ep, None)
+                raise
+            self._release(ep, None, time.monotonic() - start, kind)
+            return result
+
+    async def call_async(self, coro_fn: Callable[[LLMEndpoint], Awaitable[Any]],
+                         deadline: float | None = None, kind: str = "default",
+                         avoid: list[LLMEndpoint] | None = None) -> Any:
+        """Async variant of call()."""
+        self._retry_budget.deposit()
+        tried: list[LLMEndpoint] = list(avoid or [])
+        attempts = 0
+        while True:
+            ep = await self.acquire_async(exclude=tried, deadline=deadline)
+            start = time.monotonic()
+            try:
+                result = await coro_fn(ep)
+            except Exception as e:
+                self._release(ep, e)
+                tried.append(ep)
+                attempts += 1
+                delay = self._retry_delay(ep, e, attempts, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # e.g. CancelledError from wait_for() or a cancelled sibling task
+                self._release(ep, None)
+                raise
+            self._release(ep, None, time.monotonic() - start, kind)
+            return result
+
+    @contextmanager
+    def endpoint(self, deadline: float | None = None):
+        """Hold a slot for the duration of the block (no retries — for streaming responses)."""
+        ep = self.acquire(deadline=deadline)
+        try:
+            yield ep
+        except Exception as e:
+            self._release(ep, e)
+            raise
+        except BaseException:
+            # e.g. GeneratorExit when a stream consumer stops early: not the endpoint's fault
+            self._release(ep, None)
+            raise
+        else:
+            # Stream durations depend on reply length, so they don't feed the latency window
+            self._release(ep, None)
+
+    def stats(self) -> dict:
+        """{"retries": n, "endpoints": [per-endpoint load, breaker state and current timeout per call kind]}"""
+        with self._cond:
+            endpoints = [
+                {
+                    "name": ep.name,
+                    "model": ep.model,
+                    "outstanding": ep.outstanding,
+                    "calls": ep.calls,
+                    "failures": ep.failures,
+                    "timeout_s": {
+                        kind: round(tracker.timeout() if self._adaptive_timeout else self._timeout, 1)
+                        for kind, tracker in ep.latency.items()
+                    },
+                    **ep.breaker.stats(),
+                }
+                for ep in self._endpoints
+            ]
+            return {"retries": self._retries, "endpoints": endpoints}
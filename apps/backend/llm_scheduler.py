@@ -0,0 +1,220 @@
+"""
+Priority scheduling of LLM calls by request class.
+
+Every upstream model call takes one of a bounded number of slots. When all slots are
+busy, callers queue per request class, and a freed slot goes to the class whose oldest
+waiter has the best effective priority:
+
+    effective priority = class priority − seconds waited / aging_seconds
+
+so interactive chat is served first, but a background job that has waited long enough
+overtakes newer interactive work instead of starving. Within a class, waiters are FIFO.
+
+The class is taken from a context variable that entry points set with
+`request_class(name)`; it follows the call through LangGraph nodes and asyncio tasks.
+Graph runners use `default_request_class(name)`, which keeps a class already set by
+the caller (e.g. a batch job running the review graph). Untagged calls use DEFAULT_CLASS.
+
+Public API:
+  - REQUEST_CLASSES, DEFAULT_CLASS                 — class name → priority (lower runs first)
+  - request_class(name)                            — context manager tagging LLM calls made inside it
+  - default_request_class(name)                    — same, unless the caller already set a class
+  - current_request_class()                        — the class in effect
+  - PriorityScheduler.slot() / slot_async()        — hold a slot for one upstream call (waits end at `deadline`)
+  - PriorityScheduler.stats()                      — per-class queue depth, in flight and wait times
+"""
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+REQUEST_CLASSES = {
+    "chat": 0,          # interactive chat
+    "interactive": 1,   # answer evaluation, on-demand explanations
+    "review": 2,        # daily review opened by the user
+    "generation": 3,    # comprehension question generation
+    "batch": 4,         # pre-generation jobs, background summaries
+}
+DEFAULT_CLASS = "interactive"
+
+_request_class: ContextVar[str | None] = ContextVar("llm_request_class", default=None)
+
+
+@contextmanager
+def request_class(name: str):
+    """Tag LLM calls made inside this block (and tasks/graph nodes started from it) with `name`."""
+    if name not in REQUEST_CLASSES:
+        raise ValueError(f"Unknown LLM request class: {name}")
+    token = _request_class.set(name)
+    try:
+        yield
+    finally:
+        _request_class.reset(token)
+
+
+@contextmanager
+def default_request_class(name: str):
+    """request_class(name), unless an enclosing block already chose a class."""
+    if _request_class.get() is not None:
+        yield
+        return
+    with request_class(name):
+        yield
+
+
+def current_request_class() -> str:
+    return _request_class.get() or DEFAULT_CLASS
+
+
+class SchedulerTimeout(RuntimeError):
+    """No slot was granted within the queue timeout."""
+
+
+class _Waiter:
+    __slots__ = ("cls", "enqueued", "seq", "granted", "grant")
+
+    def __init__(self, cls: str, seq: int, grant):
+        self.cls = cls
+        self.enqueued = time.monotonic()
+        self.seq = seq
+        self.granted = False
+        self.grant = grant  # wakes the waiter; called with the scheduler lock held
+
+
+class PriorityScheduler:
+    """Bounded slot pool with one FIFO queue per request class and priority aging."""
+
+    def __init__(self, slots: int, aging_seconds: float = 10.0, queue_timeout: float = 120.0,
+                 wait_window: int = 500):
+        self._slots = slots  # 0 = unbounded (metrics only)
+        self._free = slots
+        self._aging_seconds = aging_seconds
+        self._queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._queues: dict[str, deque[_Waiter]] = {cls: deque() for cls in REQUEST_CLASSES}
+        self._in_flight = dict.fromkeys(REQUEST_CLASSES, 0)
+        self._dispatched = dict.fromkeys(REQUEST_CLASSES, 0)
+        self._waits: dict[str, deque[float]] = {cls: deque(maxlen=wait_window) for cls in REQUEST_CLASSES}
+
+    # -- bookkeeping (callers hold self._lock) --------------------------------
+
+    def _start(self, cls: str, waited: float):
+        self._in_flight[cls] += 1
+        self._dispatched[cls] += 1
+        self._waits[cls].append(waited)
+
+    def _try_take(self, cls: str) -> bool:
+        if self._slots == 0 or (self._free > 0 and not any(self._queues.values())):
+            if self._slots:
+                self._free -= 1
+            self._start(cls, 0.0)
+            return True
+        return False
+
+    def _next_waiter(self) -> _Waiter | None:
+        now = time.monotonic()
+        heads = [queue[0] for queue in self._queues.values() if queue]
+        if not heads:
+            return None
+        return min(heads, key=lambda w: (REQUEST_CLASSES[w.cls] - (now - w.enqueued) / self._aging_seconds, w.seq))
+
+    def _release(self, cls: str):
+        with self._lock:
+            self._in_flight[cls] -= 1
+            if self._slots == 0:
+                return
+            waiter = self._next_waiter()
+            if waiter is None:
+                self._free += 1
+                return
+            # Hand the slot straight to the waiter
+            self._queues[waiter.cls].popleft()
+            waiter.granted = True
+            self._start(waiter.cls, time.monotonic() - waiter.enqueued)
+            waiter.grant()
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Remove a waiter that gave up; False if it was granted a slot in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._queues[waiter.cls].remove(waiter)
+            return True
+
+    # -- public -----------------------------------------------------------------
+
+    def _wait_limit(self, deadline: float | None) -> float:
+        if deadline is None:
+            return self._queue_timeout
+        return max(0.0, min(self._queue_timeout, deadline - time.monotonic()))
+
+    @contextmanager
+    def slot(self, cls: str | None = None, deadline: float | None = None):
+        """Hold a slot for the block, queueing by request class while none is free."""
+        cls = cls or current_request_class()
+        wait_limit = self._wait_limit(deadline)
+        with self._lock:
+            waiter = None
+            if not self._try_take(cls):
+                event = threading.Event()
+                waiter = _Waiter(cls, next(self._seq), event.set)
+                self._queues[cls].append(waiter)
+        if waiter is not None and not event.wait(wait_limit) and self._abandon(waiter):
+            raise SchedulerTimeout(f"No LLM slot for '{cls}' within {wait_limit:.1f}s")
+        try:
+            yield
+        finally:
+            self._release(cls)
+
+    @asynccontextmanager
+    async def slot_async(self, cls: str | None = None, deadline: float | None = None):
+        """Async slot(): waits on a future instead of blocking the event loop."""
+        cls = cls or current_request_class()
+        wait_limit = self._wait_limit(deadline)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiter = None
+            if not self._try_take(cls):
+                future = loop.create_future()
+
+                def grant():
+                    loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+                waiter = _Waiter(cls, next(self._seq), grant)
+                self._queues[cls].append(waiter)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), wait_limit)
+            except BaseException as e:
+                if self._abandon(waiter):
+                    if isinstance(e, TimeoutError):
+                        raise SchedulerTimeout(f"No LLM slot for '{cls}' within {wait_limit:.1f}s") from e
+                    raise
+                if not isinstance(e, TimeoutError):
+                    self._release(cls)  # granted, but the caller is gone
+                    raise
+        try:
+            yield
+        finally:
+            self._release(cls)
+
+    def stats(self) -> dict:
+        """Per class: {"queued", "in_flight", "dispatched", "wait_ms_p50", "wait_ms_p95", "wait_ms_max"}."""
+        with self._lock:
+            result = {}
+            for cls in REQUEST_CLASSES:
+                waits = sorted(self._waits[cls])
+                pick = (lambda q, w=waits: round(w[min(len(w) - 1, int(q * len(w)))] * 1000, 1)) if waits else None
+                result[cls] = {
+                    "queued": len(self._queues[cls]),
+                    "in_flight": self._in_flight[cls],
+                    "dispatched": self._dispatched[cls],
+                    "wait_ms_p50": pick(0.5) if pick else 0.0,
+                    "wait_ms_p95": pick(0.95) if pick else 0.0,
+                    "wait_ms_max": round(waits[-1] * 1000, 1) if waits else 0.0,
+                }
+            return {"slots": self._slots, "free": self._free, "classes": result}
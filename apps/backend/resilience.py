@@ -0,0 +1,162 @@
+"""
+Failure handling for calls to model providers: circuit breakers, adaptive timeouts, retry budgets.
+
+  - CircuitBreaker: opens after `failure_threshold` consecutive failures or slow calls,
+    rejects calls while open, then lets a single probe through (half-open). A successful
+    probe closes it; a failed one re-opens it for twice as long (up to `max_open_seconds`).
+  - LatencyTracker: recent successful call durations; timeout() is a high percentile of
+    them times a multiplier, clamped between a floor and the configured ceiling, so an
+    overloaded server is given up on long before a fixed 120s timeout.
+  - RetryBudget: retries are only allowed while they stay under `ratio` of recent
+    requests (a token bucket), so retries can't multiply load during an outage.
+  - backoff_delay(): exponential backoff with full jitter.
+
+Public API:
+  - CircuitBreaker(name, ...)        — .allow(), .record(elapsed, failed), .state, .stats()
+  - CircuitOpenError                 — raised by callers that refuse work on an open breaker
+  - LatencyTracker(...)              — .record(seconds), .timeout(), .percentile(q)
+  - RetryBudget(ratio, max_tokens)   — .deposit(), .try_spend()
+  - backoff_delay(attempt, base, cap)
+"""
+import random
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(RuntimeError):
+    """The provider's circuit breaker is open: fail fast instead of waiting for a timeout."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with slow-call detection and single-probe half-open state."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, open_seconds: float = 10.0,
+                 max_open_seconds: float = 300.0, slow_call_seconds: float | None = None):
+        self.name = name
+        self._failure_threshold = max(1, failure_threshold)
+        self._open_seconds = open_seconds
+        self._max_open_seconds = max_open_seconds
+        self._slow_call_seconds = slow_call_seconds
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._trips = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._rejected = 0
+
+    def _state(self) -> str:
+        if self._trips == 0:
+            return self.CLOSED
+        return self.OPEN if time.monotonic() < self._open_until else self.HALF_OPEN
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now. In half-open state only one probe is let through."""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record(self, elapsed: float | None, failed: bool):
+        """Record a finished call. A success slower than slow_call_seconds counts as a failure."""
+        if not failed and self._slow_call_seconds and elapsed is not None and elapsed > self._slow_call_seconds:
+            failed = True
+        with self._lock:
+            self._probe_in_flight = False
+            if not failed:
+                self._consecutive_failures = 0
+                self._trips = 0
+                return
+            self._consecutive_failures += 1
+            state = self._state()
+            if state == self.OPEN:
+                return  # a call started before the breaker opened
+            if state == self.HALF_OPEN or self._consecutive_failures >= self._failure_threshold:
+                self._trips += 1
+                seconds = min(self._max_open_seconds, self._open_seconds * 2 ** (self._trips - 1))
+                self._open_until = time.monotonic() + seconds
+                print(f"Circuit breaker {self.name} open for {seconds:.1f}s "
+                      f"after {self._consecutive_failures} consecutive failures/slow calls")
+
+    def stats(self) -> dict:
+        """{"state", "consecutive_failures", "open_for_s", "rejected"}"""
+        with self._lock:
+            return {
+                "state": self._state(),
+                "consecutive_failures": self._consecutive_failures,
+                "open_for_s": round(max(0.0, self._open_until - time.monotonic()), 1) if self._trips else 0.0,
+                "rejected": self._rejected,
+            }
+
+
+class LatencyTracker:
+    """Sliding window of successful call durations, used to derive an adaptive timeout."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20, percentile: float = 0.99,
+                 multiplier: float = 3.0, floor: float = 10.0, ceiling: float = 120.0):
+        self._samples: deque[float] = deque(maxlen=window)
+        self._min_samples = min_samples
+        self._percentile = percentile
+        self._multiplier = multiplier
+        self._floor = floor
+        self._ceiling = ceiling
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def timeout(self) -> float:
+        """percentile × multiplier within [floor, ceiling]; the ceiling until there are enough samples."""
+        with self._lock:
+            enough = len(self._samples) >= self._min_samples
+        if not enough:
+            return self._ceiling
+        return max(self._floor, min(self._ceiling, self.percentile(self._percentile) * self._multiplier))
+
+
+class RetryBudget:
+    """Token bucket: every request deposits `ratio` tokens, every retry costs one."""
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self._ratio = ratio
+        self._max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._max_tokens, self._tokens + self._ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+def backoff_delay(attempt: int, base: float = 0.25, cap: float = 4.0) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base × 2^(attempt-1))]."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
@@ -0,0 +1,174 @@
+"""
+Daily review storage — serves generated reviews until the day's mistakes change.
+
+A review is a function of the mistakes the user logged today, so it is stored under
+(user_id, review_day) together with a fingerprint of today's wrong-answer log ids.
+Opening the review again on the same day is a single lookup; a new mistake changes
+the fingerprint and the next request regenerates it. Only complete reviews are stored
+(see review_graph.py): a degraded fallback is returned once and regenerated next time.
+
+Public API:
+  - create_review_tables(conn)                              — ensure tables exist
+  - get_or_generate_daily_review(user_id, db_path)          — stored review or a freshly generated one
+  - get_or_generate_daily_review_async(user_id, db_path)    — same, for the ASGI app
+  - pregenerate_daily_reviews(db_path, max_workers=4)       — batch job for users with mistakes today
+"""
+import asyncio
+import hashlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from agent_service import generate_daily_review, generate_daily_review_async
+from llm_scheduler import request_class
+
+# Same day boundary as the review graph's fetch_mistakes
+_TODAY = "date('now', 'localtime')"
+
+
+def create_review_tables(conn: sqlite3.Connection):
+    """Create review-related tables if they don't exist."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_review (
+            user_id TEXT NOT NULL,
+            review_day TEXT NOT NULL,
+            mistakes_hash TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_timestamp TEXT NOT NULL,
+            PRIMARY KEY (user_id, review_day)
+        )
+    ''')
+    conn.commit()
+
+
+def _mistakes_fingerprint(conn: sqlite3.Connection, user_id: str) -> tuple[str, str | None]:
+    """Return (today, sha256 of today's wrong-answer log ids), or (today, None) without mistakes."""
+    rows = conn.execute(f'''
+        SELECT {_TODAY}, log_id FROM answer_log
+        WHERE user_id = ? AND is_correct = 0 AND date(answered_timestamp) = {_TODAY}
+        ORDER BY log_id
+    ''', (user_id,)).fetchall()
+    if not rows:
+        today = conn.execute(f"SELECT {_TODAY}").fetchone()[0]
+        return today, None
+    digest = hashlib.sha256("\n".join(str(row[1]) for row in rows).encode()).hexdigest()
+    return rows[0][0], digest
+
+
+def _lookup_review(user_id: str, db_path: str) -> tuple[str, str | None, str | None]:
+    """Return (today, mistakes fingerprint, stored review or None)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        review_day, mistakes_hash = _mistakes_fingerprint(conn, user_id)
+        if mistakes_hash is None:
+            return review_day, None, None
+        row = conn.execute(
+            'SELECT content FROM daily_review WHERE user_id = ? AND review_day = ? AND mistakes_hash = ?',
+            (user_id, review_day, mistakes_hash)
+        ).fetchone()
+        return review_day, mistakes_hash, row[0] if row else None
+    finally:
+        conn.close()
+
+
+def _store_review(user_id: str, db_path: str, review_day: str, mistakes_hash: str | None, final: dict) -> bool:
+    """Store a generated review if it is complete and there were mistakes to review. Returns whether it was stored."""
+    # Degraded results (a failed step, a polish pass skipped near the deadline) would
+    # otherwise be served for the rest of the day
+    if mistakes_hash is None or not final["is_complete"]:
+        return False
+
+    # Stored under the fingerprint taken before generation: a mistake logged meanwhile
+    # only makes the next request regenerate.
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('''
+            INSERT OR REPLACE INTO daily_review (user_id, review_day, mistakes_hash, content, created_timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, review_day, mistakes_hash, final["result"], datetime.now().isoformat()))
+        conn.commit()
+    finally:
+        conn.close()
+    return True
+
+
+def _get_or_generate(user_id: str, db_path: str, deadline: float | None) -> tuple[str, bool, bool]:
+    """(review, served from storage, stored now)"""
+    review_day, mistakes_hash, stored = _lookup_review(user_id, db_path)
+    if stored is not None:
+        return stored, True, False
+    # Without mistakes the graph answers without calling the LLM
+    final = generate_daily_review(user_id, db_path, deadline=deadline)
+    return final["result"], False, _store_review(user_id, db_path, review_day, mistakes_hash, final)
+
+
+def get_or_generate_daily_review(user_id: str, db_path: str, deadline: float | None = None) -> tuple[str, bool]:
+    """
+    Return today's review for the user, generating and storing it when needed.
+
+    Args:
+        user_id (str): The ID of the user.
+        db_path (str): The path to the SQLite database.
+        deadline (float, optional): time.monotonic() by which a generated review is needed
+            (see deadline.py). Defaults to None (no deadline).
+
+    Returns:
+        tuple[str, bool]: (review markdown, whether it was served from storage).
+    """
+    content, cached, _ = _get_or_generate(user_id, db_path, deadline)
+    return content, cached
+
+
+async def get_or_generate_daily_review_async(
+    user_id: str, db_path: str, deadline: float | None = None
+) -> tuple[str, bool]:
+    """Async variant of get_or_generate_daily_review(): SQLite runs in a worker thread, the graph is awaited."""
+    review_day, mistakes_hash, stored = await asyncio.to_thread(_lookup_review, user_id, db_path)
+    if stored is not None:
+        return stored, True
+    final = await generate_daily_review_async(user_id, db_path, deadline=deadline)
+    await asyncio.to_thread(_store_review, user_id, db_path, review_day, mistakes_hash, final)
+    return final["result"], False
+
+
+def pregenerate_daily_reviews(db_path: str, max_workers: int = 4) -> dict:
+    """
+    Generate and store today's review for every user who has mistakes today.
+
+    Users whose stored review is still current are skipped. At most `max_workers`
+    reviews are generated at once so the job does not monopolise the LLM backend.
+
+    Args:
+        db_path (str): The path to the SQLite database.
+        max_workers (int): Maximum number of reviews generated concurrently.
+
+    Returns:
+        dict: {"users", "generated", "cached", "failed"} counts.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        user_ids = [row[0] for row in conn.execute(f'''
+            SELECT DISTINCT user_id FROM answer_log
+            WHERE is_correct = 0 AND date(answered_timestamp) = {_TODAY}
+        ''')]
+    finally:
+        conn.close()
+
+    stats = {"users": len(user_ids), "generated": 0, "cached": 0, "failed": 0}
+
+    def run(user_id):
+        try:
+            # Lowest priority: live requests are dispatched first
+            with request_class("batch"):
+                _, cached, stored = _get_or_generate(user_id, db_path, None)
+        except Exception as e:
+            print(f"Daily review pre-generation failed for {user_id}: {e}")
+            return "failed"
+        if cached:
+            return "cached"
+        return "generated" if stored else "failed"
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for outcome in pool.map(run, user_ids):
+            stats[outcome] += 1
+    return stats
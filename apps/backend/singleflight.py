@@ -0,0 +1,144 @@
+"""
+Single-flight call deduplication.
+
+While a call for a key is in flight, further calls with the same key don't start
+their own — they wait for the first one and receive its result (or its exception).
+Nothing is cached: once the call finishes the key is released, and the next caller
+starts a fresh call.
+
+Sync and async callers share the same in-flight table, so a Flask thread and an
+ASGI coroutine asking the same thing at the same moment also share one call.
+
+Callers with a request deadline (see deadline.py) wait for the shared call only until
+their own deadline, then fail with DeadlineExceeded. If the shared call itself failed
+with DeadlineExceeded — the leader's deadline was earlier — a follower with time
+left doesn't take that outcome but starts (or joins) a fresh call. The same goes for
+a leader that was cancelled or interrupted: only ordinary exceptions are shared.
+
+Public API:
+  - SingleFlight.do(key, fn, deadline)      — run fn() or join the in-flight call for key
+  - SingleFlight.do_async(key, coro_fn, deadline) — same, for coroutine functions
+  - SingleFlight.stats()                    — {"calls", "coalesced", "in_flight"}
+  - request_key(*parts)                     — stable hash of JSON-serialisable parts
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from collections.abc import Awaitable, Callable
+from concurrent.futures import Future, wait
+
+from deadline import DeadlineExceeded, remaining
+
+
+def request_key(*parts) -> str:
+    """Stable SHA-256 key over JSON-serialisable parts (dict key order doesn't matter)."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _LeaderAbandoned(Exception):
+    """Resolves a shared call whose leader was cancelled or interrupted, so followers take over."""
+
+
+class SingleFlight:
+    """In-flight table of key -> Future, with counters for upstream and coalesced calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, Future] = {}
+        self._calls = 0
+        self._coalesced = 0
+
+    def _join_or_lead(self, key: str) -> tuple[Future, bool]:
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            self._calls += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future, result=None, error: BaseException | None = None):
+        # Release the key before resolving, so a caller arriving afterwards starts a fresh call
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    @staticmethod
+    def _wait_limit(deadline: float | None) -> float | None:
+        left = remaining(deadline)
+        return None if left is None else max(0.0, left)
+
+    @staticmethod
+    def _shares_outcome(future: Future, deadline: float | None) -> bool:
+        """Whether a follower takes the finished call's outcome (vs. calling again with its own time left)."""
+        if not future.done():
+            raise DeadlineExceeded("Request deadline passed while waiting for an identical in-flight call")
+        left = remaining(deadline)
+        out_of_time = left is not None and left <= 0
+        error = future.exception()
+        if isinstance(error, _LeaderAbandoned):
+            if out_of_time:
+                raise DeadlineExceeded("Request deadline passed while waiting for an identical in-flight call")
+            return False
+        return not isinstance(error, DeadlineExceeded) or out_of_time
+
+    def do(self, key: str, fn: Callable[[], object], deadline: float | None = None):
+        """
+        Run fn() for key, or wait for the identical call already running and share its outcome.
+        A follower waits at most until its own `deadline` (time.monotonic()).
+        """
+        while True:
+            future, leader = self._join_or_lead(key)
+            if leader:
+                break
+            wait([future], timeout=self._wait_limit(deadline))
+            if self._shares_outcome(future, deadline):
+                return future.result()
+
+        try:
+            result = fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, error=_LeaderAbandoned())
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key: str, coro_fn: Callable[[], Awaitable], deadline: float | None = None):
+        """Async variant of do(): followers await the leader without blocking their event loop."""
+        while True:
+            future, leader = self._join_or_lead(key)
+            if leader:
+                break
+            # asyncio.wait() leaves the leader's future alone on timeout or cancellation
+            waiter = asyncio.wrap_future(future)
+            await asyncio.wait({waiter}, timeout=self._wait_limit(deadline))
+            if not waiter.done():
+                waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+            if self._shares_outcome(future, deadline):
+                return future.result()
+
+        try:
+            result = await coro_fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, error=_LeaderAbandoned())
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def stats(self) -> dict:
+        """Upstream calls started, calls that joined an in-flight one instead, and keys in flight now."""
+        with self._lock:
+            return {"calls": self._calls, "coalesced": self._coalesced, "in_flight": len(self._in_flight)}
@@ -0,0 +1,51 @@
+"""
+Token estimates for mixed Japanese / English / Chinese text.
+
+Counting exactly would need the serving model's tokenizer, which differs per provider
+and model. For prompt budgeting a cheap, slightly pessimistic estimate is enough:
+
+  - CJK ideographs, kana, full-width forms: ~1 token per character
+  - other non-ASCII (accents, symbols, emoji): ~1 token per 2 characters
+  - ASCII (English, romaji, JSON punctuation): ~1 token per 4 characters
+  - each chat message adds a few tokens of role/formatting overhead
+
+Public API:
+  - estimate_tokens(text)              — estimated tokens for a string
+  - estimate_message_tokens(messages)  — estimated tokens for a chat message list
+"""
+
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# (start, end) code point ranges counted as one token per character
+_WIDE_RANGES = (
+    (0x3000, 0x30FF),  # CJK punctuation, hiragana, katakana
+    (0x3400, 0x4DBF),  # CJK extension A
+    (0x4E00, 0x9FFF),  # CJK unified ideographs
+    (0xF900, 0xFAFF),  # CJK compatibility ideographs
+    (0xFF00, 0xFFEF),  # half-/full-width forms
+)
+
+
+def _is_wide(code: int) -> bool:
+    return any(start <= code <= end for start, end in _WIDE_RANGES)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in `text` (see module docstring for the ratios)."""
+    if not text:
+        return 0
+    ascii_chars = wide = other = 0
+    for ch in text:
+        code = ord(ch)
+        if code < 0x80:
+            ascii_chars += 1
+        elif _is_wide(code):
+            wide += 1
+        else:
+            other += 1
+    return wide + (other + 1) // 2 + (ascii_chars + 3) // 4
+
+
+def estimate_message_tokens(messages: list) -> int:
+    """Estimate the prompt tokens of a list of {"role", "content"} messages."""
+    return sum(estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
@@ -0,0 +1,310 @@
+"""
+Background video imports — a persistent job queue in SQLite with a worker pool.
+
+POST /api/videos/import only records a job and returns its id; worker threads run
+import_video() and write the current stage to the job row, which
+GET /api/videos/import/<job_id> reports.
+
+Durability and retries:
+  - Jobs live in the `video_import_job` table, so queued work survives a restart.
+  - A worker claims a job with a lease that it renews while the job runs. A job whose
+    lease expired (the process died mid-import) is claimed again by any worker,
+    in this process or another one. Every claim bumps `attempts`, which identifies
+    the lease: a worker only renews or finishes the job while the row is still
+    running under its attempt, so a worker that lost its lease can't overwrite the
+    outcome of the one that took over.
+  - Failed attempts are retried with exponential backoff up to
+    VIDEO_IMPORT_MAX_ATTEMPTS. import_video() is idempotent per YouTube video: it
+    resumes a video saved by an interrupted attempt instead of importing it twice.
+  - Enqueueing the same video while a job for it is queued, running or done returns
+    that job instead of adding another.
+
+Once a job succeeds, the video's comprehension questions are pre-generated in the
+background (see comprehension_service.py); the job doesn't wait for them.
+
+Public API:
+  - create_import_job_tables(conn)
+  - enqueue_video_import(url, db_path, use_whisper=False)  — job dict (raises ValueError for a bad URL)
+  - get_import_job(job_id, db_path)                        — job dict or None
+  - start_import_workers(db_path, workers)                 — start the worker threads (idempotent)
+  - run_pending_imports(db_path)                           — run queued jobs in the calling thread
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from comprehension_service import schedule_question_pregeneration
+from video_service import IMPORT_STAGES, import_video, parse_youtube_url
+
+VIDEO_IMPORT_WORKERS = int(os.getenv("VIDEO_IMPORT_WORKERS", "2"))
+VIDEO_IMPORT_MAX_ATTEMPTS = int(os.getenv("VIDEO_IMPORT_MAX_ATTEMPTS", "3"))
+VIDEO_IMPORT_LEASE_SECONDS = float(os.getenv("VIDEO_IMPORT_LEASE_SECONDS", "120"))
+VIDEO_IMPORT_POLL_SECONDS = float(os.getenv("VIDEO_IMPORT_POLL_SECONDS", "5"))
+VIDEO_IMPORT_RETRY_BASE_SECONDS = float(os.getenv("VIDEO_IMPORT_RETRY_BASE_SECONDS", "30"))
+
+_STAGES = ("queued", *IMPORT_STAGES)
+
+# Set when a job is enqueued so idle workers pick it up without waiting for the next poll
+_wakeup = threading.Event()
+_workers_lock = threading.Lock()
+_workers: list[threading.Thread] = []
+
+
+# ---------------------------------------------------------------------------
+# Database
+# ---------------------------------------------------------------------------
+
+def create_import_job_tables(conn: sqlite3.Connection):
+    """Create the video import job table if it doesn't exist."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS video_import_job (
+            job_id TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            external_id TEXT NOT NULL,
+            use_whisper INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            result_json TEXT,
+            run_after TEXT NOT NULL,
+            lease_expires TEXT,
+            created_timestamp TEXT NOT NULL,
+            updated_timestamp TEXT NOT NULL
+        )
+    ''')
+    # At most one live job per video: concurrent enqueues of the same URL collapse into one
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_video_import_job_live
+        ON video_import_job (external_id) WHERE status IN ('queued', 'running')
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_video_import_job_status ON video_import_job (status, run_after)')
+    conn.commit()
+
+
+def _now(offset_seconds: float = 0.0) -> str:
+    return (datetime.now() + timedelta(seconds=offset_seconds)).isoformat()
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    # Autocommit mode, so claims can take an explicit write lock (BEGIN IMMEDIATE)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _job_dict(row: sqlite3.Row) -> dict:
+    stage = row["stage"]
+    return {
+        "job_id": row["job_id"],
+        "url": row["url"],
+        "status": row["status"],
+        "stage": stage,
+        "progress": round(_STAGES.index(stage) / (len(_STAGES) - 1), 2) if stage in _STAGES else 0.0,
+        "attempts": row["attempts"],
+        "error": row["error"],
+        "result": json.loads(row["result_json"]) if row["result_json"] else None,
+        "created_timestamp": row["created_timestamp"],
+        "updated_timestamp": row["updated_timestamp"],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Enqueue / status
+# ---------------------------------------------------------------------------
+
+def _find_job_for_video(conn: sqlite3.Connection, external_id: str) -> sqlite3.Row | None:
+    return conn.execute('''
+        SELECT * FROM video_import_job
+        WHERE external_id = ? AND status IN ('queued', 'running', 'succeeded')
+        ORDER BY created_timestamp DESC LIMIT 1
+    ''', (external_id,)).fetchone()
+
+
+def enqueue_video_import(url: str, db_path: str, use_whisper: bool = False) -> dict:
+    """
+    Queue an import of the YouTube video at `url`.
+
+    Args:
+        url (str): YouTube URL.
+        db_path (str): The path to the SQLite database.
+        use_whisper (bool): Transcribe with Whisper instead of YouTube captions.
+
+    Returns:
+        dict: The job (see get_import_job) — an existing one if this video is already
+            queued, being imported or imported.
+
+    Raises:
+        ValueError: The URL is not a YouTube video URL.
+    """
+    external_id = parse_youtube_url(url)
+    conn = _connect(db_path)
+    try:
+        existing = _find_job_for_video(conn, external_id)
+        if existing:
+            return _job_dict(existing)
+
+        job_id = str(uuid.uuid4())
+        now = _now()
+        try:
+            conn.execute('''
+                INSERT INTO video_import_job
+                (job_id, url, external_id, use_whisper, status, stage, run_after, created_timestamp, updated_timestamp)
+                VALUES (?, ?, ?, ?, 'queued', 'queued', ?, ?, ?)
+            ''', (job_id, url, external_id, int(use_whisper), now, now, now))
+        except sqlite3.IntegrityError:
+            # Another request queued this video between our lookup and insert
+            return _job_dict(_find_job_for_video(conn, external_id))
+        row = conn.execute('SELECT * FROM video_import_job WHERE job_id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+
+    _wakeup.set()
+    return _job_dict(row)
+
+
+def get_import_job(job_id: str, db_path: str) -> dict | None:
+    """
+    Current state of an import job.
+
+    Returns:
+        dict | None: {"job_id", "url", "status" (queued / running / succeeded / failed),
+            "stage", "progress" (0–1), "attempts", "error", "result" (import_video's
+            return value once succeeded), "created_timestamp", "updated_timestamp"},
+            or None if there is no such job.
+    """
+    conn = _connect(db_path)
+    try:
+        row = conn.execute('SELECT * FROM video_import_job WHERE job_id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return _job_dict(row) if row else None
+
+
+# ---------------------------------------------------------------------------
+# Workers
+# ---------------------------------------------------------------------------
+
+def _claim_next(conn: sqlite3.Connection) -> sqlite3.Row | None:
+    """Lease the oldest runnable job: queued and due, or running with an expired lease."""
+    now = _now()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('''
+            SELECT * FROM video_import_job
+            WHERE (status = 'queued' AND run_after <= ?) OR (status = 'running' AND lease_expires < ?)
+            ORDER BY created_timestamp LIMIT 1
+        ''', (now, now)).fetchone()
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+
+        if row["status"] == "running" and row["attempts"] >= VIDEO_IMPORT_MAX_ATTEMPTS:
+            # Its worker died on the last allowed attempt
+            conn.execute('''
+                UPDATE video_import_job SET status = 'failed', error = ?, lease_expires = NULL, updated_timestamp = ?
+                WHERE job_id = ?
+            ''', ("Import interrupted too many times", now, row["job_id"]))
+            conn.execute('COMMIT')
+            return _claim_next(conn)
+
+        conn.execute('''
+            UPDATE video_import_job
+            SET status = 'running', attempts = attempts + 1, lease_expires = ?, updated_timestamp = ?
+            WHERE job_id = ?
+        ''', (_now(VIDEO_IMPORT_LEASE_SECONDS), now, row["job_id"]))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return conn.execute('SELECT * FROM video_import_job WHERE job_id = ?', (row["job_id"],)).fetchone()
+
+
+def _renew_lease(conn: sqlite3.Connection, job_id: str, attempt: int, stage: str | None = None):
+    now = _now()
+    conn.execute('''
+        UPDATE video_import_job SET stage = COALESCE(?, stage), lease_expires = ?, updated_timestamp = ?
+        WHERE job_id = ? AND status = 'running' AND attempts = ?
+    ''', (stage, _now(VIDEO_IMPORT_LEASE_SECONDS), now, job_id, attempt))
+
+
+def _heartbeat(db_path: str, job_id: str, attempt: int, done: threading.Event):
+    # import_video can sit in one stage (e.g. Whisper) for longer than a lease
+    conn = _connect(db_path)
+    try:
+        while not done.wait(VIDEO_IMPORT_LEASE_SECONDS / 3):
+            _renew_lease(conn, job_id, attempt)
+    finally:
+        conn.close()
+
+
+def _run_job(db_path: str, job: sqlite3.Row):
+    job_id, attempt = job["job_id"], job["attempts"]
+    conn = _connect(db_path)
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(db_path, job_id, attempt, done), daemon=True)
+    heartbeat.start()
+    try:
+        result = import_video(job["url"], db_path, use_whisper=bool(job["use_whisper"]),
+                              progress=lambda stage: _renew_lease(conn, job_id, attempt, stage))
+    except Exception as e:
+        permanent = isinstance(e, ValueError) or attempt >= VIDEO_IMPORT_MAX_ATTEMPTS
+        print(f"Video import job {job_id} failed (attempt {attempt}): {e}")
+        delay = VIDEO_IMPORT_RETRY_BASE_SECONDS * 2 ** (attempt - 1)
+        finished = conn.execute('''
+            UPDATE video_import_job
+            SET status = ?, error = ?, run_after = ?, lease_expires = NULL, updated_timestamp = ?
+            WHERE job_id = ? AND status = 'running' AND attempts = ?
+        ''', ("failed" if permanent else "queued", str(e), _now(delay), _now(), job_id, attempt)).rowcount
+    else:
+        finished = conn.execute('''
+            UPDATE video_import_job
+            SET status = 'succeeded', stage = 'done', error = NULL, result_json = ?, lease_expires = NULL,
+                updated_timestamp = ?
+            WHERE job_id = ? AND status = 'running' AND attempts = ?
+        ''', (json.dumps(result, ensure_ascii=False), _now(), job_id, attempt)).rowcount
+        if finished:
+            schedule_question_pregeneration(db_path, result["video_id"])
+    finally:
+        done.set()
+        conn.close()
+    if not finished:
+        print(f"Video import job {job_id} lost its lease (attempt {attempt}); another worker owns it now")
+
+
+def run_pending_imports(db_path: str) -> int:
+    """Run runnable jobs in the calling thread until none is left. Returns how many ran."""
+    conn = _connect(db_path)
+    ran = 0
+    try:
+        while (job := _claim_next(conn)) is not None:
+            _run_job(db_path, job)
+            ran += 1
+    finally:
+        conn.close()
+    return ran
+
+
+def _worker_loop(db_path: str):
+    while True:
+        # Cleared before looking, so a job enqueued meanwhile still wakes the next wait
+        _wakeup.clear()
+        try:
+            run_pending_imports(db_path)
+        except Exception as e:
+            print(f"Video import worker error: {e}")
+        _wakeup.wait(VIDEO_IMPORT_POLL_SECONDS)
+
+
+def start_import_workers(db_path: str, workers: int = VIDEO_IMPORT_WORKERS):
+    """Start `workers` daemon worker threads (once per process; 0 starts none)."""
+    with _workers_lock:
+        if _workers:
+            return
+        for i in range(workers):
+            thread = threading.Thread(target=_worker_loop, args=(db_path,), name=f"video-import-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
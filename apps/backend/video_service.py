@@ -4,6 +4,15 @@ Video import service — fetches YouTube transcripts, generates cloze exercises.
 Public API:
   - create_video_tables(conn)   — ensure tables exist
   - import_video(url, db_path)  — full pipeline: fetch metadata + transcript → generate exercises
+  - IMPORT_STAGES               — the stages import_video reports through its `progress` callback
+
+Transcripts are stored one segment per row (video_transcript_segments):
+  - get_transcript_window(conn, video_id, start, end)  — segments playing in a time range
+  - find_segment_at(conn, video_id, seconds)           — time → segment lookup
+  - get_context_lines(conn, video_id, timestamp)       — lines shown above an exercise
+  - load_transcript / get_transcript_text              — the whole transcript, as segments or text
+  - get_transcript_prefix(conn, video_id, chars)       — start of the transcript text, reading only what it needs
+  - migrate_transcript_blobs(conn)                     — move old videos.transcript_json blobs into rows
 """
 import json
 import os
@@ -12,13 +21,17 @@ import re
 import sqlite3
 import tempfile
 import uuid
+from bisect import bisect_right
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from urllib.parse import parse_qs, urlparse
 
 import requests
 from janome.tokenizer import Tokenizer
 
-from translation_service import translate_text
+from translation_service import translate_texts
+from whisper_transcription import transcribe_audio
 
 # ---------------------------------------------------------------------------
 # Database
@@ -58,6 +71,22 @@ def create_video_tables(conn: sqlite3.Connection):
             created_timestamp TEXT NOT NULL
         )
     ''')
+    # One row per caption segment, so players and LLM prompts read time windows
+    # instead of parsing a whole transcript blob
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS video_transcript_segments (
+            video_id TEXT NOT NULL REFERENCES videos(video_id),
+            seq INTEGER NOT NULL,
+            start REAL NOT NULL,
+            duration REAL NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (video_id, seq)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_video_transcript_segments_start
+        ON video_transcript_segments (video_id, start)
+    ''')
     conn.execute('''
         CREATE TABLE IF NOT EXISTS video_answer_log (
             log_id TEXT PRIMARY KEY,
@@ -75,6 +104,137 @@ def create_video_tables(conn: sqlite3.Connection):
     conn.commit()
 
 
+# ---------------------------------------------------------------------------
+# Transcript storage
+# ---------------------------------------------------------------------------
+
+def save_transcript_segments(conn: sqlite3.Connection, video_id: str, transcript: list):
+    """Store transcript segments ([{text, start, duration}, ...]) in time order, replacing any existing ones."""
+    conn.execute("DELETE FROM video_transcript_segments WHERE video_id = ?", (video_id,))
+    conn.executemany('''
+        INSERT INTO video_transcript_segments (video_id, seq, start, duration, text)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (
+        (video_id, seq, seg.get("start", 0.0), seg.get("duration", 0.0), seg.get("text", ""))
+        for seq, seg in enumerate(transcript)
+    ))
+
+
+def _segment_dict(row) -> dict:
+    return {"seq": row[0], "start": row[1], "duration": row[2], "text": row[3]}
+
+
+def get_transcript_window(conn: sqlite3.Connection, video_id: str, start: float = 0.0, end: float | None = None) -> list:
+    """Segments playing in [start, end): from the one on screen at `start` up to the last one starting before `end`.
+
+    Returns list of dicts: [{seq, start, duration, text}, ...]
+    """
+    query = '''
+        SELECT seq, start, duration, text FROM video_transcript_segments
+        WHERE video_id = ?
+          AND start >= COALESCE(
+              (SELECT MAX(start) FROM video_transcript_segments WHERE video_id = ? AND start <= ?), 0)
+          AND start + duration > ?
+    '''
+    params = [video_id, video_id, start, start]
+    if end is not None:
+        query += " AND start < ?"
+        params.append(end)
+    rows = conn.execute(query + " ORDER BY seq", params).fetchall()
+    return [_segment_dict(row) for row in rows]
+
+
+def find_segment_at(conn: sqlite3.Connection, video_id: str, seconds: float) -> dict | None:
+    """The segment that started most recently at `seconds` (what a player shows then), or None before the first."""
+    row = conn.execute('''
+        SELECT seq, start, duration, text FROM video_transcript_segments
+        WHERE video_id = ? AND start <= ?
+        ORDER BY start DESC, seq DESC LIMIT 1
+    ''', (video_id, seconds)).fetchone()
+    return _segment_dict(row) if row else None
+
+
+def get_context_lines(conn: sqlite3.Connection, video_id: str, timestamp: float, count: int = 2) -> list[str]:
+    """Texts of the `count` segments before the one preceding `timestamp` (an exercise's context)."""
+    row = conn.execute('''
+        SELECT seq FROM video_transcript_segments WHERE video_id = ? AND start >= ?
+        ORDER BY start, seq LIMIT 1
+    ''', (video_id, timestamp)).fetchone()
+    if row is None:
+        last = conn.execute(
+            "SELECT MAX(seq) FROM video_transcript_segments WHERE video_id = ?", (video_id,)
+        ).fetchone()[0]
+        if last is None:
+            return []
+        pos = last
+    else:
+        pos = max(0, row[0] - 1)
+    rows = conn.execute('''
+        SELECT text FROM video_transcript_segments WHERE video_id = ? AND seq >= ? AND seq < ?
+        ORDER BY seq
+    ''', (video_id, max(0, pos - count), pos)).fetchall()
+    return [r[0] for r in rows]
+
+
+def count_transcript_segments(conn: sqlite3.Connection, video_id: str) -> int:
+    return conn.execute(
+        "SELECT COUNT(*) FROM video_transcript_segments WHERE video_id = ?", (video_id,)
+    ).fetchone()[0]
+
+
+def load_transcript(conn: sqlite3.Connection, video_id: str) -> list:
+    """The whole transcript as [{text, start, duration}, ...] (falls back to a not yet migrated transcript_json)."""
+    rows = conn.execute(
+        "SELECT start, duration, text FROM video_transcript_segments WHERE video_id = ? ORDER BY seq", (video_id,)
+    ).fetchall()
+    if rows:
+        return [{"text": text, "start": start, "duration": duration} for start, duration, text in rows]
+
+    row = conn.execute("SELECT transcript_json FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+    if not row or not row[0]:
+        return []
+    try:
+        return json.loads(row[0])
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+
+def get_transcript_text(conn: sqlite3.Connection, video_id: str) -> str:
+    """Join a video's transcript segments into one text block ("" if there is none)."""
+    return " ".join(seg.get("text", "") for seg in load_transcript(conn, video_id))
+
+
+def get_transcript_prefix(conn: sqlite3.Connection, video_id: str, chars: int) -> str:
+    """get_transcript_text(conn, video_id)[:chars], reading only the segments that reach into it."""
+    parts = []
+    length = 0
+    rows = conn.execute(
+        "SELECT text FROM video_transcript_segments WHERE video_id = ? ORDER BY seq", (video_id,)
+    )
+    for (text,) in rows:
+        parts.append(text)
+        length += len(text) + 1
+        if length > chars:
+            break
+    if not parts:
+        # Not migrated to segment rows yet
+        return get_transcript_text(conn, video_id)[:chars]
+    return " ".join(parts)[:chars]
+
+
+def migrate_transcript_blobs(conn: sqlite3.Connection) -> int:
+    """Move transcripts still stored as videos.transcript_json into segment rows. Returns how many moved."""
+    video_ids = [row[0] for row in conn.execute(
+        "SELECT video_id FROM videos WHERE transcript_json IS NOT NULL"
+    ).fetchall()]
+    for video_id in video_ids:
+        if count_transcript_segments(conn, video_id) == 0:
+            save_transcript_segments(conn, video_id, load_transcript(conn, video_id))
+        conn.execute("UPDATE videos SET transcript_json = NULL WHERE video_id = ?", (video_id,))
+        conn.commit()
+    return len(video_ids)
+
+
 # ---------------------------------------------------------------------------
 # YouTube helpers
 # ---------------------------------------------------------------------------
@@ -122,12 +282,11 @@ def transcribe_with_whisper(external_id: str) -> list:
     """Download audio from YouTube and transcribe with OpenAI Whisper.
 
     Returns list of dicts: [{text, start, duration}, ...]
-    Requires yt-dlp and OPENAI_API_KEY in the environment.
+    Long audio is split at pauses and transcribed in parallel chunks (see
+    whisper_transcription). Requires yt-dlp and OPENAI_API_KEY in the environment.
     """
     import yt_dlp
-    from openai import OpenAI
 
-    client = OpenAI()
     url = f"https://www.youtube.com/watch?v={external_id}"
 
     with tempfile.TemporaryDirectory() as tmpdir:
@@ -145,24 +304,7 @@ def transcribe_with_whisper(external_id: str) -> list:
             raise RuntimeError("yt-dlp produced no output file")
         audio_path = os.path.join(tmpdir, files[0])
 
-        with open(audio_path, "rb") as f:
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=f,
-                language="ja",
-                response_format="verbose_json",
-                timestamp_granularities=["segment"],
-            )
-
-    return [
-        {
-            "text": seg.text.strip(),
-            "start": round(seg.start, 3),
-            "duration": round(seg.end - seg.start, 3),
-        }
-        for seg in response.segments
-        if seg.text.strip()
-    ]
+        return transcribe_audio(audio_path)
 
 
 def fetch_youtube_transcript(video_id: str) -> list:
@@ -188,6 +330,9 @@ def fetch_youtube_transcript(video_id: str) -> list:
 
 _tokenizer = Tokenizer()
 
+# Sentences tokenized per janome call; exercise selection usually stops within the first chunk
+_TOKENIZE_CHUNK = 48
+
 
 def _load_jlpt_vocab(conn: sqlite3.Connection) -> dict:
     """Load JLPT vocab map (expression → {level, meaning}) if the vocabulary table exists."""
@@ -198,6 +343,47 @@ def _load_jlpt_vocab(conn: sqlite3.Connection) -> dict:
         return {}
 
 
+_SENTENCE_END = re.compile(r"[。？！?!]")
+
+
+def _split_at_punctuation(transcript: list) -> list:
+    """Split captions into sentences at 。？！?! in one pass over the text.
+
+    Segments are joined (with a space unless the text so far ends a sentence or
+    line) and split after each sentence ender. A sentence's timestamp is the start
+    of the segment holding its first character, found by bisecting the segments'
+    text offsets.
+    """
+    parts = []
+    offsets = []
+    starts = []
+    length = 0
+    tail = ""
+    for seg in transcript:
+        text = seg["text"]
+        offsets.append(length)
+        starts.append(seg["start"])
+        parts.append(text)
+        length += len(text)
+        tail = text[-1] if text else tail
+        if tail not in ("。", "？", "！", "\n"):
+            parts.append(" ")
+            length += 1
+            tail = " "
+    full_text = "".join(parts)
+
+    sentences = []
+    piece_start = 0
+    for end in [m.end() for m in _SENTENCE_END.finditer(full_text)] + [len(full_text)]:
+        piece = full_text[piece_start:end]
+        s = piece.strip()
+        if len(s) >= 5:
+            pos = piece_start + len(piece) - len(piece.lstrip())
+            sentences.append({"text": s, "start": starts[bisect_right(offsets, pos) - 1]})
+        piece_start = end
+    return sentences
+
+
 def _merge_transcript_to_sentences(transcript: list) -> list:
     """Merge subtitle segments into proper Japanese sentences.
 
@@ -224,33 +410,7 @@ def _merge_transcript_to_sentences(transcript: list) -> list:
 
     if dense_punctuation:
         # Punctuation-based splitting for YouTube captions
-        full_text = ""
-        char_timestamps = []
-        for seg in transcript:
-            start_offset = len(full_text)
-            full_text += seg["text"]
-            char_timestamps.append((start_offset, seg["start"]))
-            if not full_text.endswith(("。", "？", "！", "\n")):
-                full_text += " "
-
-        raw_sentences = re.split(r'(?<=[。？！?!])\s*', full_text)
-        sentences = []
-        search_offset = 0
-        for s in raw_sentences:
-            s = s.strip()
-            if not s or len(s) < 5:
-                continue
-            pos = full_text.find(s, search_offset)
-            if pos >= 0:
-                search_offset = pos + len(s)
-            timestamp = 0.0
-            for char_off, ts in char_timestamps:
-                if char_off <= (pos if pos >= 0 else 0):
-                    timestamp = ts
-                else:
-                    break
-            sentences.append({"text": s, "start": timestamp})
-        return sentences
+        return _split_at_punctuation(transcript)
     else:
         # Segment-based grouping for Whisper output
         # Accumulate up to TARGET_LEN chars; also flush at any punctuation mark.
@@ -274,9 +434,35 @@ def _merge_transcript_to_sentences(transcript: list) -> list:
         return sentences
 
 
-def generate_video_exercises(video_id: str, transcript_json: str, conn: sqlite3.Connection, max_exercises: int = 12):
-    """Generate cloze exercises from a video transcript and insert them."""
-    transcript = json.loads(transcript_json)
+def _tokenize_sentences(texts: list[str]) -> Iterator[list]:
+    """Yield the janome tokens of each text, tokenizing a chunk of texts per call.
+
+    Each chunk is joined with newlines and tokenized once, then split back at the
+    newline tokens — much cheaper than one tokenize() per sentence. If a chunk doesn't
+    split back cleanly (janome merges whitespace next to the separator), its texts
+    are tokenized one by one.
+    """
+    for i in range(0, len(texts), _TOKENIZE_CHUNK):
+        chunk = texts[i:i + _TOKENIZE_CHUNK]
+        groups = [[]]
+        for token in _tokenizer.tokenize("\n".join(chunk)):
+            if token.surface == "\n":
+                groups.append([])
+            else:
+                groups[-1].append(token)
+
+        aligned = len(groups) == len(chunk) and all(
+            "".join(token.surface for token in group) == text for group, text in zip(groups, chunk)
+        )
+        if aligned:
+            yield from groups
+        else:
+            for text in chunk:
+                yield list(_tokenizer.tokenize(text))
+
+
+def generate_video_exercises(video_id: str, transcript: list, conn: sqlite3.Connection, max_exercises: int = 12):
+    """Generate cloze exercises from a video transcript ([{text, start, duration}, ...]) and insert them."""
     sentences = _merge_transcript_to_sentences(transcript)
 
     if not sentences:
@@ -288,16 +474,12 @@ def generate_video_exercises(video_id: str, transcript_json: str, conn: sqlite3.
     # Shuffle to get varied sentences
     random.shuffle(sentences)
 
-    exercises_created = 0
-    for sent_info in sentences:
-        if exercises_created >= max_exercises:
+    exercises = []
+    tokenized = _tokenize_sentences([sent_info["text"] for sent_info in sentences])
+    for sent_info, tokens in zip(sentences, tokenized):
+        if len(exercises) >= max_exercises:
             break
 
-        sentence = sent_info["text"]
-        timestamp = sent_info["start"]
-
-        tokens = list(_tokenizer.tokenize(sentence))
-
         # Find candidates (same logic as exercise_generator.py)
         candidates = []
         for i, token in enumerate(tokens):
@@ -313,57 +495,113 @@ def generate_video_exercises(video_id: str, transcript_json: str, conn: sqlite3.
             continue
 
         idx, chosen, jlpt_level, word_meaning = random.choice(candidates)
-        correct_answer = chosen.surface
-        pos = chosen.part_of_speech.split(",")[0]
 
         # Build question sentence
         parts = []
         for j, token in enumerate(tokens):
             parts.append("[＿＿＿]" if j == idx else token.surface)
-        question_sentence = "".join(parts)
 
-        # Use vocabulary meaning as hint if available; fall back to sentence translation
-        if word_meaning:
-            hint_chinese = word_meaning
-        else:
-            try:
-                hint_chinese = translate_text(sentence, target="zh-TW")
-            except Exception:
-                hint_chinese = ""
-
-        exercise_id = str(uuid.uuid4())
-        conn.execute('''
-            INSERT INTO video_exercises
-            (exercise_id, video_id, full_sentence, question_sentence, correct_answer,
-             part_of_speech, jlpt_level, hint_chinese, context_timestamp, created_timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            exercise_id, video_id, sentence, question_sentence, correct_answer,
-            pos, jlpt_level, hint_chinese, timestamp, datetime.now().isoformat()
-        ))
-
-        exercises_created += 1
+        exercises.append({
+            "sentence": sent_info["text"],
+            "timestamp": sent_info["start"],
+            "question_sentence": "".join(parts),
+            "correct_answer": chosen.surface,
+            "pos": chosen.part_of_speech.split(",")[0],
+            "jlpt_level": jlpt_level,
+            "hint_chinese": word_meaning,
+        })
+
+    # Use vocabulary meaning as hint if available; fall back to sentence translation,
+    # fetched for all such exercises in one batched request
+    untranslated = [ex for ex in exercises if not ex["hint_chinese"]]
+    try:
+        translations = translate_texts([ex["sentence"] for ex in untranslated], target="zh-TW")
+    except Exception:
+        translations = [""] * len(untranslated)
+    for ex, translation in zip(untranslated, translations):
+        ex["hint_chinese"] = translation
+
+    now = datetime.now().isoformat()
+    conn.executemany('''
+        INSERT INTO video_exercises
+        (exercise_id, video_id, full_sentence, question_sentence, correct_answer,
+         part_of_speech, jlpt_level, hint_chinese, context_timestamp, created_timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (
+            str(uuid.uuid4()), video_id, ex["sentence"], ex["question_sentence"], ex["correct_answer"],
+            ex["pos"], ex["jlpt_level"], ex["hint_chinese"], ex["timestamp"], now
+        )
+        for ex in exercises
+    ])
+
+    for n, ex in enumerate(exercises, 1):
         try:
-            print(f"  -> Video exercise {exercises_created}: blanked '{correct_answer}' (POS: {pos}, JLPT: N{jlpt_level or 'A'})")
+            print(f"  -> Video exercise {n}: blanked '{ex['correct_answer']}' (POS: {ex['pos']}, JLPT: N{ex['jlpt_level'] or 'A'})")
         except UnicodeEncodeError:
-            print(f"  -> Video exercise {exercises_created}: created (POS: {pos}, JLPT: N{jlpt_level or 'A'})")
+            print(f"  -> Video exercise {n}: created (POS: {ex['pos']}, JLPT: N{ex['jlpt_level'] or 'A'})")
 
     conn.commit()
-    print(f"Created {exercises_created} video exercises for video {video_id}")
-    return exercises_created
+    print(f"Created {len(exercises)} video exercises for video {video_id}")
+    return len(exercises)
 
 
 # ---------------------------------------------------------------------------
 # Main import pipeline
 # ---------------------------------------------------------------------------
 
-def import_video(url: str, db_path: str, use_whisper: bool = False) -> dict:
+IMPORT_STAGES = ("metadata", "transcript", "saving", "exercises", "done")
+
+
+def _fetch_transcript(video_ext_id: str, use_whisper: bool) -> list:
+    if use_whisper:
+        try:
+            print("  Transcribing with Whisper (this may take a minute)...")
+            transcript = transcribe_with_whisper(video_ext_id)
+            print(f"  Whisper: {len(transcript)} segments")
+            return transcript
+        except Exception as e:
+            print(f"  Whisper failed ({e}), falling back to YouTube captions")
+    return fetch_youtube_transcript(video_ext_id)
+
+
+def _fetch_sources(video_ext_id: str, use_whisper: bool, report: Callable[[str], None]) -> tuple[dict, list]:
+    """Fetch metadata and transcript concurrently; the import waits only for the slower one."""
+    report("metadata")
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="video-fetch") as pool:
+        transcript_future = pool.submit(_fetch_transcript, video_ext_id, use_whisper)
+        meta_future = pool.submit(fetch_youtube_metadata, video_ext_id)
+        meta = meta_future.result()
+        report("transcript")
+        transcript = transcript_future.result()
+    return meta, transcript
+
+
+def _finish_exercises(conn: sqlite3.Connection, video_id: str, transcript: list):
+    # Mark processed regardless so the video is visible
+    try:
+        generate_video_exercises(video_id, transcript, conn)
+    except Exception as e:
+        print(f"Exercise generation failed (video still saved): {e}")
+
+    conn.execute("UPDATE videos SET status = 'processed' WHERE video_id = ?", (video_id,))
+    conn.commit()
+
+
+def import_video(
+    url: str, db_path: str, use_whisper: bool = False, progress: Callable[[str], None] | None = None
+) -> dict:
     """Import a YouTube video: fetch metadata + transcript, generate exercises.
 
     Returns dict with video_id and title, or raises on error.
     If use_whisper=True, downloads audio and transcribes via OpenAI Whisper instead
     of using YouTube captions; falls back to captions if Whisper fails.
+
+    Safe to re-run after an interrupted import: a video saved but not yet processed
+    has its exercises regenerated instead of being imported again. `progress`, if
+    given, is called with each stage of IMPORT_STAGES as it starts.
     """
+    report = progress or (lambda stage: None)
     video_ext_id = parse_youtube_url(url)
 
     conn = sqlite3.connect(db_path)
@@ -371,28 +609,26 @@ def import_video(url: str, db_path: str, use_whisper: bool = False) -> dict:
     create_video_tables(conn)
 
     # Check if already imported
-    existing = conn.execute("SELECT video_id, title, status FROM videos WHERE external_id = ?", (video_ext_id,)).fetchone()
-    if existing:
+    existing = conn.execute(
+        "SELECT video_id, title, status FROM videos WHERE external_id = ?", (video_ext_id,)
+    ).fetchone()
+    if existing and existing["status"] == "processed":
         conn.close()
+        report("done")
         return {"video_id": existing["video_id"], "title": existing["title"], "already_exists": True}
+    if existing:
+        # An earlier attempt stopped after saving the video: redo only the exercises
+        report("exercises")
+        conn.execute("DELETE FROM video_exercises WHERE video_id = ?", (existing["video_id"],))
+        _finish_exercises(conn, existing["video_id"], load_transcript(conn, existing["video_id"]))
+        conn.close()
+        report("done")
+        return {"video_id": existing["video_id"], "title": existing["title"], "already_exists": False}
 
-    # Fetch metadata
-    meta = fetch_youtube_metadata(video_ext_id)
-
-    # Fetch transcript
-    if use_whisper:
-        try:
-            print("  Transcribing with Whisper (this may take a minute)...")
-            transcript = transcribe_with_whisper(video_ext_id)
-            print(f"  Whisper: {len(transcript)} segments")
-        except Exception as e:
-            print(f"  Whisper failed ({e}), falling back to YouTube captions")
-            transcript = fetch_youtube_transcript(video_ext_id)
-    else:
-        transcript = fetch_youtube_transcript(video_ext_id)
+    # Fetch metadata and transcript
+    meta, transcript = _fetch_sources(video_ext_id, use_whisper, report)
 
     video_id = str(uuid.uuid4())
-    transcript_json = json.dumps(transcript, ensure_ascii=False)
 
     # Estimate duration from last subtitle
     duration = 0
@@ -402,26 +638,25 @@ def import_video(url: str, db_path: str, use_whisper: bool = False) -> dict:
 
     canonical_url = f"https://www.youtube.com/watch?v={video_ext_id}"
 
+    report("saving")
     conn.execute('''
         INSERT INTO videos
         (video_id, source, external_id, url, title, channel_name, thumbnail_url,
-         transcript_json, duration_seconds, status, created_timestamp)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+         duration_seconds, status, created_timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (
         video_id, "youtube", video_ext_id, canonical_url,
         meta["title"], meta["channel_name"], meta["thumbnail_url"],
-        transcript_json, duration, "unprocessed", datetime.now().isoformat()
+        duration, "unprocessed", datetime.now().isoformat()
     ))
+    # Same transaction as the video row: a saved video always has its transcript
+    save_transcript_segments(conn, video_id, transcript)
     conn.commit()
 
-    # Generate cloze exercises — mark processed regardless so the video is visible
-    try:
-        generate_video_exercises(video_id, transcript_json, conn)
-    except Exception as e:
-        print(f"Exercise generation failed (video still saved): {e}")
-
-    conn.execute("UPDATE videos SET status = 'processed' WHERE video_id = ?", (video_id,))
-    conn.commit()
+    # Generate cloze exercises
+    report("exercises")
+    _finish_exercises(conn, video_id, transcript)
 
     conn.close()
+    report("done")
     return {"video_id": video_id, "title": meta["title"], "already_exists": False}
@@ -0,0 +1,242 @@
+"""
+Chunked, parallel Whisper transcription.
+
+A whole video's audio sent as one request hits the upload limit (25 MB) on long
+videos and takes as long as one model call over the full audio. Instead:
+
+  1. Silence detection (ffmpeg's silencedetect) finds pauses, and the audio is cut
+     at the pause nearest each WHISPER_CHUNK_SECONDS mark. Where there is no pause
+     within reach, the cut falls mid-speech.
+  2. Each chunk is re-encoded as mono 16 kHz MP3, padded by WHISPER_OVERLAP_SECONDS on
+     both sides so a word on a cut is heard whole by at least one chunk.
+  3. Chunks are transcribed concurrently, at most WHISPER_MAX_PARALLEL at a time.
+  4. Segment timestamps are shifted by their chunk's offset. Each segment is kept
+     only by the chunk whose own span contains its midpoint, and a segment repeated
+     on both sides of a cut is dropped once.
+
+Without ffmpeg on the PATH, or for audio shorter than a chunk, the file is sent as
+a single request as before.
+
+Backends are pluggable: anything with transcribe(audio_path) returning
+[{"text", "start", "end"}, ...] (seconds from the start of that file) works.
+OpenAIWhisperBackend talks to OpenAI's API or any compatible server
+(WHISPER_BASE_URL), which is how tests and benchmarks use a local stub.
+
+Public API:
+  - OpenAIWhisperBackend(model, language, base_url)
+  - get_transcription_backend()                      — the default backend from the environment
+  - transcribe_audio(audio_path, backend=None, ...)  — [{text, start, duration}, ...] for the whole file
+  - plan_chunks(duration, silences, ...)             — where to cut (pure; used by transcribe_audio)
+  - stitch_segments(chunks, results)                 — merge per-chunk segments (pure)
+"""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "whisper-1")
+WHISPER_BASE_URL = os.getenv("WHISPER_BASE_URL") or None
+WHISPER_CHUNK_SECONDS = float(os.getenv("WHISPER_CHUNK_SECONDS", "600"))
+WHISPER_MAX_PARALLEL = int(os.getenv("WHISPER_MAX_PARALLEL", "4"))
+WHISPER_OVERLAP_SECONDS = float(os.getenv("WHISPER_OVERLAP_SECONDS", "1.0"))
+# silencedetect: quieter than this for at least this long counts as a pause
+WHISPER_SILENCE_DB = float(os.getenv("WHISPER_SILENCE_DB", "-35"))
+WHISPER_SILENCE_MIN_SECONDS = float(os.getenv("WHISPER_SILENCE_MIN_SECONDS", "0.4"))
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class OpenAIWhisperBackend:
+    """Whisper through the OpenAI API, or a compatible server at `base_url`."""
+
+    def __init__(self, model: str = WHISPER_MODEL, language: str = "ja", base_url: str | None = WHISPER_BASE_URL):
+        from openai import OpenAI
+
+        self.model = model
+        self.language = language
+        self.client = OpenAI(base_url=base_url) if base_url else OpenAI()
+
+    def transcribe(self, audio_path: str) -> list[dict]:
+        with open(audio_path, "rb") as f:
+            response = self.client.audio.transcriptions.create(
+                model=self.model,
+                file=f,
+                language=self.language,
+                response_format="verbose_json",
+                timestamp_granularities=["segment"],
+            )
+        return [{"text": seg.text, "start": seg.start, "end": seg.end} for seg in response.segments]
+
+
+def get_transcription_backend() -> OpenAIWhisperBackend:
+    return OpenAIWhisperBackend()
+
+
+# ---------------------------------------------------------------------------
+# Chunk planning and stitching
+# ---------------------------------------------------------------------------
+
+class AudioChunk:
+    """A slice of the audio: [start, end) is sent, [keep_from, keep_until) is its own span."""
+
+    def __init__(self, index: int, start: float, end: float, keep_from: float, keep_until: float):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.keep_from = keep_from
+        self.keep_until = keep_until
+
+    def __repr__(self):
+        return f"AudioChunk({self.index}, {self.start:.2f}–{self.end:.2f}, keeps {self.keep_from:.2f}–{self.keep_until:.2f})"
+
+
+def plan_chunks(duration: float, silences: list[tuple[float, float]], chunk_seconds: float = WHISPER_CHUNK_SECONDS,
+                overlap_seconds: float = WHISPER_OVERLAP_SECONDS) -> list[AudioChunk]:
+    """
+    Split [0, duration) near every `chunk_seconds`, preferring the middle of a pause.
+
+    Each cut goes at the midpoint of the pause closest to the chunk_seconds mark among
+    those between half and one and a half chunks from the previous cut; with no pause
+    there, it goes at the mark itself. Chunks are padded by `overlap_seconds` across
+    each cut.
+    """
+    midpoints = sorted((start + end) / 2 for start, end in silences)
+    cuts = [0.0]
+    while duration - cuts[-1] > chunk_seconds * 1.5:
+        target = cuts[-1] + chunk_seconds
+        nearby = [m for m in midpoints if cuts[-1] + chunk_seconds / 2 <= m <= cuts[-1] + chunk_seconds * 1.5]
+        cuts.append(min(nearby, key=lambda m: abs(m - target)) if nearby else target)
+    cuts.append(duration)
+
+    last = len(cuts) - 2
+    return [
+        AudioChunk(
+            index=i,
+            start=max(0.0, keep_from - overlap_seconds),
+            end=min(duration, keep_until + overlap_seconds),
+            keep_from=keep_from,
+            # Whatever the last chunk hears past the nominal duration is still its own
+            keep_until=keep_until if i < last else float("inf"),
+        )
+        for i, (keep_from, keep_until) in enumerate(zip(cuts, cuts[1:]))
+    ]
+
+
+def _same_speech(previous: dict, segment: dict) -> bool:
+    """A segment transcribed by both chunks of a cut: overlapping in time, one text containing the other."""
+    overlaps = segment["start"] < previous["end"]
+    return overlaps and (segment["text"] in previous["text"] or previous["text"] in segment["text"])
+
+
+def stitch_segments(chunks: list[AudioChunk], results: list[list[dict]]) -> list[dict]:
+    """
+    Merge per-chunk segments (timestamps relative to each chunk) into one timeline.
+
+    Returns list of dicts: [{text, start, duration}, ...] — the format of
+    fetch_youtube_transcript() — in time order.
+    """
+    stitched = []
+    for chunk, segments in zip(chunks, results):
+        for seg in segments:
+            text = seg["text"].strip()
+            if not text:
+                continue
+            start, end = chunk.start + seg["start"], chunk.start + seg["end"]
+            midpoint = (start + end) / 2
+            if not chunk.keep_from <= midpoint < chunk.keep_until:
+                continue
+            segment = {"text": text, "start": start, "end": end}
+            if stitched and _same_speech(stitched[-1], segment):
+                # Keep the fuller transcription of the two
+                if len(text) > len(stitched[-1]["text"]):
+                    stitched[-1] = segment
+                continue
+            stitched.append(segment)
+
+    return [
+        {"text": seg["text"], "start": round(seg["start"], 3), "duration": round(seg["end"] - seg["start"], 3)}
+        for seg in stitched
+    ]
+
+
+# ---------------------------------------------------------------------------
+# ffmpeg
+# ---------------------------------------------------------------------------
+
+def _ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def _probe_duration(audio_path: str) -> float:
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", audio_path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return float(out.strip())
+
+
+def _detect_silences(audio_path: str) -> list[tuple[float, float]]:
+    """(start, end) of every pause, from ffmpeg's silencedetect log."""
+    log = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-i", audio_path,
+         "-af", f"silencedetect=noise={WHISPER_SILENCE_DB}dB:d={WHISPER_SILENCE_MIN_SECONDS}", "-f", "null", "-"],
+        capture_output=True, text=True, check=True,
+    ).stderr
+    starts = [float(s) for s in re.findall(r"silence_start: (-?[\d.]+)", log)]
+    ends = [float(e) for e in re.findall(r"silence_end: ([\d.]+)", log)]
+    return list(zip(starts, ends))
+
+
+def _cut_chunk(audio_path: str, chunk: AudioChunk, out_dir: str) -> str:
+    out_path = os.path.join(out_dir, f"chunk_{chunk.index:04d}.mp3")
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-ss", f"{chunk.start:.3f}", "-to", f"{chunk.end:.3f}",
+         "-i", audio_path, "-ac", "1", "-ar", "16000", "-b:a", "48k", out_path],
+        check=True,
+    )
+    return out_path
+
+
+# ---------------------------------------------------------------------------
+# Transcription
+# ---------------------------------------------------------------------------
+
+def transcribe_audio(audio_path: str, backend: Any = None, max_parallel: int = WHISPER_MAX_PARALLEL,
+                     chunk_seconds: float = WHISPER_CHUNK_SECONDS) -> list[dict]:
+    """
+    Transcribe an audio file, in parallel chunks when it is long.
+
+    Args:
+        audio_path (str): Any format ffmpeg reads.
+        backend: Object with transcribe(path) -> [{text, start, end}, ...]; defaults
+            to get_transcription_backend().
+        max_parallel (int): Chunks transcribed at once.
+        chunk_seconds (float): Target chunk length.
+
+    Returns:
+        list: [{text, start, duration}, ...] in time order. Raises if any chunk fails.
+    """
+    backend = backend or get_transcription_backend()
+
+    if not _ffmpeg_available():
+        print("  ffmpeg not found; sending the audio to Whisper in one request")
+        return stitch_segments([AudioChunk(0, 0.0, float("inf"), 0.0, float("inf"))], [backend.transcribe(audio_path)])
+
+    duration = _probe_duration(audio_path)
+    chunks = plan_chunks(duration, _detect_silences(audio_path), chunk_seconds=chunk_seconds)
+    if len(chunks) == 1:
+        return stitch_segments(chunks, [backend.transcribe(audio_path)])
+
+    print(f"  Whisper: {duration:.0f}s of audio in {len(chunks)} chunks, {max_parallel} at a time")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        def transcribe_chunk(chunk: AudioChunk) -> list[dict]:
+            return backend.transcribe(_cut_chunk(audio_path, chunk, tmpdir))
+
+        with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="whisper") as pool:
+            results = list(pool.map(transcribe_chunk, chunks))
+    return stitch_segments(chunks, results)
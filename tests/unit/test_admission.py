@@ -0,0 +1,147 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from flask import Flask, Response, jsonify
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import admission
+from admission import AdmissionLimiter, TokenBucket, limited, limited_async
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_wait_for_refill(self):
+        bucket = TokenBucket(per_minute=60, burst=2)
+        self.assertEqual(bucket.try_take(), 0)
+        self.assertEqual(bucket.try_take(), 0)
+        wait = bucket.try_take()
+        self.assertGreater(wait, 0.9)
+        self.assertLessEqual(wait, 1.0)
+
+
+class TestAdmissionLimiter(unittest.TestCase):
+    def test_rate_limit_is_per_user(self):
+        limiter = AdmissionLimiter("t", per_minute=1, burst=1, max_concurrent=0)
+        release, _ = limiter.admit("user:a")
+        release()
+        self.assertIsNone(limiter.admit("user:a")[0])
+        self.assertIsNotNone(limiter.admit("user:b")[0])
+        self.assertEqual(limiter.stats()["rate_limited"], 1)
+
+    def test_queue_waits_for_a_slot_and_overflow_is_rejected(self):
+        limiter = AdmissionLimiter("t", per_minute=600, burst=10, max_concurrent=1, max_queue=1, queue_timeout=2)
+        release, _ = limiter.admit("user:a")
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(limiter.admit("user:b")))
+        waiter.start()
+        while limiter.stats()["queued"] == 0:
+            time.sleep(0.005)
+
+        # The queue holds one waiter; the next request is turned away at once
+        rejected, retry_after = limiter.admit("user:c")
+        self.assertIsNone(rejected)
+        self.assertEqual(retry_after, 2)
+
+        release()
+        waiter.join(2)
+        self.assertIsNotNone(results[0][0])
+        self.assertEqual(limiter.stats()["in_flight"], 1)
+        results[0][0]()
+        self.assertEqual(limiter.stats(), {"in_flight": 0, "queued": 0, "admitted": 2,
+                                           "rate_limited": 0, "overloaded": 1})
+
+    def test_queue_timeout_rejects(self):
+        limiter = AdmissionLimiter("t", per_minute=600, burst=10, max_concurrent=1, max_queue=4, queue_timeout=0.05)
+        limiter.admit("user:a")
+        self.assertIsNone(limiter.admit("user:b")[0])
+        self.assertEqual(limiter.stats()["overloaded"], 1)
+
+
+class TestLimitedRoute(unittest.TestCase):
+    def setUp(self):
+        self.limiter = AdmissionLimiter("test", per_minute=60, burst=2, max_concurrent=1, max_queue=0)
+        patcher = patch.dict(admission._limiters, {"test": self.limiter})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        app = Flask(__name__)
+
+        @app.route('/chat', methods=['POST'])
+        @limited('test')
+        def chat():
+            return jsonify({"ok": True})
+
+        @app.route('/stream/<user_id>')
+        @limited('test')
+        def stream(user_id):
+            return Response(iter(["a", "b"]), mimetype="text/plain")
+
+        self.client = app.test_client()
+
+    def test_over_limit_gets_429_with_retry_after(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post('/chat', json={"user_id": "u1"}).status_code, 200)
+        response = self.client.post('/chat', json={"user_id": "u1"})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        self.assertEqual(self.client.post('/chat', json={"user_id": "u2"}).status_code, 200)
+
+    def test_streamed_response_holds_its_slot_until_closed(self):
+        response = self.client.get('/stream/u1', buffered=False)
+        self.assertEqual(self.limiter.stats()["in_flight"], 1)
+        self.assertEqual(self.client.get('/stream/u2').status_code, 429)
+        self.assertEqual(b"".join(response.response), b"ab")
+        response.close()
+        self.assertEqual(self.limiter.stats()["in_flight"], 0)
+
+    def test_disabled(self):
+        with patch.object(admission, "ADMISSION_CONTROL", False):
+            for _ in range(4):
+                self.assertEqual(self.client.post('/chat', json={"user_id": "u1"}).status_code, 200)
+
+
+class TestLimitedAsgiRoute(unittest.TestCase):
+    def setUp(self):
+        self.limiter = AdmissionLimiter("test", per_minute=60, burst=2, max_concurrent=1, max_queue=0)
+        patcher = patch.dict(admission._limiters, {"test": self.limiter})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        @limited_async('test')
+        async def chat(request):
+            data = await request.json()
+            return JSONResponse({"ok": True, "message": data.get("message")})
+
+        @limited_async('test')
+        async def review(request):
+            return JSONResponse({"in_flight": self.limiter.stats()["in_flight"]})
+
+        app = Starlette(routes=[
+            Route('/chat', chat, methods=['POST']),
+            Route('/review/{user_id}', review, methods=['GET']),
+        ])
+        self.client = TestClient(app)
+
+    def test_same_limits_as_flask_routes(self):
+        for _ in range(2):
+            response = self.client.post('/chat', json={"user_id": "u1", "message": "hi"})
+            self.assertEqual(response.json(), {"ok": True, "message": "hi"})
+        response = self.client.post('/chat', json={"user_id": "u1", "message": "hi"})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        # The slot is held while the handler runs, and released after
+        self.assertEqual(self.client.get('/review/u2').json(), {"in_flight": 1})
+        self.assertEqual(self.limiter.stats()["in_flight"], 0)
+
+    def test_disabled(self):
+        with patch.object(admission, "ADMISSION_CONTROL", False):
+            for _ in range(4):
+                self.assertEqual(self.client.get('/review/u1').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from apps.backend.agent_service import generate_daily_review, generate_daily_review_agent
+from deadline import deadline_after
+from review_service import (
+    create_review_tables,
+    get_or_generate_daily_review,
+    get_or_generate_daily_review_async,
+    pregenerate_daily_reviews,
+)
+
+COMPLETE = {"result": "📅 今日錯題回顧", "is_complete": True}
+
+
+def _make_db_with_mistakes(path):
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE exercise (exercise_id TEXT, question_sentence TEXT, correct_answer TEXT);
+        CREATE TABLE answer_log (log_id TEXT, user_id TEXT, exercise_id TEXT, user_answer TEXT,
+                                 is_correct INTEGER, answered_timestamp TEXT, error_type TEXT);
+    ''')
+    conn.execute("INSERT INTO exercise VALUES ('e1', '私[＿＿＿]学生です。', 'は')")
+    conn.execute("INSERT INTO answer_log VALUES ('l1', 'u1', 'e1', 'が', 0, ?, 'particle')",
+                 (datetime.now().isoformat(),))
+    conn.commit()
+    conn.close()
+
+
+class TestDailyReviewSinglePass(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        _make_db_with_mistakes(self.db_path)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    @patch('graphs.review_graph.query_llm')
+    @patch('graphs.review_graph.query_llm_json')
+    def test_single_pass_makes_one_call(self, mock_llm_json, mock_llm):
+        mock_llm_json.return_value = {
+            "data": {"weak_points": ["は/が"], "review_markdown": "📅 今日錯題回顧\n- **は** 與 **が**"},
+            "retry_count": 0,
+            "error": None,
+        }
+
+        review = generate_daily_review_agent("u1", self.db_path, strategy="single", polish=False)
+
+        self.assertEqual(review, "📅 今日錯題回顧\n- **は** 與 **が**")
+        mock_llm_json.assert_called_once()
+        mock_llm.assert_not_called()
+
+    @patch('graphs.review_graph.query_llm', return_value="📅 今日錯題回顧（潤飾版）")
+    @patch('graphs.review_graph.query_llm_json')
+    def test_polish_pass_reuses_prompt_prefix(self, mock_llm_json, mock_llm):
+        mock_llm_json.return_value = {
+            "data": {"weak_points": ["は/が"], "review_markdown": "草稿"},
+            "retry_count": 0,
+            "error": None,
+        }
+
+        review = generate_daily_review_agent("u1", self.db_path, strategy="single", polish=True)
+
+        self.assertEqual(review, "📅 今日錯題回顧（潤飾版）")
+        compose_messages = mock_llm_json.call_args.args[0]
+        polish_messages = mock_llm.call_args.args[0]
+        self.assertEqual(polish_messages[:len(compose_messages)], compose_messages)
+        self.assertEqual(polish_messages[len(compose_messages)], {"role": "assistant", "content": "草稿"})
+
+    @patch('graphs.review_graph.query_llm')
+    @patch('graphs.review_graph.query_llm_json')
+    def test_polish_is_skipped_near_the_deadline(self, mock_llm_json, mock_llm):
+        mock_llm_json.return_value = {
+            "data": {"weak_points": ["は/が"], "review_markdown": "草稿"},
+            "retry_count": 0,
+            "error": None,
+        }
+        deadline = deadline_after(5)
+
+        review = generate_daily_review("u1", self.db_path, strategy="single", polish=True, deadline=deadline)
+
+        # The draft is served, but without its polish pass it is not a finished review
+        self.assertEqual(review, {"result": "草稿", "is_complete": False})
+        self.assertEqual(mock_llm_json.call_args.kwargs["deadline"], deadline)
+        mock_llm.assert_not_called()
+
+    @patch('graphs.review_graph.query_llm')
+    def test_agent_review_is_complete_only_after_polish(self, mock_llm):
+        mock_llm.side_effect = ["分析", "草稿", "📅 今日錯題回顧"]
+        self.assertEqual(generate_daily_review("u1", self.db_path, strategy="agent"), COMPLETE)
+
+        # Polish failed: the draft is returned, but not as a finished review
+        mock_llm.side_effect = ["分析", "草稿", TimeoutError("polish")]
+        self.assertEqual(generate_daily_review("u1", self.db_path, strategy="agent"),
+                         {"result": "草稿", "is_complete": False})
+
+        # Draft failed: the analysis is returned
+        mock_llm.side_effect = ["分析", TimeoutError("draft")]
+        self.assertEqual(generate_daily_review("u1", self.db_path, strategy="agent"),
+                         {"result": "分析", "is_complete": False})
+
+        # Polish skipped near the deadline: the draft again
+        mock_llm.side_effect = ["分析", "草稿"]
+        self.assertEqual(generate_daily_review("u1", self.db_path, strategy="agent", deadline=deadline_after(5)),
+                         {"result": "草稿", "is_complete": False})
+
+
+class TestDailyReviewStorage(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        _make_db_with_mistakes(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            create_review_tables(conn)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    @patch('review_service.generate_daily_review', return_value=COMPLETE)
+    def test_review_is_served_from_storage_until_mistakes_change(self, mock_generate):
+        self.assertEqual(get_or_generate_daily_review("u1", self.db_path), ("📅 今日錯題回顧", False))
+        self.assertEqual(get_or_generate_daily_review("u1", self.db_path), ("📅 今日錯題回顧", True))
+        self.assertEqual(mock_generate.call_count, 1)
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO exercise VALUES ('e2', '駅[＿＿＿]行きます。', 'に')")
+            conn.execute("INSERT INTO answer_log VALUES ('l2', 'u1', 'e2', 'を', 0, ?, 'particle')",
+                         (datetime.now().isoformat(),))
+
+        self.assertEqual(get_or_generate_daily_review("u1", self.db_path), ("📅 今日錯題回顧", False))
+        self.assertEqual(mock_generate.call_count, 2)
+
+    @patch('review_service.generate_daily_review', return_value={"result": "草稿", "is_complete": False})
+    def test_degraded_review_is_not_stored(self, mock_generate):
+        self.assertEqual(get_or_generate_daily_review("u1", self.db_path), ("草稿", False))
+        self.assertEqual(get_or_generate_daily_review("u1", self.db_path), ("草稿", False))
+        self.assertEqual(mock_generate.call_count, 2)
+        self.assertEqual(pregenerate_daily_reviews(self.db_path),
+                         {"users": 1, "generated": 0, "cached": 0, "failed": 1})
+
+    def test_async_path_shares_the_stored_review(self):
+        async def generate(user_id, db_path, deadline=None):
+            return COMPLETE
+
+        with patch('review_service.generate_daily_review_async', side_effect=generate) as mock_generate:
+            self.assertEqual(asyncio.run(get_or_generate_daily_review_async("u1", self.db_path)),
+                             ("📅 今日錯題回顧", False))
+            self.assertEqual(asyncio.run(get_or_generate_daily_review_async("u1", self.db_path)),
+                             ("📅 今日錯題回顧", True))
+            mock_generate.assert_called_once()
+        # Stored by the async path, served to the sync one (and vice versa)
+        self.assertEqual(get_or_generate_daily_review("u1", self.db_path), ("📅 今日錯題回顧", True))
+
+    @patch('review_service.generate_daily_review', return_value=COMPLETE)
+    def test_pregeneration_covers_users_with_mistakes_today(self, mock_generate):
+        self.assertEqual(pregenerate_daily_reviews(self.db_path, max_workers=2),
+                         {"users": 1, "generated": 1, "cached": 0, "failed": 0})
+        self.assertEqual(pregenerate_daily_reviews(self.db_path, max_workers=2),
+                         {"users": 1, "generated": 0, "cached": 1, "failed": 0})
+        mock_generate.assert_called_once_with("u1", self.db_path, deadline=None)
+
+
+if __name__ == "__main__":
+    unittest.main()
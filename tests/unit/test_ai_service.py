@@ -1,9 +1,20 @@
+import threading
+import time
 import unittest
-from unittest.mock import patch, MagicMock
-from apps.backend.ai_service import evaluate_submission
+from unittest.mock import AsyncMock, patch, MagicMock
+from apps.backend.ai_service import evaluate_submission, evaluate_submission_async, stream_detailed_feedback
+from ai_core import ErrorType
+from batching import MicroBatcher
+from deadline import DeadlineExceeded, deadline_after, remaining
+from error_classifier import classify_submission
+from graphs import chat_graph
+from graphs.eval_graph import EVAL_LOCAL_MIN_CONFIDENCE, _evaluate_batch
+from llm_scheduler import current_request_class, request_class
+from token_budget import estimate_tokens
 
 class TestAIService(unittest.TestCase):
 
+    @patch('graphs.eval_graph.EVAL_LOCAL_MIN_CONFIDENCE', 1.1)  # force the LLM path
     @patch('ai_core.check_safety', return_value={"violation": 0, "rationale": "test"})
     @patch('ai_core.query_llm')
     def test_typo_correction(self, mock_llm, mock_safety):
@@ -22,5 +33,218 @@ class TestAIService(unittest.TestCase):
         # Verify we actually called the LLM
         mock_llm.assert_called_once()
 
+    @patch('ai_core.check_safety', return_value={"violation": 0, "rationale": "test"})
+    @patch('graphs.eval_graph.query_llm_stream')
+    def test_detailed_feedback_stream(self, mock_stream, mock_safety):
+        mock_stream.return_value = iter(["**助詞**", "「は」", "表示主題。"])
+
+        events = list(stream_detailed_feedback("私[＿＿＿]学生です。", "が", "は"))
+
+        chunks = [payload for kind, payload in events if kind == "chunk"]
+        self.assertEqual(chunks, ["**助詞**", "「は」", "表示主題。"])
+        self.assertEqual(events[-1], ("final", {"result": "**助詞**「は」表示主題。", "is_complete": True}))
+
+    @patch('ai_core.check_safety', return_value={"violation": 0, "rationale": "test"})
+    @patch('graphs.eval_graph.query_llm_stream', side_effect=RuntimeError("boom"))
+    def test_detailed_feedback_stream_failure_not_persistable(self, mock_stream, mock_safety):
+        events = list(stream_detailed_feedback("私[＿＿＿]学生です。", "が", "は"))
+
+        kind, final = events[-1]
+        self.assertEqual(kind, "final")
+        self.assertFalse(final["is_complete"])
+
+    @patch('graphs.eval_graph.check_safety')
+    @patch('graphs.eval_graph.query_llm_json')
+    def test_particle_swap_decided_locally(self, mock_llm_json, mock_safety):
+        result = evaluate_submission("私[＿＿＿]学生です。", "が", "は")
+
+        self.assertEqual(result['error_type'], 'particle')
+        self.assertEqual(result['score'], 95)
+        self.assertIn("「は」", result['feedback'])
+        mock_llm_json.assert_not_called()
+        mock_safety.assert_not_called()
+
+    def test_local_classifier_defers_word_choice(self):
+        self.assertEqual(classify_submission("買う", "書く")["confidence"], 0.0)
+        self.assertEqual(classify_submission("食べない", "食べません")["error_type"], ErrorType.CONJUGATION)
+        self.assertEqual(classify_submission("勉強てます", "勉強します")["error_type"], ErrorType.TYPO)
+
+    def test_local_classifier_defers_homophones(self):
+        # Same reading, different word: a vocabulary error the local rules can't tell from a slip
+        for user, correct in [("箸", "橋"), ("会う", "合う"), ("聞く", "効く")]:
+            self.assertLess(classify_submission(user, correct)["confidence"], EVAL_LOCAL_MIN_CONFIDENCE)
+        self.assertGreaterEqual(classify_submission("はし", "橋")["confidence"], EVAL_LOCAL_MIN_CONFIDENCE)
+
+class TestEvalBatching(unittest.TestCase):
+
+    STATES = [
+        {"question": "私[＿＿＿]学生です。", "user_answer": "が", "correct_answer": "は", "messages": ["single-1"]},
+        {"question": "学校[＿＿＿]行きます。", "user_answer": "を", "correct_answer": "に", "messages": ["single-2"]},
+    ]
+
+    @patch('graphs.eval_graph.query_llm_json')
+    def test_batch_results_fanned_out_by_id(self, mock_llm_json):
+        mock_llm_json.return_value = {
+            "data": {"results": [
+                {"id": 2, "error_type": "particle", "reasoning": "方向用「に」"},
+                {"id": 1, "error_type": "particle", "reasoning": "主題用「は」"},
+            ]},
+            "retry_count": 0,
+            "error": None,
+        }
+
+        results = _evaluate_batch(self.STATES)
+
+        mock_llm_json.assert_called_once()
+        self.assertEqual([r["data"]["reasoning"] for r in results], ["主題用「は」", "方向用「に」"])
+
+    @patch('graphs.eval_graph.query_llm_json')
+    def test_unusable_batch_falls_back_to_single_calls(self, mock_llm_json):
+        single = {"data": {"error_type": "particle", "reasoning": "x"}, "retry_count": 0, "error": None}
+        mock_llm_json.side_effect = [
+            {"data": {"results": [{"error_type": "particle"}]}, "retry_count": 0, "error": None},
+            single,
+            single,
+        ]
+
+        results = _evaluate_batch(self.STATES)
+
+        self.assertEqual(mock_llm_json.call_count, 3)
+        self.assertEqual(results, [single, single])
+
+    @patch('graphs.eval_graph.query_llm_json')
+    def test_failed_shared_call_scores_each_item_under_its_own_deadline(self, mock_llm_json):
+        single = {"data": {"error_type": "particle", "reasoning": "x"}, "retry_count": 0, "error": None}
+
+        def upstream(messages, deadline=None, **kwargs):
+            if deadline is not None and remaining(deadline) <= 0:
+                raise DeadlineExceeded("out of time")
+            return single
+
+        mock_llm_json.side_effect = upstream
+        states = [{**self.STATES[0], "deadline": deadline_after(-1)},
+                  {**self.STATES[1], "deadline": deadline_after(30)},
+                  {**self.STATES[1], "deadline": None}]
+
+        results = _evaluate_batch(states)
+
+        self.assertIsInstance(results[0], DeadlineExceeded)
+        self.assertEqual(results[1:], [single, single])
+
+        batcher = MicroBatcher(lambda items: [RuntimeError("x") if i == 0 else i for i in items])
+        futures = [batcher.submit(i) for i in range(2)]
+        self.assertIsInstance(futures[0].exception(timeout=5), RuntimeError)
+        self.assertEqual(futures[1].result(timeout=5), 1)
+
+    def test_micro_batcher_groups_concurrent_submissions(self):
+        sizes = []
+        first_batch = threading.Event()
+
+        def double(items):
+            sizes.append(len(items))
+            first_batch.wait(5)
+            return [i * 2 for i in items]
+
+        batcher = MicroBatcher(double, max_batch_size=4, max_wait_ms=200)
+
+        # A lone submission goes out at once; while it is in flight, the next ones are grouped
+        futures = [batcher.submit(0)]
+        while not sizes:
+            time.sleep(0.005)
+        futures += [batcher.submit(i) for i in range(1, 7)]
+        first_batch.set()
+
+        self.assertEqual([f.result(timeout=5) for f in futures], [0, 2, 4, 6, 8, 10, 12])
+        self.assertEqual(sorted(sizes), [1, 2, 4])
+
+    def test_lone_submission_does_not_wait_and_keeps_its_context(self):
+        batcher = MicroBatcher(lambda items: [current_request_class() for _ in items], max_wait_ms=2000)
+
+        start = time.monotonic()
+        with request_class("batch"):
+            future = batcher.submit("x")
+
+        self.assertEqual(future.result(timeout=5), "batch")
+        self.assertLess(time.monotonic() - start, 1.0)
+
+class TestChatHistoryBudget(unittest.TestCase):
+
+    # 14 turns of ~24 estimated tokens each
+    HISTORY = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i}" + "あ" * 20} for i in range(14)]
+
+    def setUp(self):
+        chat_graph._summary_cache.clear()
+
+    def test_estimate_tokens_mixed_text(self):
+        self.assertEqual(estimate_tokens("日本語を勉強します"), 9)
+        self.assertEqual(estimate_tokens("I study Japanese"), 4)
+        self.assertEqual(estimate_tokens("Tokyo に行きました"), 8)
+
+    @patch('graphs.chat_graph.query_llm')
+    def test_short_history_is_sent_verbatim(self, mock_llm):
+        summary, turns = chat_graph.fold_history(self.HISTORY[:3])
+
+        self.assertIsNone(summary)
+        self.assertEqual(turns, self.HISTORY[:3])
+        mock_llm.assert_not_called()
+
+    @patch('graphs.chat_graph.CHAT_SESSION_MODE', False)
+    @patch('graphs.chat_graph.CHAT_HISTORY_TOKEN_BUDGET', 40)
+    @patch('graphs.chat_graph._summary_executor')
+    @patch('graphs.chat_graph.query_llm', return_value="- 週末の話をした")
+    def test_older_turns_fold_into_cached_summary(self, mock_llm, mock_executor):
+        mock_executor.submit.side_effect = lambda fn, *args: fn(*args)
+
+        # First request: summary not ready yet, only the budgeted tail is sent
+        summary, turns = chat_graph.fold_history(self.HISTORY)
+        self.assertIsNone(summary)
+        self.assertEqual(turns, self.HISTORY[13:])
+
+        # Refreshed in the background: later requests send it plus the turns after it
+        state = chat_graph.build_context({"message": "こんにちは", "history": self.HISTORY, "locale": "en"})
+        messages = state["messages"]
+        self.assertEqual(messages[1], {"role": "system", "content": "Summary of the earlier conversation:\n- 週末の話をした"})
+        self.assertEqual(messages[2:], self.HISTORY[12:] + [{"role": "user", "content": "こんにちは"}])
+        mock_llm.assert_called_once()
+
+    @patch('graphs.chat_graph.CHAT_SESSION_MODE', True)
+    def test_session_mode_keeps_turns_prefix_stable(self):
+        profile = {"level_est": "N4", "weak_points": ["助詞"], "feedback_preference": "normal"}
+        first = chat_graph.build_context({"message": "週末は京都に行きました。", "history": self.HISTORY[:2],
+                                          "locale": "en", "learner_profile": profile})["messages"]
+
+        # Next turn, after the learner's weak points changed
+        profile = dict(profile, weak_points=["敬語"])
+        history = self.HISTORY[:2] + [{"role": "user", "content": "週末は京都に行きました。"},
+                                      {"role": "assistant", "content": "いいですね！"}]
+        second = chat_graph.build_context({"message": "お寺を見ました。", "history": history,
+                                           "locale": "en", "learner_profile": profile})["messages"]
+
+        # Everything before the weak-points note and the new message is resent byte for byte
+        self.assertEqual(second[:len(first) - 2], first[:-2])
+        self.assertNotIn("助詞", first[0]["content"])
+        self.assertEqual(second[-2]["content"],
+                         "The learner's current weak points (prioritize these in corrections): 敬語")
+
+
+class TestAIServiceAsync(unittest.IsolatedAsyncioTestCase):
+
+    @patch('graphs.eval_graph.EVAL_LOCAL_MIN_CONFIDENCE', 1.1)  # force the LLM path
+    @patch('graphs.eval_graph.check_safety_async', new_callable=AsyncMock,
+           return_value={"violation": 0, "rationale": "test"})
+    @patch('graphs.eval_graph.query_llm_json_async', new_callable=AsyncMock)
+    async def test_evaluate_submission_async(self, mock_llm_json, mock_safety):
+        mock_llm_json.return_value = {
+            "data": {"error_type": "particle", "reasoning": "助詞錯誤"},
+            "retry_count": 0,
+            "error": None,
+        }
+
+        result = await evaluate_submission_async("日本語[＿＿＿]勉強します。", "が", "を")
+
+        self.assertEqual(result['error_type'], 'particle')
+        self.assertEqual(result['score'], 95)
+        mock_llm_json.assert_awaited_once()
+
 if __name__ == "__main__":
     unittest.main()
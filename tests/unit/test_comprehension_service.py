@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import comprehension_service
+from comprehension_service import (
+    choose_question_set,
+    create_comprehension_tables,
+    explanation_context,
+    explanation_key,
+    get_question_sets,
+    get_saved_explanation,
+    pregenerate_explanations,
+    pregenerate_question_sets,
+    save_explanation,
+    save_question_set,
+)
+from video_service import create_video_tables, save_transcript_segments
+
+
+def _questions(tag: str, num: int = 5) -> list:
+    return [{"question": f"{tag}-{n}", "choices": ["A", "B", "C", "D"], "correct_index": 0, "explanation": ""}
+            for n in range(num)]
+
+
+def _explain(question, choices, correct_index, user_answer_index, context):
+    return {"is_correct": False, "feedback": f"{choices[user_answer_index]}ではなく{choices[correct_index]}",
+            "score": 0, "is_complete": user_answer_index != 3}
+
+
+@patch.object(comprehension_service, "COMPREHENSION_PREGENERATE_EXPLANATIONS", False)
+class TestComprehensionSets(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.conn = sqlite3.connect(self.db_path)
+        create_video_tables(self.conn)
+        create_comprehension_tables(self.conn)
+        self.conn.execute('''
+            INSERT INTO videos (video_id, source, url, title, status, created_timestamp)
+            VALUES ('v1', 'youtube', 'https://www.youtube.com/watch?v=abc123', 'テスト', 'processed', '2026-01-01')
+        ''')
+        save_transcript_segments(self.conn, "v1", [{"text": "今日はいい天気ですね。", "start": 0.0, "duration": 3.0}])
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.db_path)
+
+    def test_sets_are_keyed_on_size_and_prompt_version(self):
+        first = save_question_set(self.conn, "v1", 5, _questions("a"))
+        save_question_set(self.conn, "v1", 3, _questions("b", 3))
+        save_question_set(self.conn, "v1", 5, _questions("old"), prompt_version="0-single")
+
+        self.assertEqual(get_question_sets(self.conn, "v1", 5), [{"set_id": first, "questions": _questions("a")}])
+        self.assertEqual(len(get_question_sets(self.conn, "v1", 3)), 1)
+        self.assertEqual(get_question_sets(self.conn, "v2", 5), [])
+
+    @patch.object(comprehension_service, "COMPREHENSION_SETS_PER_VIDEO", 3)
+    def test_rotation_fills_up_then_cycles(self):
+        self.assertIsNone(choose_question_set([]))
+
+        sets = [{"set_id": "s1", "questions": []}]
+        self.assertEqual(choose_question_set(sets)["set_id"], "s1")
+        # Asking for other questions generates new sets until the rotation is full
+        self.assertIsNone(choose_question_set(sets, "s1"))
+
+        sets += [{"set_id": "s2", "questions": []}, {"set_id": "s3", "questions": []}]
+        self.assertEqual(choose_question_set(sets, "s1")["set_id"], "s2")
+        self.assertEqual(choose_question_set(sets, "s3")["set_id"], "s1")
+        self.assertEqual(choose_question_set(sets, "unknown")["set_id"], "s1")
+
+    @patch('comprehension_service.generate_comprehension_questions')
+    def test_pregeneration_only_generates_missing_sets(self, mock_generate):
+        mock_generate.side_effect = lambda text, title, num: _questions(title, num)
+
+        self.assertEqual(pregenerate_question_sets(self.db_path, "v1", num_questions=5, sets=2), 2)
+        self.assertEqual(mock_generate.call_args.args, ("今日はいい天気ですね。", "テスト", 5))
+        self.assertEqual(len(get_question_sets(self.conn, "v1", 5)), 2)
+
+        # Already there, or nothing to generate from
+        self.assertEqual(pregenerate_question_sets(self.db_path, "v1", num_questions=5, sets=2), 0)
+        self.assertEqual(pregenerate_question_sets(self.db_path, "missing", num_questions=5, sets=2), 0)
+        self.assertEqual(mock_generate.call_count, 2)
+
+    @patch('comprehension_service.generate_comprehension_questions', return_value=[])
+    def test_failed_generation_is_not_stored(self, mock_generate):
+        self.assertEqual(pregenerate_question_sets(self.db_path, "v1", num_questions=5, sets=3), 0)
+        mock_generate.assert_called_once()
+        self.assertEqual(get_question_sets(self.conn, "v1", 5), [])
+
+    def test_explanations_are_keyed_on_question_choices_and_context(self):
+        key = explanation_key("質問", ["A", "B", "C", "D"], 0, 2, "字幕")
+        save_explanation(self.conn, key, "説明")
+
+        self.assertEqual(get_saved_explanation(self.conn, key), "説明")
+        # Same inputs from another learner, or with the choices at other positions
+        self.assertEqual(explanation_key("質問", ["A", "B", "C", "D"], 0, 2, "字幕"), key)
+        self.assertEqual(explanation_key("質問", ["C", "A", "B", "D"], 1, 0, "字幕"), key)
+        for other in (explanation_key("質問", ["A", "B", "C", "D"], 0, 1, "字幕"),
+                      explanation_key("質問", ["A", "B", "C", "D"], 0, 2, "別の字幕"),
+                      explanation_key("別の質問", ["A", "B", "C", "D"], 0, 2, "字幕")):
+            self.assertIsNone(get_saved_explanation(self.conn, other))
+
+    @patch('comprehension_service.check_comprehension_answer', side_effect=_explain)
+    def test_every_wrong_choice_is_explained_ahead(self, mock_check):
+        questions = _questions("q", 2)
+        context = explanation_context(self.conn, "v1")
+        self.assertEqual(context, "今日はいい天気ですね。")
+
+        # Three wrong choices per question; the fallback for choice D isn't stored
+        self.assertEqual(pregenerate_explanations(self.db_path, "v1", questions), 4)
+        self.assertEqual(mock_check.call_count, 6)
+        key = explanation_key("q-1", ["A", "B", "C", "D"], 0, 2, context)
+        self.assertEqual(get_saved_explanation(self.conn, key), "CではなくA")
+
+        # Only what is missing is generated again
+        self.assertEqual(pregenerate_explanations(self.db_path, "v1", questions), 0)
+        self.assertEqual(mock_check.call_count, 8)
+
+    @patch('comprehension_service.check_comprehension_answer', side_effect=_explain)
+    @patch('comprehension_service.generate_comprehension_questions', return_value=_questions("q", 1))
+    def test_pregenerated_sets_come_with_explanations(self, mock_generate, mock_check):
+        with patch.object(comprehension_service, "COMPREHENSION_PREGENERATE_EXPLANATIONS", True):
+            self.assertEqual(pregenerate_question_sets(self.db_path, "v1", num_questions=1, sets=1), 1)
+        self.assertEqual(mock_check.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,28 @@
+import asyncio
 import unittest
 from unittest.mock import patch, MagicMock
 import os
 import sys
 import importlib
+import json
+import threading
+import time
 
 # Add project root to sys.path
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
 if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
+import requests
+from pydantic import BaseModel
+
 import ai_core
+from deadline import DeadlineExceeded, deadline_after
+from http_pool import get_session
+from llm_router import LLMEndpoint, LLMRouter
+from llm_scheduler import PriorityScheduler, current_request_class, default_request_class, request_class
+from resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, RetryBudget
+from singleflight import SingleFlight
 
 class TestLLMSwitch(unittest.TestCase):
 
@@ -24,9 +37,9 @@ class TestLLMSwitch(unittest.TestCase):
         # Reload ai_core to restore state
         importlib.reload(ai_core)
 
-    @patch('ai_core.requests.post')
+    @patch('requests.Session.post')
     def test_ollama_provider(self, mock_post):
-        """Test default Ollama provider uses requests"""
+        """Test default Ollama provider uses the pooled requests session"""
         # Set Env
         os.environ['LLM_PROVIDER'] = 'ollama'
         os.environ['API_BASE_URL'] = 'http://localhost:11434'
@@ -76,5 +89,517 @@ class TestLLMSwitch(unittest.TestCase):
         # Check Base URL passed to client constructor (only one OpenAI() call since Groq is cleared)
         mock_openai_cls.assert_called_with(api_key='sk-test', base_url='https://api.groq.com/openai/v1')
 
+    @patch('requests.Session.post')
+    def test_requests_spread_over_configured_endpoints(self, mock_post):
+        os.environ['LLM_PROVIDER'] = 'ollama'
+        os.environ['LLM_ENDPOINTS'] = json.dumps([
+            {"name": "a", "base_url": "http://gpu-a:11434", "model": "qwen2.5:7b"},
+            {"name": "b", "base_url": "http://gpu-b:11434/v1", "model": "qwen2.5:7b"},
+        ])
+        importlib.reload(ai_core)
+
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"message": {"content": "ok"}}
+        mock_post.return_value = mock_response
+
+        for i in range(4):
+            ai_core.query_llm([{"role": "user", "content": f"q{i}"}])
+
+        urls = [call.args[0] for call in mock_post.call_args_list]
+        self.assertEqual(sorted(urls), ["http://gpu-a:11434/api/chat"] * 2 + ["http://gpu-b:11434/api/chat"] * 2)
+        self.assertEqual([s["calls"] for s in ai_core.get_llm_router_stats()["endpoints"]], [2, 2])
+
+    @patch('requests.Session.post')
+    def test_deadline_bounds_the_provider_timeout(self, mock_post):
+        os.environ['LLM_PROVIDER'] = 'ollama'
+        os.environ.pop('LLM_ENDPOINTS', None)
+        importlib.reload(ai_core)
+        mock_post.return_value.json.return_value = {"message": {"content": "ok"}}
+        messages = [{"role": "user", "content": "hello"}]
+
+        ai_core.query_llm(messages, deadline=deadline_after(3))
+        self.assertLessEqual(mock_post.call_args.kwargs["timeout"], 3)
+
+        # Past the deadline the provider is never called
+        mock_post.reset_mock()
+        with self.assertRaises(DeadlineExceeded):
+            ai_core.query_llm(messages, deadline=deadline_after(-1))
+        mock_post.assert_not_called()
+
+        # A timeout cut short by the deadline is not held against the endpoint
+        mock_post.side_effect = requests.Timeout("read timed out")
+        with self.assertRaises(DeadlineExceeded):
+            ai_core.query_llm(messages, deadline=deadline_after(2))
+        self.assertEqual(ai_core.get_llm_router_stats()["endpoints"][0]["consecutive_failures"], 0)
+
+    def test_pooled_session_never_resends_a_delivered_request(self):
+        retry = get_session("llm").get_adapter("http://gpu-a:11434").max_retries
+        self.assertGreater(retry.connect, 0)
+        self.assertEqual((retry.read, retry.status), (0, 0))
+        self.assertFalse(retry.is_retry("POST", 503))
+
+
+class TestJSONRepair(unittest.TestCase):
+
+    @patch.object(ai_core, 'query_llm')
+    def test_malformed_reply_repaired_without_retry(self, mock_llm):
+        mock_llm.return_value = 'Here you go:\n{"error_type": \'typo\', "reasoning": "少了一個假名",'
+        before = ai_core.get_json_parse_stats()
+
+        result = ai_core.query_llm_json([{"role": "user", "content": "x"}])
+
+        self.assertEqual(result["data"], {"error_type": "typo", "reasoning": "少了一個假名"})
+        self.assertEqual(result["retry_count"], 0)
+        mock_llm.assert_called_once()
+        after = ai_core.get_json_parse_stats()
+        self.assertEqual(after["repaired"] - before["repaired"], 1)
+        self.assertEqual(after["retries"], before["retries"])
+
+    @patch.object(ai_core, 'query_llm', return_value="I cannot answer that.")
+    def test_unrecoverable_reply_is_retried(self, mock_llm):
+        result = ai_core.query_llm_json([{"role": "user", "content": "x"}], retries=1)
+
+        self.assertIsNone(result["data"])
+        self.assertEqual(mock_llm.call_count, 2)
+
+    @patch.object(ai_core, 'ENABLE_SAFETY_CHECK', True)
+    def test_safety_check_replies_are_not_counted(self):
+        client = MagicMock()
+        client.chat.completions.create.return_value.choices[0].message.content = '{"violation": 0, "rationale": "ok",'
+        before = ai_core.get_json_parse_stats()
+
+        with patch.object(ai_core, 'safeguard_client', client):
+            self.assertEqual(ai_core.check_safety("こんにちは"), {"violation": 0, "rationale": "ok"})
+
+        self.assertEqual(ai_core.get_json_parse_stats(), before)
+
+class _Reply(BaseModel):
+    error_type: str
+    reasoning: str
+
+class TestStructuredOutput(unittest.TestCase):
+
+    def setUp(self):
+        ai_core._structured_support.clear()
+
+    def tearDown(self):
+        ai_core._structured_support.clear()
+
+    @patch('requests.Session.post')
+    def test_ollama_receives_schema_as_format(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"message": {"content": '{"error_type": "typo", "reasoning": "x"}'}}
+        mock_post.return_value = mock_response
+
+        with patch.object(ai_core, 'LLM_PROVIDER', 'ollama'):
+            result = ai_core.query_llm_json([{"role": "user", "content": "x"}], schema=_Reply)
+
+        self.assertEqual(result["data"], {"error_type": "typo", "reasoning": "x"})
+        payload = mock_post.call_args.kwargs["json"]
+        self.assertEqual(payload["format"], _Reply.model_json_schema())
+
+    def _endpoints(self, *names):
+        endpoints = [LLMEndpoint(name, "ollama", f"http://{name}:11434", "m") for name in names]
+        return patch.object(ai_core, '_router', LLMRouter(endpoints, ai_core._is_endpoint_failure))
+
+    @staticmethod
+    def _ollama(schema_reply, rejecting=()):
+        """Fake Ollama: schema calls get `schema_reply` (or a 400 from `rejecting` hosts), plain calls JSON."""
+        def post(url, json, headers, timeout):
+            response = MagicMock()
+            content = '{"error_type": "none", "reasoning": "ok"}'
+            if "format" in json:
+                content = schema_reply
+                if any(host in url for host in rejecting):
+                    response.raise_for_status.side_effect = requests.HTTPError(response=MagicMock(status_code=400))
+            response.json.return_value = {"message": {"content": content}}
+            return response
+        return post
+
+    @patch('requests.Session.post')
+    def test_rejected_schema_falls_back_and_is_remembered(self, mock_post):
+        mock_post.side_effect = self._ollama('{"error_type": "typo", "reasoning": "x"}', rejecting=("gpu-a",))
+
+        with self._endpoints("gpu-a"):
+            first = ai_core.query_llm_json([{"role": "user", "content": "x"}], schema=_Reply)
+            second = ai_core.query_llm_json([{"role": "user", "content": "y"}], schema=_Reply)
+            self.assertFalse(ai_core.structured_output_enabled())
+
+        self.assertEqual(first["retry_count"], 0)
+        self.assertEqual(second["data"]["error_type"], "none")
+        # 1 rejected probe + 2 plain calls; the second call doesn't try the schema again
+        self.assertEqual(mock_post.call_count, 3)
+
+    @patch('requests.Session.post')
+    def test_empty_structured_reply_falls_back(self, mock_post):
+        mock_post.side_effect = self._ollama("")
+
+        with self._endpoints("gpu-a"):
+            result = ai_core.query_llm_json([{"role": "user", "content": "x"}], schema=_Reply)
+
+        self.assertEqual(result["data"]["error_type"], "none")
+        self.assertNotIn("format", mock_post.call_args_list[1].kwargs["json"])
+
+    @patch('requests.Session.post')
+    def test_structured_support_is_learned_per_endpoint(self, mock_post):
+        mock_post.side_effect = self._ollama('{"error_type": "typo", "reasoning": "x"}', rejecting=("gpu-a",))
+
+        with self._endpoints("gpu-a", "gpu-b"):
+            results = [ai_core.query_llm_json([{"role": "user", "content": f"q{i}"}], schema=_Reply)
+                       for i in range(4)]
+            # One endpoint still does structured output, so it stays on
+            self.assertTrue(ai_core.structured_output_enabled())
+
+        self.assertEqual(ai_core._structured_support, {"ollama|http://gpu-a:11434|m": False,
+                                                       "ollama|http://gpu-b:11434|m": True})
+        self.assertIn({"error_type": "typo", "reasoning": "x"}, [r["data"] for r in results])
+        # gpu-a got the schema once; after that, calls routed there go plain
+        schema_calls = [c.args[0] for c in mock_post.call_args_list if "format" in c.kwargs["json"]]
+        self.assertEqual(sum("gpu-a" in url for url in schema_calls), 1)
+
+class TestSingleFlight(unittest.TestCase):
+
+    def _run_concurrently(self, upstream, callers=4):
+        """Start `callers` identical query_llm calls while upstream blocks, then release it."""
+        release = threading.Event()
+        calls = []
+
+        def blocking_upstream(*args):
+            calls.append(args)
+            release.wait(5)
+            return upstream()
+
+        outcomes = []
+        with patch.object(ai_core, '_query_llm', side_effect=blocking_upstream):
+            start = ai_core.get_llm_flight_stats()
+
+            def call():
+                try:
+                    outcomes.append(ai_core.query_llm([{"role": "user", "content": "同じ質問"}], temperature=0.1))
+                except Exception as e:
+                    outcomes.append(e)
+
+            threads = [threading.Thread(target=call) for _ in range(callers)]
+            for t in threads:
+                t.start()
+            while ai_core.get_llm_flight_stats()["coalesced"] - start["coalesced"] < callers - 1:
+                time.sleep(0.005)
+            release.set()
+            for t in threads:
+                t.join(5)
+
+        return calls, outcomes, start
+
+    def test_identical_requests_share_one_call(self):
+        calls, outcomes, start = self._run_concurrently(lambda: "shared reply")
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, ["shared reply"] * 4)
+        stats = ai_core.get_llm_flight_stats()
+        self.assertEqual(stats["coalesced"] - start["coalesced"], 3)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_exception_is_shared(self):
+        def fail():
+            raise RuntimeError("upstream down")
+
+        calls, outcomes, _ = self._run_concurrently(fail)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(outcomes), 4)
+        self.assertTrue(all(isinstance(o, RuntimeError) for o in outcomes))
+
+    def test_followers_stop_at_their_own_deadline(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=("k", lambda: release.wait(5) and "reply"))
+        leader.start()
+        while not flight.stats()["in_flight"]:
+            time.sleep(0.005)
+
+        with self.assertRaises(DeadlineExceeded):
+            flight.do("k", lambda: "own call", deadline_after(0.05))
+        with self.assertRaises(DeadlineExceeded):
+            asyncio.run(flight.do_async("k", self._own_call, deadline_after(0.05)))
+
+        release.set()
+        leader.join(5)
+        self.assertEqual(flight.stats(), {"calls": 1, "coalesced": 2, "in_flight": 0})
+
+    async def _own_call(self):
+        return "own call"
+
+    def test_leader_deadline_is_not_shared_with_followers_that_have_time(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        outcomes = []
+
+        def short_deadline_leader():
+            release.wait(5)
+            raise DeadlineExceeded("leader out of time")
+
+        def follower():
+            outcomes.append(flight.do("k", lambda: "own call", deadline_after(5)))
+
+        leader = threading.Thread(target=lambda: self.assertRaises(DeadlineExceeded, flight.do, "k",
+                                                                   short_deadline_leader))
+        leader.start()
+        while not flight.stats()["in_flight"]:
+            time.sleep(0.005)
+        threads = [threading.Thread(target=follower) for _ in range(2)]
+        for t in threads:
+            t.start()
+        while flight.stats()["coalesced"] < 2:
+            time.sleep(0.005)
+        release.set()
+        for t in [leader, *threads]:
+            t.join(5)
+
+        self.assertEqual(outcomes, ["own call"] * 2)
+
+    def test_cancelled_leader_hands_the_call_to_a_waiting_follower(self):
+        flight = SingleFlight()
+        outcomes = []
+
+        async def slow_leader():
+            await asyncio.sleep(5)
+
+        async def scenario():
+            leader = asyncio.create_task(asyncio.wait_for(flight.do_async("k", slow_leader), 0.2))
+            while not flight.stats()["in_flight"]:
+                await asyncio.sleep(0.005)
+            follower = threading.Thread(target=lambda: outcomes.append(flight.do("k", lambda: "own call")))
+            follower.start()
+            while not flight.stats()["coalesced"]:
+                await asyncio.sleep(0.005)
+            with self.assertRaises(asyncio.TimeoutError):
+                await leader
+            follower.join(5)
+
+        asyncio.run(scenario())
+        self.assertEqual(outcomes, ["own call"])
+        self.assertEqual(flight.stats(), {"calls": 2, "coalesced": 1, "in_flight": 0})
+
+    def test_different_temperature_is_not_coalesced(self):
+        key_a = ai_core._llm_request_key([{"role": "user", "content": "x"}], False, 0.1, None)
+        key_b = ai_core._llm_request_key([{"role": "user", "content": "x"}], False, 0.7, None)
+        self.assertNotEqual(key_a, key_b)
+
+class TestLLMRouter(unittest.TestCase):
+
+    def _router(self, caps=(0, 0), **kwargs):
+        endpoints = [LLMEndpoint(name, "ollama", f"http://{name}", "m", max_concurrency=cap)
+                     for name, cap in zip(("a", "b"), caps, strict=True)]
+        kwargs.setdefault("backoff_base", 0.001)
+        return LLMRouter(endpoints, lambda e: isinstance(e, ConnectionError), **kwargs), endpoints
+
+    def test_least_outstanding_endpoint_is_chosen(self):
+        router, (a, b) = self._router()
+        held = router.acquire()
+
+        self.assertEqual(router.call(lambda ep: ep.name), "b" if held is a else "a")
+
+    def test_failing_endpoint_is_retried_elsewhere_then_opened_and_probed(self):
+        router, (a, b) = self._router(failure_threshold=2, open_seconds=0.3)
+
+        def upstream(ep):
+            if ep is a:
+                raise ConnectionError("refused")
+            return ep.name
+
+        # Every call succeeds via b; a's breaker opens after two failures and a is skipped
+        self.assertEqual([router.call(upstream) for _ in range(6)], ["b"] * 6)
+        self.assertEqual(a.failures, 2)
+        self.assertEqual(a.breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.35)
+        self.assertEqual(a.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(router.call(lambda ep: ep.name), "a")  # the probe succeeds
+        self.assertEqual(a.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_request_errors_are_not_retried_and_do_not_open(self):
+        router, (a, b) = self._router(failure_threshold=1)
+        calls = []
+
+        def bad_request(ep):
+            calls.append(ep)
+            raise ValueError("bad request")
+
+        with self.assertRaises(ValueError):
+            router.call(bad_request)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(a.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_all_circuits_open_fails_fast(self):
+        router, (a, b) = self._router(failure_threshold=1, max_retries=0)
+        down = MagicMock(side_effect=ConnectionError("refused"))
+
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                router.call(down)
+        with self.assertRaises(CircuitOpenError):
+            router.call(down)
+        self.assertEqual(down.call_count, 2)
+
+    def test_slow_calls_open_the_breaker(self):
+        breaker = CircuitBreaker("slow", failure_threshold=2, slow_call_seconds=1.0)
+        breaker.record(2.5, failed=False)
+        breaker.record(3.0, failed=False)
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_retry_budget_and_adaptive_timeout(self):
+        budget = RetryBudget(ratio=0.5, max_tokens=1)
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+        budget.deposit()
+        budget.deposit()
+        self.assertTrue(budget.try_spend())
+
+        latency = LatencyTracker(min_samples=5, multiplier=3.0, floor=1.0, ceiling=120.0)
+        self.assertEqual(latency.timeout(), 120.0)
+        for _ in range(10):
+            latency.record(0.5)
+        self.assertEqual(latency.timeout(), 1.5)
+
+    def test_latency_is_tracked_per_call_kind(self):
+        ep = LLMEndpoint("a", "ollama", "http://a", "m")
+        router = LLMRouter([ep], lambda e: False, timeout_floor=1.0, slow_call_seconds=0.01, failure_threshold=1,
+                           long_call_kinds=("generation",))
+        ep.latency["interactive"] = LatencyTracker(min_samples=5, floor=1.0)
+        for _ in range(10):
+            ep.latency["interactive"].record(0.5)
+
+        # Short interactive calls don't shrink the timeout of long generations
+        self.assertEqual(router.timeout_for(ep, "interactive"), 1.5)
+        self.assertEqual(router.timeout_for(ep, "generation"), 120.0)
+
+        # A long generation isn't a slow call; the same duration for an interactive call is
+        router.call(lambda ep: time.sleep(0.02), kind="generation")
+        self.assertEqual(ep.breaker.state, CircuitBreaker.CLOSED)
+        router.call(lambda ep: time.sleep(0.02), kind="interactive")
+        self.assertEqual(ep.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(sorted(router.stats()["endpoints"][0]["timeout_s"]), ["generation", "interactive"])
+
+    def test_concurrency_cap_makes_callers_wait(self):
+        router, (a, b) = self._router(caps=(1, 1))
+        first, second = router.acquire(), router.acquire()
+        acquired = []
+
+        waiter = threading.Thread(target=lambda: acquired.append(router.acquire()))
+        waiter.start()
+        time.sleep(0.05)
+        self.assertEqual(acquired, [])
+
+        router._release(first, None)
+        waiter.join(1)
+        self.assertEqual(acquired, [first])
+        router._release(second, None)
+        router._release(first, None)
+
+    def test_cancelled_call_frees_its_endpoint(self):
+        ep = LLMEndpoint("a", "ollama", "http://a", "m", max_concurrency=1)
+        router = LLMRouter([ep], lambda e: False, timeout=0.5)
+
+        async def slow(ep):
+            await asyncio.sleep(5)
+
+        async def fast(ep):
+            return ep.name
+
+        async def scenario():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(router.call_async(slow), 0.05)
+            return await router.call_async(fast)
+
+        self.assertEqual(asyncio.run(scenario()), "a")
+        self.assertEqual(ep.outstanding, 0)
+
+    @patch.object(ai_core, 'ENABLE_SAFETY_CHECK', True)
+    def test_open_safeguard_circuit_skips_check(self):
+        client = MagicMock()
+        client.chat.completions.create.side_effect = requests.ConnectionError("down")
+        breaker = CircuitBreaker("safeguard", failure_threshold=2)
+
+        with patch.object(ai_core, 'safeguard_client', client), patch.object(ai_core, '_safeguard_breaker', breaker):
+            results = [ai_core.check_safety("こんにちは") for _ in range(4)]
+
+        self.assertEqual(client.chat.completions.create.call_count, 2)
+        self.assertEqual(results[-1], {"violation": 0, "rationale": "Check skipped: safeguard circuit open"})
+
+class TestPriorityScheduler(unittest.TestCase):
+    def _run_queued(self, scheduler, classes, hold=0.02):
+        """Occupy the only slot, queue one caller per class in order, then record dispatch order."""
+        order = []
+        blocker = threading.Event()
+
+        def occupy():
+            with scheduler.slot("batch"):
+                blocker.wait(2)
+
+        def call(cls):
+            with scheduler.slot(cls):
+                order.append(cls)
+                time.sleep(hold)
+
+        first = threading.Thread(target=occupy)
+        first.start()
+        time.sleep(0.02)
+        threads = []
+        for cls in classes:
+            t = threading.Thread(target=call, args=(cls,))
+            t.start()
+            threads.append(t)
+            time.sleep(0.01)
+        blocker.set()
+        for t in [first, *threads]:
+            t.join(2)
+        return order
+
+    def test_queued_calls_dispatch_by_class_priority(self):
+        scheduler = PriorityScheduler(1, aging_seconds=60)
+        order = self._run_queued(scheduler, ["batch", "generation", "review", "chat", "interactive"])
+        self.assertEqual(order, ["chat", "interactive", "review", "generation", "batch"])
+
+        stats = scheduler.stats()
+        self.assertEqual(stats["free"], 1)
+        self.assertEqual(stats["classes"]["batch"]["dispatched"], 2)
+        self.assertEqual(stats["classes"]["chat"]["queued"], 0)
+        self.assertGreater(stats["classes"]["batch"]["wait_ms_max"], stats["classes"]["chat"]["wait_ms_p50"])
+
+    def test_long_waiting_background_call_overtakes(self):
+        # With fast aging, the batch call queued first has aged past the chat call behind it
+        scheduler = PriorityScheduler(1, aging_seconds=0.001)
+        order = self._run_queued(scheduler, ["batch", "chat"])
+        self.assertEqual(order, ["batch", "chat"])
+
+    def test_async_callers_share_the_queue(self):
+        scheduler = PriorityScheduler(1, aging_seconds=60)
+        order = []
+
+        async def call(cls, delay):
+            await asyncio.sleep(delay)
+            async with scheduler.slot_async(cls):
+                order.append(cls)
+                await asyncio.sleep(0.02)
+
+        async def main():
+            await asyncio.gather(call("batch", 0), call("generation", 0.005), call("chat", 0.01))
+
+        asyncio.run(main())
+        self.assertEqual(order, ["batch", "chat", "generation"])
+        self.assertEqual(scheduler.stats()["free"], 1)
+
+    def test_request_class_context(self):
+        self.assertEqual(current_request_class(), "interactive")
+        with request_class("batch"):
+            with default_request_class("review"):
+                self.assertEqual(current_request_class(), "batch")
+        with default_request_class("review"):
+            self.assertEqual(current_request_class(), "review")
+        with self.assertRaises(ValueError), request_class("urgent"):
+            pass
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,99 @@
+import random
+import re
+import unittest
+
+from video_service import _merge_transcript_to_sentences, _split_at_punctuation
+
+PHRASES = ["今日は", "とても", "いい天気", "ですね", "駅まで", "歩いて", "行きます", "先生に", "聞いてみましょう",
+           "日本語の", "勉強は", "楽しい", "と思います", "それでは", "始めましょう", "Python", "3.12"]
+ENDERS = ["。", "？", "！", "?", "!"]
+_ENDER = re.compile(r"[。？！?!]")
+
+
+def _previous_split(transcript: list) -> list:
+    """The quadratic implementation _split_at_punctuation replaced, as the reference."""
+    full_text = ""
+    char_timestamps = []
+    for seg in transcript:
+        start_offset = len(full_text)
+        full_text += seg["text"]
+        char_timestamps.append((start_offset, seg["start"]))
+        if not full_text.endswith(("。", "？", "！", "\n")):
+            full_text += " "
+
+    raw_sentences = re.split(r'(?<=[。？！?!])\s*', full_text)
+    sentences = []
+    search_offset = 0
+    for s in raw_sentences:
+        s = s.strip()
+        if not s or len(s) < 5:
+            continue
+        pos = full_text.find(s, search_offset)
+        if pos >= 0:
+            search_offset = pos + len(s)
+        timestamp = 0.0
+        for char_off, ts in char_timestamps:
+            if char_off <= max(pos, 0):
+                timestamp = ts
+            else:
+                break
+        sentences.append({"text": s, "start": timestamp})
+    return sentences
+
+
+def synthetic_captions(hours: float, seed: int, edge_cases: bool = True) -> list:
+    """Caption-like segments, one every ~3 seconds. Edge cases: empty or blank segments,
+    stray whitespace and newlines, repeated enders and sentences too short to keep."""
+    rng = random.Random(seed)
+    segments = []
+    t = 0.0
+    while t < hours * 3600:
+        # Without edge cases every segment is long enough to be kept as a sentence
+        text = "".join(rng.choice(PHRASES) for _ in range(rng.randint(1 if edge_cases else 2, 3)))
+        if rng.random() < 0.5:
+            text += rng.choice(ENDERS)
+        if edge_cases:
+            roll = rng.random()
+            if roll < 0.05:
+                text = rng.choice(["", " ", "\n"])
+            elif roll < 0.10:
+                text = rng.choice(["はい。", "え？", "。", "！！"]) + rng.choice(["", text])
+            elif roll < 0.15:
+                text = rng.choice([" ", "\n", "　"]) + text + rng.choice([" ", "\n", "。。", "?!"])
+        duration = round(rng.uniform(1.0, 4.0), 2)
+        segments.append({"text": text, "start": round(t, 2), "duration": duration})
+        t += duration
+    return segments
+
+
+class TestTranscriptSegmenter(unittest.TestCase):
+
+    def test_matches_previous_implementation_on_random_transcripts(self):
+        for seed in range(300):
+            transcript = synthetic_captions(hours=random.Random(seed).uniform(0.001, 0.05), seed=seed)
+            self.assertEqual(_split_at_punctuation(transcript), _previous_split(transcript), f"seed {seed}")
+
+    def test_matches_previous_implementation_on_an_hour_of_captions(self):
+        transcript = synthetic_captions(hours=1, seed=1)
+        self.assertEqual(_split_at_punctuation(transcript), _previous_split(transcript))
+        self.assertEqual(_merge_transcript_to_sentences(transcript), _previous_split(transcript))
+
+    def test_long_transcripts_keep_every_sentence_in_order(self):
+        for hours in (5, 10):
+            transcript = synthetic_captions(hours=hours, seed=hours, edge_cases=False)
+            sentences = _split_at_punctuation(transcript)
+
+            # Nothing is lost or reordered: without short pieces, the sentences are the whole text
+            self.assertEqual("".join(s["text"] for s in sentences).replace(" ", ""),
+                             "".join(seg["text"] for seg in transcript))
+            segment_starts = {seg["start"] for seg in transcript}
+            timestamps = [s["start"] for s in sentences]
+            self.assertEqual(timestamps, sorted(timestamps))
+            self.assertTrue(segment_starts.issuperset(timestamps))
+            for s in sentences:
+                self.assertGreaterEqual(len(s["text"]), 5)
+                self.assertIsNone(_ENDER.search(s["text"][:-1]), s["text"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from video_service import (
+    create_video_tables,
+    find_segment_at,
+    get_context_lines,
+    get_transcript_prefix,
+    get_transcript_text,
+    get_transcript_window,
+    load_transcript,
+    migrate_transcript_blobs,
+    save_transcript_segments,
+)
+
+# Segments every 10 seconds, each shown for 8
+TRANSCRIPT = [{"text": f"第{n}行", "start": n * 10.0, "duration": 8.0} for n in range(100)]
+
+
+class TestTranscriptStorage(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.conn = sqlite3.connect(self.db_path)
+        create_video_tables(self.conn)
+        self.conn.execute('''
+            INSERT INTO videos (video_id, source, url, title, status, created_timestamp)
+            VALUES ('v1', 'youtube', 'https://www.youtube.com/watch?v=abc123', 'テスト', 'processed', '2026-01-01')
+        ''')
+        save_transcript_segments(self.conn, "v1", TRANSCRIPT)
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.db_path)
+
+    def test_window_returns_segments_playing_in_the_range(self):
+        # 109 s falls in the gap after segment 10; 204 s inside segment 20
+        window = get_transcript_window(self.conn, "v1", 109.0, 204.0)
+        self.assertEqual([seg["seq"] for seg in window], list(range(11, 21)))
+
+        window = get_transcript_window(self.conn, "v1", 101.0, 125.0)
+        self.assertEqual([seg["seq"] for seg in window], [10, 11, 12])
+        self.assertEqual(window[0], {"seq": 10, "start": 100.0, "duration": 8.0, "text": "第10行"})
+
+        self.assertEqual(len(get_transcript_window(self.conn, "v1")), 100)
+        self.assertEqual(get_transcript_window(self.conn, "v2", 0, 100), [])
+
+    def test_segment_lookup_by_time(self):
+        self.assertEqual(find_segment_at(self.conn, "v1", 123.4)["seq"], 12)
+        self.assertEqual(find_segment_at(self.conn, "v1", 120.0)["seq"], 12)
+        self.assertEqual(find_segment_at(self.conn, "v1", 5000.0)["seq"], 99)
+        self.assertIsNone(find_segment_at(self.conn, "v1", -1.0))
+
+    def test_context_lines_match_the_player(self):
+        def player_context_lines(timestamp):
+            # What VideoStudyView computed from the full transcript
+            idx = next((i for i, seg in enumerate(TRANSCRIPT) if seg["start"] >= timestamp), -1)
+            pos = len(TRANSCRIPT) - 1 if idx == -1 else max(0, idx - 1)
+            return [seg["text"] for seg in TRANSCRIPT[max(0, pos - 2):pos]]
+
+        for timestamp in (0.0, 10.0, 30.0, 35.0, 500.0, 990.0, 2000.0):
+            self.assertEqual(get_context_lines(self.conn, "v1", timestamp), player_context_lines(timestamp))
+
+    def test_whole_transcript(self):
+        self.assertEqual(load_transcript(self.conn, "v1"), TRANSCRIPT)
+        self.assertEqual(get_transcript_text(self.conn, "v1"), " ".join(seg["text"] for seg in TRANSCRIPT))
+        self.assertEqual(get_transcript_text(self.conn, "missing"), "")
+
+    def test_prefix_matches_the_whole_text(self):
+        text = get_transcript_text(self.conn, "v1")
+        for chars in (0, 1, 3, 4, 5, 500, len(text) + 10):
+            self.assertEqual(get_transcript_prefix(self.conn, "v1", chars), text[:chars])
+        self.assertEqual(get_transcript_prefix(self.conn, "missing", 500), "")
+
+    def test_blobs_are_migrated_to_segments(self):
+        self.conn.execute('''
+            INSERT INTO videos (video_id, source, url, title, transcript_json, status, created_timestamp)
+            VALUES ('v2', 'youtube', 'https://youtu.be/xyz', '旧', ?, 'processed', '2026-01-01')
+        ''', (json.dumps(TRANSCRIPT[:3], ensure_ascii=False),))
+        # Readable before migrating
+        self.assertEqual(load_transcript(self.conn, "v2"), TRANSCRIPT[:3])
+
+        self.assertEqual(migrate_transcript_blobs(self.conn), 1)
+
+        self.assertEqual(load_transcript(self.conn, "v2"), TRANSCRIPT[:3])
+        self.assertEqual([seg["seq"] for seg in get_transcript_window(self.conn, "v2", 0, 100)], [0, 1, 2])
+        self.assertIsNone(self.conn.execute("SELECT transcript_json FROM videos WHERE video_id = 'v2'").fetchone()[0])
+        self.assertEqual(migrate_transcript_blobs(self.conn), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
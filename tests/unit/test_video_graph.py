@@ -0,0 +1,133 @@
+import asyncio
+import re
+import threading
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from graphs import video_graph
+from graphs.video_graph import (
+    _split_windows,
+    check_comprehension_answer,
+    generate_comprehension_questions,
+    generate_comprehension_questions_async,
+)
+from token_budget import estimate_tokens
+
+# ~7,700 tokens of captions: eight windows of 1,000 tokens
+LONG_TRANSCRIPT = " ".join(f"これは{n}番目の文です。" for n in range(600))
+WINDOWS = 8
+
+
+def _question(text: str) -> dict:
+    return {"question": text, "choices": ["A", "B", "C", "D"], "correct_index": 0, "explanation": "説明"}
+
+
+def _window_reply(messages, **kwargs):
+    """Two questions specific to the window, plus one every window repeats."""
+    prompt = messages[0]["content"]
+    window = re.search(r"第 (\d+)/\d+ 段", prompt).group(1)
+    # Distinct wording per question, so only the repeated one is a near-duplicate
+    words = ["".join(chr(0x4E00 + (int(window) * 2 + k) * 10 + j) for j in range(10)) for k in range(2)]
+    questions = [_question(f"第{window}段：{w}") for w in words] + [_question("この動画の主なテーマは何ですか？")]
+    return {"data": {"questions": questions}, "retry_count": 0, "error": None}
+
+
+@patch.object(video_graph, "COMPREHENSION_WINDOW_TOKENS", 1000)
+class TestChunkedComprehension(unittest.TestCase):
+
+    def test_windows_cover_the_transcript_within_budget(self):
+        windows = _split_windows(LONG_TRANSCRIPT, 1000)
+
+        self.assertEqual(len(windows), WINDOWS)
+        self.assertTrue(all(estimate_tokens(w) <= 1000 for w in windows))
+        self.assertEqual(" ".join(windows), LONG_TRANSCRIPT)
+
+    @patch('graphs.video_graph.query_llm_json')
+    def test_short_transcript_is_one_call(self, mock_llm):
+        mock_llm.return_value = {"data": {"questions": [_question("質問")]}, "retry_count": 0, "error": None}
+
+        result = generate_comprehension_questions("短い字幕です。", "タイトル", 1)
+
+        self.assertEqual(result, [_question("質問")])
+        mock_llm.assert_called_once()
+
+    @patch('graphs.video_graph.query_llm_json')
+    def test_one_window_transcript_is_sent_whole(self, mock_llm):
+        mock_llm.return_value = {"data": {"questions": [_question("質問")]}, "retry_count": 0, "error": None}
+
+        with patch.object(video_graph, "COMPREHENSION_WINDOW_TOKENS", 10000):
+            generate_comprehension_questions(LONG_TRANSCRIPT, "タイトル", 1)
+
+        mock_llm.assert_called_once()
+        self.assertGreater(len(LONG_TRANSCRIPT), 3000)
+        self.assertIn(LONG_TRANSCRIPT, mock_llm.call_args.args[0][0]["content"])
+
+    @patch('graphs.video_graph.query_llm_json', side_effect=_window_reply)
+    def test_questions_are_deduped_and_spread_over_the_video(self, mock_llm):
+        result = generate_comprehension_questions(LONG_TRANSCRIPT, "タイトル", 5)
+
+        self.assertEqual(mock_llm.call_count, WINDOWS)
+        prompts = [c.args[0][0]["content"] for c in mock_llm.call_args_list]
+        self.assertTrue(any("これは599番目の文です。" in p for p in prompts))
+
+        questions = [q["question"] for q in result]
+        self.assertEqual(len(questions), 5)
+        self.assertEqual(len(set(questions)), 5)
+        # One question from each of five windows spread over all eight, in video order
+        windows = [int(re.match(r"第(\d+)段", q).group(1)) if q.startswith("第") else 1 for q in questions]
+        self.assertEqual(windows, sorted(windows))
+        self.assertEqual(len(set(windows)), 5)
+        self.assertEqual((windows[0], windows[-1]), (1, WINDOWS))
+
+    def test_windows_are_generated_concurrently(self):
+        # Every window call waits for all the others to start: sequential calls would time out
+        all_started = threading.Barrier(WINDOWS, timeout=5)
+
+        def reply(messages, **kwargs):
+            all_started.wait()
+            return _window_reply(messages)
+
+        with patch('graphs.video_graph.query_llm_json', side_effect=reply):
+            self.assertEqual(len(generate_comprehension_questions(LONG_TRANSCRIPT, "タイトル", 3)), 3)
+
+    @patch('graphs.video_graph.query_llm_json')
+    def test_a_failed_window_is_skipped(self, mock_llm):
+        def reply(messages, **kwargs):
+            if "第 2/8 段" in messages[0]["content"]:
+                raise TimeoutError("deadline")
+            return _window_reply(messages)
+        mock_llm.side_effect = reply
+
+        questions = [q["question"] for q in generate_comprehension_questions(LONG_TRANSCRIPT, "タイトル", 5)]
+
+        self.assertEqual(len(questions), 5)
+        self.assertFalse(any(q.startswith("第2段") for q in questions))
+
+    def test_async_runner_matches(self):
+        mock_llm = AsyncMock(side_effect=_window_reply)
+        with patch('graphs.video_graph.query_llm_json_async', mock_llm):
+            result = asyncio.run(generate_comprehension_questions_async(LONG_TRANSCRIPT, "タイトル", 5))
+
+        self.assertEqual(mock_llm.await_count, WINDOWS)
+        with patch('graphs.video_graph.query_llm_json', side_effect=_window_reply):
+            self.assertEqual(result, generate_comprehension_questions(LONG_TRANSCRIPT, "タイトル", 5))
+
+
+class TestComprehensionCheck(unittest.TestCase):
+
+    @patch('graphs.video_graph.query_llm', return_value="正解はAです。")
+    def test_only_llm_explanations_are_complete(self, mock_llm):
+        choices = ["A", "B", "C", "D"]
+
+        self.assertEqual(check_comprehension_answer("質問", choices, 0, 0),
+                         {"is_correct": True, "feedback": "正確！", "score": 100, "is_complete": False})
+        self.assertEqual(check_comprehension_answer("質問", choices, 0, 2),
+                         {"is_correct": False, "feedback": "正解はAです。", "score": 0, "is_complete": True})
+
+        mock_llm.side_effect = TimeoutError("deadline")
+        self.assertEqual(check_comprehension_answer("質問", choices, 0, 2),
+                         {"is_correct": False, "feedback": "正確答案是：A", "score": 0, "is_complete": False})
+
+
+if __name__ == "__main__":
+    unittest.main()
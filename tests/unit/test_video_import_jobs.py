@@ -0,0 +1,215 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import video_import_jobs
+from video_import_jobs import (
+    create_import_job_tables,
+    enqueue_video_import,
+    get_import_job,
+    run_pending_imports,
+)
+from video_service import (
+    _tokenize_sentences,
+    _tokenizer,
+    create_video_tables,
+    generate_video_exercises,
+    import_video,
+)
+
+URL = "https://www.youtube.com/watch?v=abc123"
+
+
+def _fake_import(url, db_path, use_whisper=False, progress=None):
+    for stage in ("metadata", "transcript", "saving", "exercises", "done"):
+        progress(stage)
+    return {"video_id": "v1", "title": "テスト", "already_exists": False}
+
+
+class TestVideoImportJobs(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        with sqlite3.connect(self.db_path) as conn:
+            create_import_job_tables(conn)
+        patcher = patch('video_import_jobs.schedule_question_pregeneration')
+        self.mock_pregenerate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def test_enqueue_is_idempotent_per_video(self):
+        job = enqueue_video_import(URL, self.db_path)
+        self.assertEqual((job["status"], job["stage"], job["progress"]), ("queued", "queued", 0.0))
+        again = enqueue_video_import("https://youtu.be/abc123", self.db_path)
+        self.assertEqual(again["job_id"], job["job_id"])
+
+        with self.assertRaises(ValueError):
+            enqueue_video_import("https://example.com/video", self.db_path)
+
+    @patch('video_import_jobs.import_video', side_effect=_fake_import)
+    def test_worker_runs_job_and_reports_result(self, mock_import):
+        job = enqueue_video_import(URL, self.db_path)
+
+        self.assertEqual(run_pending_imports(self.db_path), 1)
+
+        done = get_import_job(job["job_id"], self.db_path)
+        self.assertEqual(done["status"], "succeeded")
+        self.assertEqual((done["stage"], done["progress"], done["attempts"]), ("done", 1.0, 1))
+        self.assertEqual(done["result"]["video_id"], "v1")
+        self.mock_pregenerate.assert_called_once_with(self.db_path, "v1")
+        # A finished import is returned for the same video rather than queued again
+        self.assertEqual(enqueue_video_import(URL, self.db_path)["job_id"], job["job_id"])
+        self.assertIsNone(get_import_job("missing", self.db_path))
+
+    def test_failed_attempt_is_retried_after_backoff(self):
+        job = enqueue_video_import(URL, self.db_path)
+
+        with patch('video_import_jobs.import_video', side_effect=RuntimeError("transcript fetch failed")):
+            run_pending_imports(self.db_path)
+        failed_once = get_import_job(job["job_id"], self.db_path)
+        self.assertEqual((failed_once["status"], failed_once["attempts"]), ("queued", 1))
+        self.assertEqual(failed_once["error"], "transcript fetch failed")
+        # Not due yet
+        self.assertEqual(run_pending_imports(self.db_path), 0)
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("UPDATE video_import_job SET run_after = '2000-01-01T00:00:00'")
+        with patch('video_import_jobs.import_video', side_effect=_fake_import):
+            run_pending_imports(self.db_path)
+        done = get_import_job(job["job_id"], self.db_path)
+        self.assertEqual((done["status"], done["attempts"], done["error"]), ("succeeded", 2, None))
+
+    def test_gives_up_after_max_attempts(self):
+        job = enqueue_video_import(URL, self.db_path)
+        with (patch.object(video_import_jobs, "VIDEO_IMPORT_MAX_ATTEMPTS", 1),
+              patch('video_import_jobs.import_video', side_effect=RuntimeError("boom"))):
+            run_pending_imports(self.db_path)
+        self.assertEqual(get_import_job(job["job_id"], self.db_path)["status"], "failed")
+
+    @patch('video_import_jobs.import_video', side_effect=_fake_import)
+    def test_job_interrupted_by_a_restart_is_resumed(self, mock_import):
+        job = enqueue_video_import(URL, self.db_path)
+        # As left behind by a process that died mid-import
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                UPDATE video_import_job
+                SET status = 'running', stage = 'transcript', attempts = 1, lease_expires = '2000-01-01T00:00:00'
+            ''')
+
+        self.assertEqual(run_pending_imports(self.db_path), 1)
+        done = get_import_job(job["job_id"], self.db_path)
+        self.assertEqual((done["status"], done["attempts"]), ("succeeded", 2))
+
+    def test_worker_that_lost_its_lease_leaves_the_job_alone(self):
+        job = enqueue_video_import(URL, self.db_path)
+
+        def reclaimed_meanwhile(url, db_path, use_whisper=False, progress=None):
+            # This worker stalled past its lease and another one claimed the job
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("UPDATE video_import_job SET attempts = attempts + 1, lease_expires = '2999-01-01T00:00:00'")
+            return _fake_import(url, db_path, use_whisper, progress)
+
+        with patch('video_import_jobs.import_video', side_effect=reclaimed_meanwhile):
+            run_pending_imports(self.db_path)
+
+        running = get_import_job(job["job_id"], self.db_path)
+        self.assertEqual((running["status"], running["attempts"], running["result"]), ("running", 2, None))
+        self.mock_pregenerate.assert_not_called()
+
+
+class TestResumableImport(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        with sqlite3.connect(self.db_path) as conn:
+            create_video_tables(conn)
+            conn.execute('''
+                INSERT INTO videos (video_id, source, external_id, url, title, transcript_json, status, created_timestamp)
+                VALUES ('v1', 'youtube', 'abc123', ?, 'テスト', ?, 'unprocessed', '2026-01-01T00:00:00')
+            ''', (URL, json.dumps([{"text": "こんにちは", "start": 0.0, "duration": 1.0}])))
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    @patch('video_service.generate_video_exercises')
+    @patch('video_service.fetch_youtube_transcript')
+    @patch('video_service.fetch_youtube_metadata')
+    def test_interrupted_import_only_redoes_exercises(self, mock_meta, mock_transcript, mock_exercises):
+        stages = []
+        result = import_video(URL, self.db_path, progress=stages.append)
+
+        self.assertEqual(result, {"video_id": "v1", "title": "テスト", "already_exists": False})
+        self.assertEqual(stages, ["exercises", "done"])
+        mock_meta.assert_not_called()
+        mock_transcript.assert_not_called()
+        mock_exercises.assert_called_once()
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute("SELECT status FROM videos").fetchone()[0], "processed")
+
+        self.assertTrue(import_video(URL, self.db_path)["already_exists"])
+
+
+class TestImportPipeline(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        with sqlite3.connect(self.db_path) as conn:
+            create_video_tables(conn)
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def test_bulk_tokenization_splits_back_per_sentence(self):
+        texts = ["今日はいい天気ですね。", "明日は雨が降るそうです。", "駅まで歩いて行きます！"] * 20
+        # Whitespace next to the separator is merged into it by janome: that chunk falls back
+        texts.append("先生 ")
+
+        bulk = [[token.surface for token in tokens] for tokens in _tokenize_sentences(texts)]
+
+        self.assertEqual(bulk, [[token.surface for token in _tokenizer.tokenize(text)] for text in texts])
+
+    @patch('video_service.translate_texts', side_effect=lambda texts, target: [f"譯:{t}" for t in texts])
+    def test_hint_translations_are_batched(self, mock_translate):
+        transcript = [{"text": f"私は毎朝{n}時に起きます。", "start": float(n), "duration": 1.0} for n in range(20)]
+        with sqlite3.connect(self.db_path) as conn:
+            created = generate_video_exercises("v1", transcript, conn, max_exercises=5)
+            rows = conn.execute("SELECT full_sentence, hint_chinese FROM video_exercises").fetchall()
+
+        self.assertEqual(created, 5)
+        mock_translate.assert_called_once()
+        self.assertEqual(len(mock_translate.call_args.args[0]), 5)
+        self.assertEqual(sorted(hint for _, hint in rows), sorted(f"譯:{sentence}" for sentence, _ in rows))
+
+    @patch('video_service.generate_video_exercises', return_value=0)
+    def test_metadata_and_transcript_are_fetched_concurrently(self, mock_exercises):
+        # Each fetch waits for the other to start: a sequential pipeline would time out
+        both_started = threading.Barrier(2, timeout=5)
+
+        def fetch_metadata(video_id):
+            both_started.wait()
+            return {"title": "テスト", "channel_name": "", "thumbnail_url": ""}
+
+        def fetch_transcript(video_id):
+            both_started.wait()
+            return [{"text": "こんにちは。", "start": 0.0, "duration": 1.0}]
+
+        stages = []
+        with (patch('video_service.fetch_youtube_metadata', side_effect=fetch_metadata),
+              patch('video_service.fetch_youtube_transcript', side_effect=fetch_transcript)):
+            result = import_video(URL, self.db_path, progress=stages.append)
+
+        self.assertEqual(result["title"], "テスト")
+        self.assertEqual(stages, ["metadata", "transcript", "saving", "exercises", "done"])
+
+
+if __name__ == "__main__":
+    unittest.main()
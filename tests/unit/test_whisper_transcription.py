@@ -0,0 +1,110 @@
+import itertools
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from whisper_transcription import plan_chunks, stitch_segments, transcribe_audio
+
+# What was said, in absolute time: a 20-second line every 25 seconds for ~45 minutes
+SPEECH = [{"text": f"これは{n}番目の文です。", "start": n * 25.0, "end": n * 25.0 + 20.0} for n in range(108)]
+DURATION = SPEECH[-1]["end"] + 5.0
+# The gaps between lines, as silencedetect would report them
+SILENCES = [(seg["end"] + 0.5, seg["end"] + 4.5) for seg in SPEECH[:-1]]
+
+
+class StubBackend:
+    """Transcribes a chunk by returning the speech it overlaps, relative to the chunk."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio_path: str) -> list[dict]:
+        start, end = (float(x) for x in audio_path.split(":"))
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        # A line cut by the chunk edge comes back clipped (and possibly truncated)
+        return [
+            {"text": seg["text"], "start": max(seg["start"], start) - start, "end": min(seg["end"], end) - start}
+            for seg in SPEECH
+            if seg["end"] > start and seg["start"] < end
+        ]
+
+
+def _fake_cut(audio_path, chunk, out_dir):
+    return f"{chunk.start}:{chunk.end}"
+
+
+class TestChunkPlanning(unittest.TestCase):
+
+    def test_cuts_fall_in_the_pause_nearest_each_mark(self):
+        chunks = plan_chunks(DURATION, SILENCES, chunk_seconds=600, overlap_seconds=1.0)
+
+        self.assertEqual(len(chunks), 5)
+        for chunk, following in itertools.pairwise(chunks):
+            cut = chunk.keep_until
+            self.assertEqual(following.keep_from, cut)
+            self.assertTrue(any(start <= cut <= end for start, end in SILENCES))
+            self.assertEqual((chunk.end, following.start), (cut + 1.0, cut - 1.0))
+        self.assertEqual((chunks[0].start, chunks[-1].end), (0.0, DURATION))
+
+    def test_without_pauses_cuts_at_the_mark(self):
+        chunks = plan_chunks(2000.0, [], chunk_seconds=600)
+        self.assertEqual([chunk.keep_from for chunk in chunks], [0.0, 600.0, 1200.0])
+
+    def test_short_audio_is_one_chunk(self):
+        self.assertEqual(len(plan_chunks(700.0, SILENCES, chunk_seconds=600)), 1)
+
+
+class TestStitching(unittest.TestCase):
+
+    def test_segments_on_a_cut_are_kept_once(self):
+        # Cut at 10s with 2s of overlap; "二番目" spans the cut and is heard by both chunks
+        chunks = plan_chunks(20.0, [], chunk_seconds=10, overlap_seconds=2.0)
+        first = [{"text": "一番目", "start": 1.0, "end": 4.0}, {"text": "二番目の文", "start": 7.0, "end": 12.0}]
+        second = [{"text": "の文", "start": 0.0, "end": 4.0}, {"text": "三番目", "start": 6.0, "end": 9.0}]
+
+        stitched = stitch_segments(chunks, [first, second])
+
+        self.assertEqual(stitched, [
+            {"text": "一番目", "start": 1.0, "duration": 3.0},
+            {"text": "二番目の文", "start": 7.0, "duration": 5.0},
+            {"text": "三番目", "start": 14.0, "duration": 3.0},
+        ])
+
+
+class TestTranscribeAudio(unittest.TestCase):
+
+    @patch('whisper_transcription._cut_chunk', side_effect=_fake_cut)
+    @patch('whisper_transcription._detect_silences', return_value=SILENCES)
+    @patch('whisper_transcription._probe_duration', return_value=DURATION)
+    @patch('whisper_transcription._ffmpeg_available', return_value=True)
+    def test_parallel_chunks_stitch_back_to_the_full_transcript(self, *mocks):
+        backend = StubBackend(delay=0.05)
+
+        transcript = transcribe_audio("audio.m4a", backend=backend, max_parallel=2, chunk_seconds=300)
+
+        expected = [{"text": seg["text"], "start": seg["start"], "duration": 20.0} for seg in SPEECH]
+        self.assertEqual(transcript, expected)
+        self.assertEqual(backend.calls, 9)
+        self.assertEqual(backend.max_in_flight, 2)
+
+    @patch('whisper_transcription._ffmpeg_available', return_value=False)
+    def test_without_ffmpeg_sends_one_request(self, mock_ffmpeg):
+        backend = StubBackend()
+        transcript = transcribe_audio(f"0:{DURATION}", backend=backend)
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(len(transcript), len(SPEECH))
+
+
+if __name__ == "__main__":
+    unittest.main()
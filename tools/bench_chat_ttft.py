@@ -0,0 +1,203 @@
+"""
+Benchmark: chat time-to-first-token per turn, with and without session mode.
+
+Plays a scripted multi-turn chat through chat_graph.build_context and streams each
+turn from the model with ai_core.query_llm_stream, measuring time to the first chunk.
+The learner's weak points change every few turns, as they do when the learner
+practises exercises between chat messages.
+
+  off: CHAT_SESSION_MODE=false, no keep_alive (the previous behaviour)
+  on:  CHAT_SESSION_MODE=true, keep_alive from OLLAMA_KEEP_ALIVE
+
+By default the model is a stub of Ollama's streaming /api/chat with a prefix cache
+over --slots recent prompts: the first chunk arrives after uncached prompt tokens ×
+--prefill-ms. keep_alive only matters across idle gaps longer than Ollama's 5 minute
+default, which the stub does not model. Point --url at a real Ollama to measure an
+actual model.
+
+Usage:
+  python tools/bench_chat_ttft.py
+  python tools/bench_chat_ttft.py --turns 30 --budget 600
+  python tools/bench_chat_ttft.py --url http://localhost:11434 --model qwen2.5:7b --turns 12
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ClassVar
+
+# Add backend to path so we can import ai_core and the chat graph
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+LEARNER_MESSAGES = [
+    "こんにちは！今日はいい天気ですね。",
+    "週末は友達と京都に行きました。",
+    "お寺をたくさん見ましたが、とても人が多いでした。",
+    "抹茶のアイスを食べて、おいしかったです。",
+    "来月は大阪に行きたいと思っています。",
+    "大阪で何を食べたらいいですか？",
+    "たこ焼きは食べたことがありません。",
+    "日本語の勉強は毎日一時間ぐらいします。",
+]
+WEAK_POINTS = [["助詞"], ["動詞て形"], ["敬語"], ["形容詞の過去形"]]
+STUB_REPLY = "いいですね！京都ではどこが一番よかったですか？私もお寺が大好きです。"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough count: one token per CJK character, four ASCII characters per token."""
+    wide = sum(1 for ch in text if ord(ch) > 0x2E7F)
+    return wide + (len(text) - wide + 3) // 4
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    prefill_ms = 0.5
+    decode_ms = 10.0
+    slots = 4
+    recent_prompts: ClassVar[list] = []
+    evaluated: ClassVar[list] = []
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = json.dumps(payload["messages"], ensure_ascii=False)
+        with self.lock:
+            cached_chars = max((len(os.path.commonprefix([prompt, p])) for p in self.recent_prompts), default=0)
+            StubModelHandler.recent_prompts = (self.recent_prompts + [prompt])[-self.slots:]
+        evaluated = estimate_tokens(prompt) - estimate_tokens(prompt[:cached_chars])
+        if payload.get("stream"):
+            with self.lock:
+                self.evaluated.append(evaluated)
+
+        time.sleep(evaluated * self.prefill_ms / 1000)
+        chunks = [STUB_REPLY[i:i + 8] for i in range(0, len(STUB_REPLY), 8)]
+        if not payload.get("stream"):
+            # Rolling-summary refreshes from the chat graph
+            time.sleep(len(chunks) * self.decode_ms / 1000)
+            self._send_json({"message": {"role": "assistant", "content": "- 京都旅行の話"}, "done": True})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(self.decode_ms / 1000)
+            self._write_chunk({"message": {"role": "assistant", "content": chunk}, "done": False})
+        self._write_chunk({"message": {"role": "assistant", "content": ""}, "done": True,
+                           "prompt_eval_count": evaluated})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_json(self, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: dict):
+        line = json.dumps(data).encode() + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_chat(ai_core, chat_graph, turns: int, session: bool) -> list:
+    chat_graph.CHAT_SESSION_MODE = session
+    chat_graph._summary_cache.clear()
+    ai_core.OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m") if session else ""
+    StubModelHandler.recent_prompts = []
+
+    history, ttfts = [], []
+    for turn in range(turns):
+        message = LEARNER_MESSAGES[turn % len(LEARNER_MESSAGES)]
+        profile = {"level_est": "N4", "feedback_preference": "normal",
+                   "weak_points": WEAK_POINTS[turn // 4 % len(WEAK_POINTS)]}
+        state = {"message": message, "history": history, "locale": "en", "learner_profile": profile}
+        messages = chat_graph.build_context(state)["messages"]
+
+        start = time.perf_counter()
+        stream = ai_core.query_llm_stream(messages)
+        first = next(stream)
+        ttfts.append((time.perf_counter() - start) * 1000)
+        reply = first + "".join(stream)
+
+        history += [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+    return ttfts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat time-to-first-token per turn, with and without session mode")
+    parser.add_argument("--turns", type=int, default=20, help="Chat turns per mode")
+    parser.add_argument("--budget", type=int, default=400, help="CHAT_HISTORY_TOKEN_BUDGET for the run")
+    parser.add_argument("--prefill-ms", type=float, default=0.5, help="Stub: ms per uncached prompt token")
+    parser.add_argument("--slots", type=int, default=4, help="Stub: prompts kept in the prefix cache")
+    parser.add_argument("--url", help="Real Ollama base URL (skips the stub)")
+    parser.add_argument("--model", help="Model name for --url")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        os.environ["API_BASE_URL"] = args.url
+        if args.model:
+            os.environ["MODEL_NAME"] = args.model
+    else:
+        StubModelHandler.prefill_ms = args.prefill_ms
+        StubModelHandler.slots = args.slots
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubModelHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["API_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["LLM_PROVIDER"] = "ollama"
+    os.environ["CHAT_HISTORY_TOKEN_BUDGET"] = str(args.budget)
+
+    # Imported late: ai_core and the chat graph read their configuration at import time
+    import ai_core
+    from graphs import chat_graph
+
+    results = {}
+    for label, session in [("off", False), ("on", True)]:
+        StubModelHandler.evaluated = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[label] = (run_chat(ai_core, chat_graph, args.turns, session), list(StubModelHandler.evaluated))
+
+    print(f"{args.turns} turns, history budget {args.budget} tokens, against {os.environ['API_BASE_URL']}\n")
+    header = f"{'turn':>4}{'TTFT off ms':>13}{'TTFT on ms':>12}"
+    print(header + (f"{'prefill off':>13}{'prefill on':>12}" if server else ""))
+    for turn in range(args.turns):
+        row = f"{turn + 1:>4}{results['off'][0][turn]:>13.1f}{results['on'][0][turn]:>12.1f}"
+        if server:
+            row += f"{results['off'][1][turn]:>13}{results['on'][1][turn]:>12}"
+        print(row)
+
+    print()
+    for label, (ttfts, evaluated) in results.items():
+        tail = ttfts[1:] or ttfts  # turn 1 is cold in both modes
+        line = (f"session {label:<4} mean TTFT {statistics.mean(tail):7.1f} ms   "
+                f"p50 {statistics.median(tail):7.1f} ms   max {max(tail):7.1f} ms")
+        if server:
+            line += f"   prompt tokens evaluated {sum(evaluated)}"
+        print(line)
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark: JSON reply parsing — regex cleanup only vs. regex cleanup + json_repair.
+
+Builds a corpus from the reply shapes our graphs ask for (eval, chat, comprehension
+questions) and the ways models actually break them (fences, chatter, trailing commas,
+single quotes, Python literals, raw newlines, truncation). For each strategy it reports
+how many replies parse without a re-query, how many parse to exactly the intended value,
+and the mean parse time. Every reply the regex strategy rejects costs a full LLM round trip
+in query_llm_json, so the "no re-query" column is the one that matters.
+
+Usage:
+  python tools/bench_json_parse.py
+  python tools/bench_json_parse.py --repeat 2000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+# Add backend to path so we can import ai_core
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from ai_core import _parse_json_regex, _parse_json_safe
+
+BASE_REPLIES = [
+    {"error_type": "conjugation", "reasoning": "動詞「食べます」的否定形應該是「食べません」，而不是「食べくない」。"},
+    {"error_type": "none", "reasoning": "答案正確。"},
+    {
+        "response": "いいですね！週末は何をしましたか？",
+        "feedback": {"has_errors": True, "corrections": [
+            {"original": "行きました公園", "corrected": "公園に行きました", "explanation": "助詞「に」表示目的地。"},
+        ]},
+    },
+    {"questions": [
+        {"question": "話者は何について話していますか？", "choices": ["天気", "料理", "旅行", "仕事"],
+         "correct_index": 2, "explanation": "影片開頭提到了京都旅行。"},
+        {"question": "話者はいつ行きましたか？", "choices": ["春", "夏", "秋", "冬"],
+         "correct_index": 0, "explanation": "提到櫻花季節。"},
+    ]},
+]
+
+
+def _truncate(text: str, fraction: float) -> str:
+    return text[:max(1, int(len(text) * fraction))]
+
+
+def _python_repr(value: dict) -> str:
+    return repr(value)  # single quotes, True/False/None
+
+
+def _trailing_commas(text: str) -> str:
+    return text.replace("}", ",}").replace("]", ",]")
+
+
+def _raw_newlines(value: dict) -> str:
+    return json.dumps(value, ensure_ascii=False).replace("。", "。\n")
+
+
+# name -> builder(value, json_text); "raw newlines" and truncations change the value itself,
+# so for those "exact" is not expected — only a usable object instead of a re-query
+CORRUPTIONS = {
+    "valid": lambda v, s: s,
+    "fenced": lambda v, s: f"```json\n{s}\n```",
+    "leading chatter": lambda v, s: f"Sure! Here is the JSON you asked for:\n{s}",
+    "trailing chatter": lambda v, s: f"{s}\n\nLet me know if you need anything else {{:)}}",
+    "trailing commas": lambda v, s: _trailing_commas(s),
+    "single quotes": lambda v, s: _python_repr(v),
+    "raw newlines": lambda v, s: _raw_newlines(v),
+    "missing brace": lambda v, s: s[:-1],
+    "truncated 90%": lambda v, s: _truncate(s, 0.9),
+    "truncated 60%": lambda v, s: _truncate(s, 0.6),
+}
+
+
+def build_corpus() -> list:
+    corpus = []
+    for value in BASE_REPLIES:
+        text = json.dumps(value, ensure_ascii=False)
+        for name, build in CORRUPTIONS.items():
+            corpus.append((name, build(value, text), value))
+    return corpus
+
+
+def evaluate(parse, corpus: list, repeat: int) -> dict:
+    per_kind: dict = {}
+    total_time = 0.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, text, expected in corpus:
+            ok = exact = False
+            start = time.perf_counter()
+            for _ in range(repeat):
+                try:
+                    data = parse(text)
+                    ok = isinstance(data, dict)
+                    exact = data == expected
+                except ValueError:
+                    ok = exact = False
+            total_time += time.perf_counter() - start
+            stats = per_kind.setdefault(name, {"n": 0, "ok": 0, "exact": 0})
+            stats["n"] += 1
+            stats["ok"] += ok
+            stats["exact"] += exact
+    return {"per_kind": per_kind, "mean_us": total_time / (len(corpus) * repeat) * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON parse strategies on a corpus of malformed LLM replies")
+    parser.add_argument("--repeat", type=int, default=500, help="Parses per corpus entry for timing")
+    args = parser.parse_args()
+
+    corpus = build_corpus()
+    results = {
+        "regex": evaluate(_parse_json_regex, corpus, args.repeat),
+        "regex+repair": evaluate(_parse_json_safe, corpus, args.repeat),
+    }
+
+    print(f"{len(corpus)} replies, {args.repeat} parses each\n")
+    print(f"{'corruption':<18}" + "".join(f"{name + ' ok/exact':>22}" for name in results))
+    for kind in CORRUPTIONS:
+        row = f"{kind:<18}"
+        for result in results.values():
+            s = result["per_kind"][kind]
+            row += f"{s['ok']:>12}/{s['n']}  {s['exact']:>3}/{s['n']}  "
+        print(row)
+
+    print()
+    for name, result in results.items():
+        ok = sum(s["ok"] for s in result["per_kind"].values())
+        print(f"{name:<14} no re-query {ok:>3}/{len(corpus)} ({ok / len(corpus):6.1%})   "
+              f"mean parse {result['mean_us']:8.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Micro-benchmark: per-call HTTP overhead of the Ollama client path.
+
+Starts a local stub that answers /api/chat instantly (so only connection and
+request overhead is measured) and compares a fresh `requests.post` per call
+against the shared keep-alive session from http_pool.
+
+Usage:
+  python tools/bench_llm_http.py
+  python tools/bench_llm_http.py --calls 2000 --threads 8
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Add backend to path so we can import http_pool
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from http_pool import get_session
+
+STUB_BODY = json.dumps({"message": {"role": "assistant", "content": "stub"}, "done": True}).encode()
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections open between requests
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this, Nagle + delayed ACK
+        # adds ~40ms to every reused connection and swamps what we are measuring
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_BODY)))
+        self.end_headers()
+        self.wfile.write(STUB_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(post, url: str, calls: int, threads: int) -> list:
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "こんにちは"}], "stream": False}
+
+    def one_call(_):
+        start = time.perf_counter()
+        resp = post(url, json=payload, timeout=10)
+        resp.raise_for_status()
+        resp.json()
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(one_call, range(calls)))
+
+
+def report(label: str, timings: list, wall: float):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<22} mean {statistics.mean(timings):6.3f} ms  p50 {statistics.median(timings):6.3f} ms  "
+          f"p95 {p95:6.3f} ms  throughput {len(timings) / wall:8.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-call overhead of requests.post vs the pooled session")
+    parser.add_argument("--calls", type=int, default=1000, help="Requests per strategy")
+    parser.add_argument("--threads", type=int, default=1, help="Concurrent callers")
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/chat"
+
+    # Warm up both paths once so imports and DNS don't skew the first sample
+    run(requests.post, url, 5, 1)
+    run(get_session("bench").post, url, 5, 1)
+
+    print(f"{args.calls} calls, {args.threads} thread(s) against local stub {url}\n")
+    for label, post in [("requests.post", requests.post), ("pooled session", get_session("bench").post)]:
+        start = time.perf_counter()
+        timings = run(post, url, args.calls, args.threads)
+        report(label, timings, time.perf_counter() - start)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
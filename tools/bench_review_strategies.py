@@ -0,0 +1,200 @@
+"""
+Benchmark: daily review strategies — 3-step agent vs. single pass (with / without polish).
+
+Runs generate_daily_review_agent() end to end against a temporary database of
+today's mistakes, with the LLM served through a local endpoint that records, per
+request, the prompt tokens sent, the prompt tokens actually evaluated (the rest
+hit the prefix cache) and the completion tokens.
+
+By default that endpoint is a stub model: latency = uncached prompt tokens ×
+--prefill-ms + completion tokens × --decode-ms, with a prefix cache over recent
+prompts like Ollama's slot cache. With --url it proxies to a real Ollama
+instead and reports Ollama's own prompt_eval_count / eval_count.
+
+Usage:
+  python tools/bench_review_strategies.py
+  python tools/bench_review_strategies.py --mistakes 20 --reviews 5 --decode-ms 5
+  python tools/bench_review_strategies.py --url http://localhost:11434 --model qwen2.5:7b --reviews 2
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ClassVar
+
+import requests
+
+# Add backend to path so we can import the review graph
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+ANALYSIS_TEXT = "1. 助詞「は」與「が」混用。\n2. 動詞て形變化不熟。\n3. 部分題目粗心。" * 2
+REVIEW_TEXT = (
+    "📅 今日錯題回顧\n\n**做得好的地方**\n- 今天練習了很多題，值得肯定！\n\n"
+    "**需要加強的觀念**\n- 「は」標示主題，「が」標示主語。\n- 動詞て形：食べる→食べて、行く→行って。\n\n"
+    "> 建議：明天針對助詞做 10 題練習。"
+) * 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough count: one token per CJK character, four ASCII characters per token."""
+    wide = sum(1 for ch in text if ord(ch) > 0x2E7F)
+    return wide + (len(text) - wide + 3) // 4
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    upstream = None
+    prefill_ms = 0.2
+    decode_ms = 2.0
+    records: ClassVar[list] = []
+    recent_prompts: ClassVar[list] = []
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        payload = json.loads(raw)
+        prompt = json.dumps(payload["messages"], ensure_ascii=False)
+
+        if self.upstream:
+            reply = requests.post(f"{self.upstream}{self.path}", data=raw,
+                                  headers={"Content-Type": "application/json"}, timeout=600).json()
+            record = {
+                "prompt": estimate_tokens(prompt),
+                "evaluated": reply.get("prompt_eval_count", 0),
+                "completion": reply.get("eval_count", 0),
+            }
+        else:
+            reply, record = self._simulate(payload, prompt)
+
+        with self.lock:
+            self.records.append(record)
+
+        body = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate(self, payload: dict, prompt: str) -> tuple[dict, dict]:
+        with self.lock:
+            cached_chars = max((len(os.path.commonprefix([prompt, p])) for p in self.recent_prompts), default=0)
+            self.recent_prompts = (self.recent_prompts + [prompt])[-8:]
+
+        last_user = payload["messages"][-1]["content"]
+        if isinstance(payload.get("format"), dict):
+            content = json.dumps({"weak_points": ANALYSIS_TEXT.split("\n"), "review_markdown": REVIEW_TEXT},
+                                 ensure_ascii=False)
+        elif "請簡短列出分析結果" in last_user:
+            content = ANALYSIS_TEXT
+        else:
+            content = REVIEW_TEXT
+
+        prompt_tokens = estimate_tokens(prompt)
+        evaluated = prompt_tokens - estimate_tokens(prompt[:cached_chars])
+        completion = estimate_tokens(content)
+        time.sleep((evaluated * self.prefill_ms + completion * self.decode_ms) / 1000)
+
+        reply = {"message": {"role": "assistant", "content": content}, "done": True,
+                 "prompt_eval_count": evaluated, "eval_count": completion}
+        return reply, {"prompt": prompt_tokens, "evaluated": evaluated, "completion": completion}
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_db(path: str, mistakes: int):
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE exercise (exercise_id TEXT, question_sentence TEXT, correct_answer TEXT);
+        CREATE TABLE answer_log (log_id TEXT, user_id TEXT, exercise_id TEXT, user_answer TEXT,
+                                 is_correct INTEGER, answered_timestamp TEXT, error_type TEXT);
+    ''')
+    samples = [("私[＿＿＿]学生です。", "は", "が", "particle"),
+               ("昨日、映画を[＿＿＿]。", "見ました", "見ます", "conjugation"),
+               ("駅[＿＿＿]行きます。", "に", "を", "particle"),
+               ("この本は[＿＿＿]です。", "面白い", "面白かった", "conjugation")]
+    now = datetime.now().isoformat()
+    for i in range(mistakes):
+        question, correct, wrong, error_type = samples[i % len(samples)]
+        conn.execute("INSERT INTO exercise VALUES (?, ?, ?)", (f"e{i}", question, correct))
+        conn.execute("INSERT INTO answer_log VALUES (?, 'bench', ?, ?, 0, ?, ?)",
+                     (f"l{i}", f"e{i}", wrong, now, error_type))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latency and tokens of the daily review strategies")
+    parser.add_argument("--mistakes", type=int, default=10, help="Mistakes in today's log")
+    parser.add_argument("--reviews", type=int, default=3, help="Reviews generated per strategy")
+    parser.add_argument("--prefill-ms", type=float, default=0.2, help="Stub: ms per uncached prompt token")
+    parser.add_argument("--decode-ms", type=float, default=2.0, help="Stub: ms per completion token")
+    parser.add_argument("--url", help="Real Ollama base URL to proxy to")
+    parser.add_argument("--model", help="Model name for --url")
+    args = parser.parse_args()
+
+    RecordingHandler.upstream = args.url.rstrip("/") if args.url else None
+    RecordingHandler.prefill_ms = args.prefill_ms
+    RecordingHandler.decode_ms = args.decode_ms
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RecordingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ["LLM_PROVIDER"] = "ollama"
+    os.environ["API_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    if args.model:
+        os.environ["MODEL_NAME"] = args.model
+    # Imported late: ai_core reads its provider configuration at import time
+    from graphs.review_graph import generate_daily_review_agent
+
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    make_db(db_path, args.mistakes)
+
+    source = f"proxy to {args.url}" if args.url else f"stub ({args.prefill_ms} ms/prefill token, " \
+                                                      f"{args.decode_ms} ms/decode token)"
+    print(f"{args.mistakes} mistakes, {args.reviews} reviews per strategy, {source}\n")
+    print(f"{'strategy':<16}{'calls':>7}{'prompt tok':>12}{'evaluated':>11}{'completion':>12}{'mean s':>9}")
+    try:
+        for label, strategy, polish in [("agent (3-step)", "agent", False),
+                                        ("single", "single", False),
+                                        ("single + polish", "single", True)]:
+            RecordingHandler.records = []
+            RecordingHandler.recent_prompts = []
+            timings = []
+            for _ in range(args.reviews):
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    generate_daily_review_agent("bench", db_path, strategy=strategy, polish=polish)
+                timings.append(time.perf_counter() - start)
+
+            records = RecordingHandler.records
+            per_review = len(records) / args.reviews
+            print(f"{label:<16}{per_review:>7.1f}"
+                  f"{sum(r['prompt'] for r in records) / args.reviews:>12.0f}"
+                  f"{sum(r['evaluated'] for r in records) / args.reviews:>11.0f}"
+                  f"{sum(r['completion'] for r in records) / args.reviews:>12.0f}"
+                  f"{statistics.mean(timings):>9.2f}")
+    finally:
+        server.shutdown()
+        os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark: prompt-only JSON vs. schema-constrained decoding in query_llm_json.
+
+Sends the same evaluation prompts through query_llm_json twice — once with
+LLM_STRUCTURED_OUTPUT=off (today's prompt + scrape + retry path) and once with the
+eval graph's EvalReply schema — and reports upstream requests, retries, failures,
+and latency per evaluation.
+
+By default it runs against a local stub of Ollama's /api/chat. Without a `format`
+schema the stub answers like an unconstrained model does some of the time (fences,
+chatter, trailing commas, truncation, plain prose); with a schema it answers valid
+JSON, as constrained decoding guarantees. Point --url at a real Ollama to measure
+an actual model instead.
+
+Usage:
+  python tools/bench_structured_output.py
+  python tools/bench_structured_output.py --calls 200 --gen-ms 50
+  python tools/bench_structured_output.py --url http://localhost:11434 --model qwen2.5:7b --calls 30
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add backend to path so we can import ai_core and the eval graph
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+CLEAN = '{"error_type": "particle", "reasoning": "表示目的地應使用助詞「に」。"}'
+
+# How an unconstrained model's replies come back (weights roughly follow what the
+# retry logs showed: most replies fine, a tail of wrappers, slips and prose)
+UNCONSTRAINED_REPLIES = [
+    (60, CLEAN),
+    (12, f"```json\n{CLEAN}\n```"),
+    (8, f"好的，以下是評估結果：\n{CLEAN}"),
+    (6, CLEAN.replace("}", ",}")),
+    (6, CLEAN[:40]),
+    (8, "這個答案的助詞用錯了，應該用「に」。"),
+]
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    gen_seconds = 0.02
+    requests_seen = 0
+    rng = random.Random(7)
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with self.lock:
+            StubModelHandler.requests_seen += 1
+            weights, replies = zip(*UNCONSTRAINED_REPLIES, strict=True)
+            content = CLEAN if isinstance(payload.get("format"), dict) else self.rng.choices(replies, weights)[0]
+        time.sleep(self.gen_seconds)
+
+        body = json.dumps({"message": {"role": "assistant", "content": content}, "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(gen_ms: float) -> ThreadingHTTPServer:
+    StubModelHandler.gen_seconds = gen_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubModelHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(ai_core, eval_graph, mode: str, calls: int) -> dict:
+    ai_core.LLM_STRUCTURED_OUTPUT = mode
+    ai_core._structured_support.clear()
+    before = ai_core.get_json_parse_stats()
+    upstream_before = StubModelHandler.requests_seen
+
+    timings, failures = [], 0
+    for i in range(calls):
+        # Distinct prompts so single-flight never merges them
+        state = {"question": f"学校[＿＿＿]行きます。({i})", "user_answer": "を", "correct_answer": "に"}
+        messages = eval_graph.build_eval_prompt(state)["messages"]
+        start = time.perf_counter()
+        result = ai_core.query_llm_json(messages, temperature=0.1, schema=eval_graph.EvalReply)
+        timings.append((time.perf_counter() - start) * 1000)
+        failures += result["error"] is not None
+
+    after = ai_core.get_json_parse_stats()
+    return {
+        "upstream": StubModelHandler.requests_seen - upstream_before,
+        "retries": after["retries"] - before["retries"],
+        "repaired": after["repaired"] - before["repaired"],
+        "failures": failures,
+        "mean_ms": statistics.mean(timings),
+        "p95_ms": sorted(timings)[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt-only JSON with schema-constrained decoding")
+    parser.add_argument("--calls", type=int, default=100, help="Evaluations per mode")
+    parser.add_argument("--gen-ms", type=float, default=20.0, help="Simulated generation time of the stub")
+    parser.add_argument("--url", help="Real Ollama base URL (skips the stub)")
+    parser.add_argument("--model", help="Model name for --url")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        os.environ["API_BASE_URL"] = args.url
+        if args.model:
+            os.environ["MODEL_NAME"] = args.model
+    else:
+        server = start_stub(args.gen_ms)
+        os.environ["API_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["LLM_PROVIDER"] = "ollama"
+    os.environ["ENABLE_SAFETY_CHECK"] = "false"
+
+    # Imported late: ai_core reads its provider configuration at import time
+    import ai_core
+    from graphs import eval_graph
+
+    print(f"{args.calls} evaluations per mode against {os.environ['API_BASE_URL']}\n")
+    print(f"{'mode':<14}{'upstream':>9}{'retries':>9}{'repaired':>10}{'failed':>8}{'mean ms':>10}{'p95 ms':>9}")
+    for label, mode in [("prompt-only", "off"), ("structured", "auto")]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            r = run(ai_core, eval_graph, mode, args.calls)
+        upstream = r["upstream"] if server else "-"
+        print(f"{label:<14}{upstream:>9}{r['retries']:>9}{r['repaired']:>10}{r['failures']:>8}"
+              f"{r['mean_ms']:>10.1f}{r['p95_ms']:>9.1f}")
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark: sentence segmentation of long caption transcripts.
+
+Times _split_at_punctuation (one pass, bisect timestamp lookup) against the previous
+implementation (find + a rescan of every segment offset per sentence, string
+concatenation) on synthetic YouTube-style captions of 1, 5 and 10 hours, and
+checks that both produce the same sentences.
+
+Usage:
+  python tools/bench_transcript_segmenter.py
+  python tools/bench_transcript_segmenter.py --hours 1 2 4 --runs 5
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from video_service import _split_at_punctuation
+
+PHRASES = ["今日は", "とても", "いい天気", "ですね", "駅まで", "歩いて", "行きます", "先生に", "聞いてみましょう",
+           "日本語の", "勉強は", "楽しい", "と思います", "それでは", "始めましょう"]
+
+
+def previous_split(transcript: list) -> list:
+    full_text = ""
+    char_timestamps = []
+    for seg in transcript:
+        start_offset = len(full_text)
+        full_text += seg["text"]
+        char_timestamps.append((start_offset, seg["start"]))
+        if not full_text.endswith(("。", "？", "！", "\n")):
+            full_text += " "
+
+    raw_sentences = re.split(r'(?<=[。？！?!])\s*', full_text)
+    sentences = []
+    search_offset = 0
+    for s in raw_sentences:
+        s = s.strip()
+        if not s or len(s) < 5:
+            continue
+        pos = full_text.find(s, search_offset)
+        if pos >= 0:
+            search_offset = pos + len(s)
+        timestamp = 0.0
+        for char_off, ts in char_timestamps:
+            if char_off <= max(pos, 0):
+                timestamp = ts
+            else:
+                break
+        sentences.append({"text": s, "start": timestamp})
+    return sentences
+
+
+def synthetic_captions(hours: float, seed: int = 0) -> list:
+    """A caption segment every ~3 seconds; about half of them end a sentence."""
+    rng = random.Random(seed)
+    segments = []
+    t = 0.0
+    while t < hours * 3600:
+        text = "".join(rng.choice(PHRASES) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.5:
+            text += rng.choice("。？！")
+        duration = round(rng.uniform(1.0, 4.0), 2)
+        segments.append({"text": text, "start": round(t, 2), "duration": duration})
+        t += duration
+    return segments
+
+
+def best_of(fn, transcript: list, runs: int) -> tuple[float, list]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(transcript)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time transcript sentence segmentation, previous vs single-pass")
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 5, 10], help="Transcript lengths")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per implementation (best is reported)")
+    args = parser.parse_args()
+
+    print(f"{'length':>7} {'segments':>9} {'sentences':>10} {'previous':>12} {'single-pass':>12} {'speedup':>8}  same")
+    for hours in args.hours:
+        transcript = synthetic_captions(hours)
+        before_ms, before = best_of(previous_split, transcript, args.runs)
+        after_ms, after = best_of(_split_at_punctuation, transcript, args.runs)
+        print(f"{hours:>6g}h {len(transcript):>9} {len(after):>10} {before_ms:>9.1f} ms {after_ms:>9.1f} ms "
+              f"{before_ms / after_ms:>7.0f}x  {before == after}")
+
+    sizes = [synthetic_captions(h) for h in args.hours]
+    per_segment = [best_of(_split_at_punctuation, t, args.runs)[0] / len(t) * 1000 for t in sizes]
+    print(f"\nsingle-pass cost per segment: {statistics.mean(per_segment):.2f} µs "
+          f"(range {min(per_segment):.2f}–{max(per_segment):.2f})")
+
+
+if __name__ == "__main__":
+    main()
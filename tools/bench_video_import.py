@@ -0,0 +1,213 @@
+"""
+Benchmark: end-to-end video import time, sequential pipeline vs the concurrent one.
+
+Replays recorded fixtures (tools/fixtures/video_import: an oEmbed response and a
+YouTube caption track) from a local stub with configurable latency per request, and
+stubs the translation API the same way. Each run imports the video into a fresh
+database with import_video() and the same random seed, so both pipelines pick the
+same exercises.
+
+  sequential  — metadata then transcript, one janome call and one translation request
+                per sentence (the pipeline before fetches, tokenization and hint
+                translations were restructured)
+  concurrent  — the current import_video()
+
+Usage:
+  python tools/bench_video_import.py
+  python tools/bench_video_import.py --runs 10 --repeat 20 --translate-ms 150
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import requests
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+import translation_service
+import video_service
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'video_import')
+VIDEO_URL = "https://www.youtube.com/watch?v=abc123"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves the fixtures; the server carries latency settings and a request counter."""
+
+    def _reply(self, payload, latency_ms: float):
+        time.sleep(latency_ms / 1000)
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/oembed":
+            self._reply(self.server.oembed, self.server.meta_ms)
+        elif self.path == "/transcript":
+            self._reply(self.server.transcript, self.server.transcript_ms)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        texts = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))["q"]
+        with self.server.lock:
+            self.server.translate_requests += 1
+        self._reply([{"translatedText": f"[zh] {text}"} for text in texts], self.server.translate_ms)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(args) -> ThreadingHTTPServer:
+    with open(os.path.join(FIXTURES_DIR, "oembed.json"), encoding="utf-8") as f:
+        oembed = json.load(f)
+    with open(os.path.join(FIXTURES_DIR, "transcript.json"), encoding="utf-8") as f:
+        segments = json.load(f)
+
+    # Longer videos: the recorded track back to back
+    length = segments[-1]["start"] + segments[-1]["duration"]
+    transcript = [
+        {**seg, "start": round(seg["start"] + i * length, 2)}
+        for i in range(args.repeat)
+        for seg in segments
+    ]
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.oembed, server.transcript = oembed, transcript
+    server.meta_ms, server.transcript_ms, server.translate_ms = args.meta_ms, args.transcript_ms, args.translate_ms
+    server.lock = threading.Lock()
+    server.translate_requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StubTranslateClient:
+    """translate_v2.Client.translate() against the stub: a str gives a dict, a list a list."""
+
+    def __init__(self, base_url: str):
+        self.url = f"{base_url}/translate"
+        self.session = requests.Session()
+
+    def translate(self, values, target_language=None, source_language=None):
+        texts = [values] if isinstance(values, str) else list(values)
+        resp = self.session.post(self.url, json={"q": texts, "target": target_language}, timeout=10)
+        resp.raise_for_status()
+        results = resp.json()
+        return results[0] if isinstance(values, str) else results
+
+
+# ---------------------------------------------------------------------------
+# The sequential pipeline, expressed through import_video's seams
+# ---------------------------------------------------------------------------
+
+def sequential_fetch_sources(video_ext_id, use_whisper, report):
+    report("metadata")
+    meta = video_service.fetch_youtube_metadata(video_ext_id)
+    report("transcript")
+    return meta, video_service._fetch_transcript(video_ext_id, use_whisper)
+
+
+def tokenize_one_by_one(texts):
+    for text in texts:
+        yield list(video_service._tokenizer.tokenize(text))
+
+
+def translate_one_by_one(texts, target='zh-TW'):
+    return [translation_service.translate_text(text, target=target) for text in texts]
+
+
+SEQUENTIAL_PATCHES = {
+    "_fetch_sources": sequential_fetch_sources,
+    "_tokenize_sentences": tokenize_one_by_one,
+    "translate_texts": translate_one_by_one,
+}
+
+
+def import_once(seed: int) -> tuple[float, list]:
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        random.seed(seed)
+        start = time.perf_counter()
+        video_service.import_video(VIDEO_URL, db_path)
+        elapsed = time.perf_counter() - start
+        with sqlite3.connect(db_path) as conn:
+            exercises = conn.execute('''
+                SELECT full_sentence, correct_answer, part_of_speech, hint_chinese
+                FROM video_exercises ORDER BY context_timestamp, full_sentence
+            ''').fetchall()
+        return elapsed, exercises
+    finally:
+        os.remove(db_path)
+
+
+def bench(label: str, server, runs: int, sequential: bool) -> list:
+    patches = [patch.object(video_service, name, fn) for name, fn in SEQUENTIAL_PATCHES.items()] if sequential else []
+    for p in patches:
+        p.start()
+    try:
+        server.translate_requests = 0
+        timings, exercises = [], None
+        for run in range(runs):
+            elapsed, exercises = import_once(seed=run)
+            timings.append(elapsed * 1000)
+    finally:
+        for p in patches:
+            p.stop()
+
+    print(f"{label:<11} mean {statistics.mean(timings):8.1f} ms  min {min(timings):8.1f} ms  "
+          f"max {max(timings):8.1f} ms  translate requests/import {server.translate_requests / runs:5.1f}")
+    return exercises
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end video import time on recorded fixtures")
+    parser.add_argument("--runs", type=int, default=5, help="Imports per pipeline")
+    parser.add_argument("--repeat", type=int, default=10, help="Copies of the recorded caption track (video length)")
+    parser.add_argument("--meta-ms", type=float, default=150, help="oEmbed latency")
+    parser.add_argument("--transcript-ms", type=float, default=400, help="Caption track latency")
+    parser.add_argument("--translate-ms", type=float, default=120, help="Latency per translation request")
+    args = parser.parse_args()
+
+    server = start_stub_server(args)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def fetch_metadata(video_id):
+        data = requests.get(f"{base_url}/oembed", timeout=10).json()
+        return {"title": data["title"], "channel_name": data["author_name"], "thumbnail_url": data["thumbnail_url"]}
+
+    def fetch_transcript(video_id):
+        return requests.get(f"{base_url}/transcript", timeout=10).json()
+
+    with (patch.object(video_service, "fetch_youtube_metadata", fetch_metadata),
+          patch.object(video_service, "fetch_youtube_transcript", fetch_transcript),
+          patch.object(translation_service, "translate_client", StubTranslateClient(base_url))):
+        # Warm up janome's dictionary and the connections
+        import_once(seed=0)
+
+        print(f"{len(server.transcript)} caption segments; latency: oEmbed {args.meta_ms:.0f} ms, "
+              f"captions {args.transcript_ms:.0f} ms, translation {args.translate_ms:.0f} ms/request\n")
+        before = bench("sequential", server, args.runs, sequential=True)
+        after = bench("concurrent", server, args.runs, sequential=False)
+
+    # Bulk tokenization can differ from per-sentence tokenization in POS sub-categories only
+    print(f"\nSame exercises (sentence, answer, POS, hint): {before == after}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
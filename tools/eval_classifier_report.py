@@ -0,0 +1,89 @@
+"""
+Report: how much of the evaluation traffic the local error classifier can decide,
+and how often it agrees with the LLM on those decisions.
+
+Replays every LLM-evaluated submission in answer_log (rows that have feedback and
+an error_type) through error_classifier.classify_submission and compares the
+result against the stored LLM label. Run it on logs collected with
+EVAL_LOCAL_CLASSIFIER=false (or before the classifier shipped), otherwise the
+locally decided rows would be compared against themselves.
+
+Usage:
+  python tools/eval_classifier_report.py
+  python tools/eval_classifier_report.py --db data/news_corpus.db --min-confidence 0.9 --show-disagreements 20
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from collections import Counter
+
+# Add backend to path so we can import error_classifier
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from error_classifier import classify_submission
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'news_corpus.db')
+
+
+def load_llm_labelled(db_path: str) -> list:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return conn.execute('''
+            SELECT al.user_answer, al.error_type, e.correct_answer
+            FROM answer_log al
+            JOIN exercise e ON al.exercise_id = e.exercise_id
+            WHERE al.feedback IS NOT NULL AND al.error_type IS NOT NULL AND al.error_type != 'unknown'
+        ''').fetchall()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Handled fraction and LLM agreement of the local error classifier")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite database with answer_log and exercise")
+    parser.add_argument("--min-confidence", type=float, default=0.8, help="Threshold used by EVAL_LOCAL_MIN_CONFIDENCE")
+    parser.add_argument("--show-disagreements", type=int, default=10, help="Print up to N disagreeing rows")
+    args = parser.parse_args()
+
+    rows = load_llm_labelled(args.db)
+    if not rows:
+        print("No LLM-evaluated submissions found.")
+        return
+
+    handled = agreed = 0
+    per_type = Counter()
+    per_type_agreed = Counter()
+    disagreements = []
+
+    for row in rows:
+        local = classify_submission(row["user_answer"], row["correct_answer"])
+        if local["confidence"] < args.min_confidence:
+            continue
+        handled += 1
+        local_type = local["error_type"].value
+        per_type[local_type] += 1
+        if local_type == row["error_type"]:
+            agreed += 1
+            per_type_agreed[local_type] += 1
+        else:
+            disagreements.append((row["user_answer"], row["correct_answer"], local_type, row["error_type"]))
+
+    print(f"LLM-evaluated submissions: {len(rows)}")
+    print(f"Handled locally (confidence >= {args.min_confidence}): {handled} ({handled / len(rows):.1%})")
+    if handled:
+        print(f"Agreement with LLM on handled rows: {agreed}/{handled} ({agreed / handled:.1%})\n")
+        print(f"{'local type':<14}{'handled':>8}{'agree':>8}")
+        for error_type, count in per_type.most_common():
+            print(f"{error_type:<14}{count:>8}{per_type_agreed[error_type] / count:>8.1%}")
+
+    if disagreements and args.show_disagreements:
+        print("\nDisagreements (user answer / correct answer / local / LLM):")
+        for user_answer, correct_answer, local_type, llm_type in disagreements[:args.show_disagreements]:
+            print(f"  {user_answer} / {correct_answer} / {local_type} / {llm_type}")
+
+
+if __name__ == "__main__":
+    main()
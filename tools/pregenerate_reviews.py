@@ -0,0 +1,48 @@
+"""
+Batch job: pre-generate today's daily reviews so /api/agent/daily_review serves them from storage.
+
+Generates a review for every user with mistakes today whose stored review is missing or
+out of date, at most --workers at a time. Meant to run from cron in the evening, e.g.
+
+  0 21 * * *  cd /path/to/repo && python tools/pregenerate_reviews.py --workers 4
+
+Usage:
+  python tools/pregenerate_reviews.py
+  python tools/pregenerate_reviews.py --workers 2
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+# Add backend to path so we can import review_service
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'apps', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(BACKEND_DIR, '.env'))
+
+from review_service import create_review_tables, pregenerate_daily_reviews
+
+DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'news_corpus.db')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate today's daily reviews for users with mistakes")
+    parser.add_argument("--workers", type=int, default=4, help="Reviews generated concurrently")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path to the SQLite database")
+    args = parser.parse_args()
+
+    with sqlite3.connect(args.db) as conn:
+        create_review_tables(conn)
+
+    start = time.perf_counter()
+    stats = pregenerate_daily_reviews(args.db, max_workers=args.workers)
+    print(f"\nDone in {time.perf_counter() - start:.1f}s. {stats['users']} users with mistakes today: "
+          f"{stats['generated']} generated, {stats['cached']} already current, {stats['failed']} failed.")
+
+
+if __name__ == "__main__":
+    main()